@@ -0,0 +1,254 @@
+#!/usr/bin/python3
+
+# gpu-burn benchmark matrix for the GPU flavors of the OpenStack environment of NetLab - Hochschule Fulda
+#
+# Every combination of flavor and gpu-burn parameter (e.g., "" for single precision, "-d" for double precision,
+# "-tc" for tensor cores) is run --repeats times. Every run starts its own instance (like
+# start-gpuburn-openstack-instance.py), waits until gpu-burn printed its result, collects the per-GPU records (see
+# gpuaas_gpuburn.py) and deletes the instance right away, so its GPUs are free for the next run. Up to
+# --max-instances runs are done concurrently. Finally a comparison table with the mean, standard deviation and
+# coefficient of variation of the sustained Gflop/s across the repeats is printed, e.g.:
+#
+#   benchmark-gpuburn-matrix.py --duration 300 --parameter "" --parameter=-d --parameter=-tc --repeats 3
+#   benchmark-gpuburn-matrix.py --flavor g1-1x2080.medium --flavor g1-2x2080.medium --json bench.json
+#
+# All instances are tagged with the benchmark ID (metadata gpuaas_benchmark) and deleted at the end even if runs
+# fail, unless --keep is used.
+
+import argparse
+import concurrent.futures
+import itertools
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+import gpuaas_auth
+import gpuaas_cache
+import gpuaas_fip
+import gpuaas_fleet
+import gpuaas_golden
+import gpuaas_gpuburn
+import gpuaas_placement
+import gpuaas_profiles
+import gpuaas_ready
+import gpuaas_timing
+import gpuaas_userdata
+
+
+
+###########################
+#
+# Config
+#
+###########################
+
+parser = argparse.ArgumentParser(description="run gpu-burn on a matrix of flavors and parameters and compare the results")
+parser.add_argument("--flavor", action="append", default=[],
+                    help="flavor to benchmark, can be given multiple times (default: all of %s)"
+                         % ", ".join(gpuaas_placement.FLAVOR_CANDIDATES))
+parser.add_argument("--parameter", action="append", default=[],
+                    help="gpu-burn parameter, e.g., --parameter=-d or --parameter=-tc (\"=\" is needed for values "
+                         "starting with a dash), can be given multiple times, \"\" runs gpu-burn without parameters "
+                         "(default: \"\")")
+parser.add_argument("--duration", type=int, default=300, help="gpu-burn duration in seconds (default: %(default)s)")
+parser.add_argument("--repeats", type=int, default=3, help="runs per flavor and parameter (default: %(default)s)")
+parser.add_argument("--max-instances", type=int, default=4,
+                    help="max. number of instances (runs) at the same time (default: %(default)s)")
+parser.add_argument("--prefix", default="bench", help="prefix of the instance names (default: %(default)s)")
+parser.add_argument("--json", default="gpuburn-benchmark.json",
+                    help="write all runs and the comparison to this JSON file, empty to disable (default: %(default)s)")
+parser.add_argument("--keep", action="store_true", help="do not delete the instances after their run")
+parser.add_argument("--no-golden", action="store_true",
+                    help="do not boot from golden images even if they were baked for the USERDATA")
+gpuaas_userdata.add_userdata_arguments(parser)
+args = parser.parse_args()
+
+FLAVORS = args.flavor or gpuaas_placement.FLAVOR_CANDIDATES
+PARAMETERS = args.parameter or [""]
+
+# the gpuburn profile of gpuaas-profiles.yaml (start-gpuburn-openstack-instance.py), so golden images baked by it are
+# used here as well, its keypair is created by starting an instance using the profile once
+PROFILE = gpuaas_profiles.load()["gpuburn"]
+
+IMAGE_NAME = PROFILE["image"]
+NETWORK_NAME = PROFILE["network"]
+KEYPAIR_NAME = PROFILE["keypair"]
+PRIVATE_KEYPAIR_FILE = PROFILE["private_keypair_file"]
+READY_SENTINEL_FILE = PROFILE["ready_sentinel_file"]
+
+# gpu-burn is started by cron 40s after the reboot and builds its container before running
+RESULT_POLL_INTERVAL = 30
+RESULT_TIMEOUT_MARGIN = 1800
+
+BENCHMARK_METADATA_KEY = "gpuaas_benchmark"
+
+###########################
+#
+# Code
+#
+###########################
+
+BENCHMARK_ID = time.strftime("%Y%m%d-%H%M%S")
+
+
+def instance_name(flavor_name, parameter, repeat):
+    # e.g. bench-2x2080-tc-1
+    gpus, model = gpuaas_placement.parse_flavor(flavor_name)
+    flavor_part = "%dx%s" % (gpus, model) if gpus else re.sub(r"[^a-z0-9]+", "", flavor_name.lower())
+    return "%s-%s-%s-%d" % (args.prefix, flavor_part, re.sub(r"[^a-z0-9]+", "", parameter.lower()) or "float", repeat)
+
+
+def boot_source(parameter):
+    # (image, userdata) for parameter, a golden image baked for the same USERDATA is preferred
+    userdata = gpuaas_profiles.apply(PROFILE, {"duration": str(args.duration), "parameter": parameter})["userdata"]
+    userdata = gpuaas_userdata.prepare(userdata, args)
+    if not args.no_golden:
+        golden_image = gpuaas_golden.find_golden_image(conn, gpuaas_golden.userdata_hash(userdata, IMAGE_NAME))
+        if golden_image:
+            print("Using golden image %s for parameter \"%s\"" % (golden_image.name, parameter))
+            return golden_image, gpuaas_golden.GOLDEN_USERDATA
+    return image, userdata
+
+
+def wait_for_results(name, host):
+    # poll the latest gpu-burn log until gpu-burn printed its result for all GPUs
+    deadline = time.monotonic() + args.duration + RESULT_TIMEOUT_MARGIN
+    while True:
+        try:
+            logs = gpuaas_gpuburn.fetch_logs(host, PRIVATE_KEYPAIR_FILE, latest=True)
+        except RuntimeError as e:
+            print("[%s] cannot fetch gpu-burn log: %s" % (name, e))
+            logs = []
+        if logs and gpuaas_gpuburn.finished(logs[-1][1]):
+            return logs[-1]
+        if time.monotonic() > deadline:
+            raise TimeoutError("gpu-burn did not finish on %s" % name)
+        time.sleep(RESULT_POLL_INTERVAL)
+
+
+def benchmark(flavor_name, parameter, repeat):
+    # start an instance, wait for the gpu-burn result and delete the instance, returns the run record
+    name = instance_name(flavor_name, parameter, repeat)
+    run = {"instance": name, "flavor": flavor_name, "parameter": parameter, "repeat": repeat, "log": None,
+           "gpus": [], "error": None}
+    boot_image, userdata = boot_sources[parameter]
+    gpus = gpuaas_ready.flavor_gpus(flavor_name) or 0
+
+    def ready_check(server, timeline):
+        gpuaas_ready.wait_for_guest(server, timeline, key=PRIVATE_KEYPAIR_FILE, sentinel=READY_SENTINEL_FILE, gpus=gpus)
+
+    server = None
+    try:
+        result, = gpuaas_fleet.start_instances(
+          conn, [name], PRIVATE_KEYPAIR_FILE, resolver=resolver,
+          timeline=gpuaas_timing.Timeline(launcher=os.path.basename(sys.argv[0]), image=boot_image.name, flavor=flavor_name),
+          ready_check=ready_check, fip_pool=fip_pool, meta={BENCHMARK_METADATA_KEY: BENCHMARK_ID},
+          image=boot_image, flavor=resolver.flavor(flavor_name), network=network, key_name=KEYPAIR_NAME,
+          userdata=gpuaas_userdata.compress(userdata) if args.optimize_userdata else userdata)
+        server = result.server
+        if result.error:
+            raise result.error if isinstance(result.error, Exception) else RuntimeError(result.error)
+        print("[%s] waiting for gpu-burn (%ds) ..." % (name, args.duration))
+        run["log"], records = wait_for_results(name, server.public_v4)
+        run["gpus"] = [dict(record, summary=gpuaas_gpuburn.summarize(record)) for record in records]
+        print("[%s] gpu-burn finished: %s" % (name, ", ".join(r["result"] for r in records)))
+    except Exception as e:
+        print("[%s] run failed: %s" % (name, e))
+        run["error"] = str(e)
+    finally:
+        if server is not None and not args.keep:
+            if gpuaas_fleet.delete_servers(conn, [server]).get(server.id) is None:
+                deleted.add(server.id)
+    return run
+
+
+def compare(runs):
+    # one row per flavor and parameter, statistics of the sustained Gflop/s (sum over all GPUs) across the repeats
+    rows = []
+    for (flavor_name, parameter), cell in itertools.groupby(
+            sorted(runs, key=lambda r: (r["flavor"], r["parameter"])), lambda r: (r["flavor"], r["parameter"])):
+        cell = list(cell)
+        ok = [r for r in cell if not r["error"] and r["gpus"]]
+        totals = [sum(g["summary"]["gflops_sustained"] or 0 for g in r["gpus"]) for r in ok]
+        mean = statistics.mean(totals) if totals else None
+        stdev = statistics.stdev(totals) if len(totals) > 1 else None
+        gpus = gpuaas_ready.flavor_gpus(flavor_name) or 1
+        temps = [g["summary"]["temp_max"] for r in ok for g in r["gpus"] if g["summary"]["temp_max"] is not None]
+        rows.append({
+            "flavor": flavor_name,
+            "parameter": parameter,
+            "runs": len(cell),
+            "runs_ok": len(ok),
+            "gflops_mean": round(mean, 1) if mean is not None else None,
+            "gflops_stdev": round(stdev, 1) if stdev is not None else None,
+            "gflops_cv_percent": round(100 * stdev / mean, 2) if stdev is not None and mean else None,
+            "gflops_per_gpu": round(mean / gpus, 1) if mean is not None else None,
+            "temp_max": max(temps) if temps else None,
+            "errors": sum(g["summary"]["errors"] for r in ok for g in r["gpus"]),
+            "faulty": sum(g["summary"]["result"] == "FAULTY" for r in ok for g in r["gpus"]),
+        })
+    return rows
+
+
+def fmt(value, pattern="%.0f"):
+    return "-" if value is None else pattern % value
+
+
+# Initialize and turn on debug logging
+# openstack.enable_logging(debug=True)
+
+# Initialize connection
+# a cached Keystone token is reused if possible, see gpuaas_auth.py
+conn = gpuaas_auth.connect(cloud='openstack')
+
+resolver = gpuaas_cache.Resolver(conn)
+image = resolver.image(IMAGE_NAME)
+network = resolver.network(NETWORK_NAME)
+if not resolver.keypair(KEYPAIR_NAME):
+    print("Keypair %s not found, create it by starting an instance using start-gpuburn-openstack-instance.py" % KEYPAIR_NAME)
+    sys.exit(1)
+for flavor_name in FLAVORS:
+    resolver.flavor(flavor_name)
+boot_sources = {parameter: boot_source(parameter) for parameter in PARAMETERS}
+fip_pool = gpuaas_fip.FloatingIPPool(conn)
+# IDs of the instances deleted by their run, not deleted again at the end
+deleted = set()
+
+cells = [(f, p, r) for r in range(1, args.repeats + 1) for f in FLAVORS for p in PARAMETERS]
+print("Benchmark %s: %d flavor(s) x %d parameter(s) x %d repeat(s) = %d runs, up to %d at the same time" % (
+  BENCHMARK_ID, len(FLAVORS), len(PARAMETERS), args.repeats, len(cells), args.max_instances))
+
+runs = []
+try:
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.max_instances)) as pool:
+        runs = list(pool.map(lambda cell: benchmark(*cell), cells))
+finally:
+    # instances of failed or interrupted runs
+    if not args.keep:
+        tagged = gpuaas_fleet.select_servers(conn, tags=["%s=%s" % (BENCHMARK_METADATA_KEY, BENCHMARK_ID)])
+        leftovers = [s for s in tagged if s.id not in deleted and s.status != "DELETED"
+                     and getattr(s, "task_state", None) != "deleting"]
+        if leftovers:
+            print("Deleting %d remaining benchmark instance(s)" % len(leftovers))
+            gpuaas_fleet.delete_servers(conn, leftovers)
+
+rows = compare(runs)
+
+if args.json:
+    with open(args.json, "w") as f:
+        json.dump({"benchmark": BENCHMARK_ID, "duration": args.duration, "runs": runs, "comparison": rows}, f,
+                  separators=(",", ":"))
+
+print("\n%-18s %-10s %5s %12s %10s %7s %12s %6s %6s %6s" % (
+  "FLAVOR", "PARAMETER", "RUNS", "GFLOPS MEAN", "STDEV", "CV %", "GFLOPS/GPU", "TEMP", "ERRORS", "FAULTY"))
+for row in rows:
+    print("%-18s %-10s %5s %12s %10s %7s %12s %6s %6d %6d" % (
+      row["flavor"], row["parameter"] or "(float)", "%d/%d" % (row["runs_ok"], row["runs"]),
+      fmt(row["gflops_mean"]), fmt(row["gflops_stdev"]), fmt(row["gflops_cv_percent"], "%.2f"),
+      fmt(row["gflops_per_gpu"]), fmt(row["temp_max"], "%d C"), row["errors"], row["faulty"]))
+
+if any(row["runs_ok"] < row["runs"] or row["faulty"] for row in rows):
+    sys.exit(1)
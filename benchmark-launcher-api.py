@@ -0,0 +1,197 @@
+#!/usr/bin/python3
+
+# offline benchmark of the launcher code paths against the in-process fake cloud of gpuaas_fake.py
+#
+# Every scenario runs the same calls as the start/terminate scripts (name resolution using gpuaas_cache.py, fleet
+# start and watch using gpuaas_fleet.py, floating IP pool of gpuaas_fip.py, no guest readiness checks) against a
+# fresh fake cloud and reports the wall time and the number of API calls by type, so improvements of the launchers
+# can be measured without the NetLab cloud, e.g.:
+#
+#   benchmark-launcher-api.py
+#   benchmark-launcher-api.py --fleet-size 16 --latency 0.1 --jitter 0.05 --scenario launch-fleet --breakdown
+#   benchmark-launcher-api.py --fail network.update_ip=0.2 --fail compute.create_server=0.1 --json bench.json
+#
+# Scenarios:
+#
+#   launch-1              start one instance, cold resolve cache
+#   launch-fleet          start --fleet-size instances, cold resolve cache
+#   launch-fleet-cached   start --fleet-size instances, image/flavor/network IDs from the resolve cache
+#   launch-fleet-nohost   start --fleet-size instances, only half of them fit on the first flavor (fallback flavor)
+#   terminate-1           delete one instance and wait until it is gone
+#   terminate-fleet       delete --fleet-size instances and wait until they are gone
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# the benchmark must not touch the real resolve cache, known_hosts and host IDs in ~/.cache/hfd-gpuaas
+os.environ["GPUAAS_CACHE_DIR"] = tempfile.mkdtemp(prefix="gpuaas-benchmark-")
+
+import gpuaas_cache
+import gpuaas_fake
+import gpuaas_fip
+import gpuaas_fleet
+
+SCENARIOS = ["launch-1", "launch-fleet", "launch-fleet-cached", "launch-fleet-nohost", "terminate-1", "terminate-fleet"]
+
+parser = argparse.ArgumentParser(description="benchmark wall time and API calls of the launchers against a fake cloud")
+parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                    help="scenario to run, can be given multiple times (default: all)")
+parser.add_argument("--fleet-size", type=int, default=8, help="instances of the fleet scenarios (default: %(default)s)")
+parser.add_argument("--repeats", type=int, default=3, help="runs per scenario (default: %(default)s)")
+parser.add_argument("--latency", type=float, default=gpuaas_fake.DEFAULT_LATENCY,
+                    help="seconds per API call (default: %(default)s)")
+parser.add_argument("--jitter", type=float, default=0.0, help="additional random seconds per API call (default: %(default)s)")
+parser.add_argument("--build-seconds", type=float, default=gpuaas_fake.DEFAULT_BUILD_SECONDS,
+                    help="seconds a server stays in BUILD (default: %(default)s)")
+parser.add_argument("--delete-seconds", type=float, default=gpuaas_fake.DEFAULT_DELETE_SECONDS,
+                    help="seconds until a deleted server is gone (default: %(default)s)")
+parser.add_argument("--fail", action="append", default=[], metavar="CALL=PROBABILITY",
+                    help="inject failures of an API call, e.g., compute.create_server=0.1 (can be given multiple times)")
+parser.add_argument("--seed", type=int, default=1, help="random seed of jitter and failures of the first run (default: %(default)s)")
+parser.add_argument("--max-workers", type=int, default=gpuaas_fleet.MAX_WORKERS,
+                    help="max. number of instances created concurrently (default: %(default)s)")
+parser.add_argument("--breakdown", action="store_true", help="also print the API calls by type of every scenario")
+parser.add_argument("--verbose", action="store_true", help="show the output of the launcher code")
+parser.add_argument("--json", help="write all runs to this JSON file")
+args = parser.parse_args()
+
+try:
+    FAILURES = {call: float(p) for call, _, p in (f.partition("=") for f in args.fail)}
+except ValueError:
+    parser.error("invalid --fail, use CALL=PROBABILITY")
+
+# same as start-nvidia-openstack-instance.py
+IMAGE_NAME = "Ubuntu 20.04 - Focal Fossa - 64-bit - Cloud Based Image"
+FLAVOR_NAMES = ["g1-1x2060.medium", "g1-1x2080.medium"]
+NETWORK_NAME = "bench-net"
+KEYPAIR_NAME = "gpuaas-keypair"
+PRIVATE_KEYPAIR_FILE = "nvidia-test-keypair.key"
+USERDATA = "#!/bin/bash\ntouch /tmp/cloud-init-was-executed"
+
+
+
+###########################
+#
+# Code
+#
+###########################
+
+def new_cloud(repeat, capacity=None):
+    # every repeat gets its own random sequence of jitter and failures
+    return gpuaas_fake.FakeConnection(gpuaas_fake.FakeCloud(
+      latency=args.latency, jitter=args.jitter, build_seconds=args.build_seconds, delete_seconds=args.delete_seconds,
+      failures=FAILURES, capacity=capacity, seed=args.seed + repeat))
+
+
+def launch(conn, names, resolve_cache):
+    # the calls of start-nvidia-openstack-instance.py --gpus (flavor fallback) --no-guest-wait
+    resolver = gpuaas_cache.Resolver(conn, path=resolve_cache)
+    image = resolver.image(IMAGE_NAME)
+    flavor, *fallback_flavors = [resolver.flavor(name) for name in FLAVOR_NAMES]
+    network = resolver.network(NETWORK_NAME)
+    keypair = resolver.keypair(KEYPAIR_NAME)
+    return gpuaas_fleet.start_instances(
+      conn, names, PRIVATE_KEYPAIR_FILE, max_workers=args.max_workers, resolver=resolver,
+      fallback_flavors=fallback_flavors, fip_pool=gpuaas_fip.FloatingIPPool(conn),
+      image=image, flavor=flavor, network=network, key_name=keypair.name, userdata=USERDATA)
+
+
+def terminate(conn, prefix):
+    # the calls of terminate-nvidia-openstack-instance.py --prefix <prefix> --wait
+    servers = gpuaas_fleet.select_servers(conn, prefix=prefix)
+    errors = gpuaas_fleet.delete_servers(conn, servers, args.max_workers)
+    deleted = [s.id for s in servers if errors.get(s.id) is None]
+    list(gpuaas_fleet.watch_servers(conn, deleted, until=()))
+    return ["%s (%s)" % (s.name, errors[s.id]) for s in servers if errors.get(s.id) is not None]
+
+
+def run_scenario(scenario, repeat):
+    # one run of scenario, returns its record
+    count = 1 if scenario.endswith("-1") else args.fleet_size
+    names = ["bench-%d" % i for i in range(1, count + 1)]
+    resolve_cache = os.path.join(os.environ["GPUAAS_CACHE_DIR"], "resolve-%s-%d.json" % (scenario, repeat))
+    # only half of the fleet fits on the first flavor
+    conn = new_cloud(repeat, {"2060": count // 2} if scenario == "launch-fleet-nohost" else None)
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else output):
+        if scenario == "launch-fleet-cached" or scenario.startswith("terminate"):
+            # preparation, not measured
+            launch(conn, names if scenario.startswith("terminate") else ["warmup"], resolve_cache)
+            conn.cloud.reset_calls()
+
+        start = time.monotonic()
+        if scenario.startswith("launch"):
+            failed = ["%s (%s)" % (r.name, r.error) for r in launch(conn, names, resolve_cache) if r.error]
+        else:
+            failed = terminate(conn, "bench-")
+        wall = time.monotonic() - start
+
+    # without injected failures every launch and delete must succeed, otherwise a failure path would be measured
+    if failed and not FAILURES:
+        sys.stdout.write(output.getvalue())
+        sys.exit("%s (run %d) failed unexpectedly: %s" % (scenario, repeat, ", ".join(failed)))
+
+    calls = dict(conn.cloud.calls)
+    return {"scenario": scenario, "repeat": repeat, "instances": count, "failed": len(failed),
+            "wall_seconds": round(wall, 3), "api_calls": sum(calls.values()), "calls": calls}
+
+
+def summarize(runs):
+    # one row per scenario
+    rows = []
+    for scenario in dict.fromkeys(r["scenario"] for r in runs):
+        cell = [r for r in runs if r["scenario"] == scenario]
+        walls = [r["wall_seconds"] for r in cell]
+        calls = [r["api_calls"] for r in cell]
+        by_call = {}
+        for r in cell:
+            for call, n in r["calls"].items():
+                by_call[call] = by_call.get(call, 0) + n / len(cell)
+        rows.append({
+            "scenario": scenario,
+            "instances": cell[0]["instances"],
+            "runs": len(cell),
+            "failed": sum(r["failed"] for r in cell),
+            "wall_mean": statistics.mean(walls),
+            "wall_min": min(walls),
+            "wall_max": max(walls),
+            "api_calls_mean": statistics.mean(calls),
+            "api_calls_per_instance": statistics.mean(calls) / cell[0]["instances"],
+            "calls": dict(sorted(by_call.items(), key=lambda kv: -kv[1])),
+        })
+    return rows
+
+
+scenarios = args.scenario or SCENARIOS
+print("Fake cloud: %.3fs latency (+%.3fs jitter) per API call, %.1fs build, %.1fs delete, failures: %s" % (
+  args.latency, args.jitter, args.build_seconds, args.delete_seconds,
+  ", ".join("%s=%s" % kv for kv in FAILURES.items()) or "none"))
+
+runs = []
+for scenario in scenarios:
+    for repeat in range(1, args.repeats + 1):
+        runs.append(run_scenario(scenario, repeat))
+
+rows = summarize(runs)
+print("\n%-20s %9s %6s %8s %8s %8s %10s %10s" % (
+  "SCENARIO", "INSTANCES", "FAILED", "WALL", "MIN", "MAX", "API CALLS", "PER INST."))
+for row in rows:
+    print("%-20s %9d %6d %7.2fs %7.2fs %7.2fs %10.1f %10.1f" % (
+      row["scenario"], row["instances"], row["failed"], row["wall_mean"], row["wall_min"], row["wall_max"],
+      row["api_calls_mean"], row["api_calls_per_instance"]))
+    if args.breakdown:
+        for call, n in row["calls"].items():
+            print("    %-30s %8.1f" % (call, n))
+
+if args.json:
+    with open(args.json, "w") as f:
+        json.dump({"settings": {k: v for k, v in vars(args).items() if k != "json"}, "runs": runs, "summary": rows},
+                  f, indent=1)
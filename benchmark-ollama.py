@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+
+# Ollama inference benchmark for instances started by start-nvidia-ollama-mutligpu-openstack-instance.py
+#
+# Drives the Ollama HTTP API with the given models, prompts and concurrency levels and reports time to first token
+# (TTFT), tokens/s and p50/p95/p99 latency per concurrency level, see gpuaas_ollama.py. The target can be an URL or
+# host (e.g., the floating IP of the instance or an ssh tunnel on localhost) or, using --instance, an instance name.
+# It can be tried locally against ollama-stub-server.py, e.g.:
+#
+#   ollama-stub-server.py &
+#   benchmark-ollama.py localhost:11434 --concurrency 1,4,8 --requests 40
+#   benchmark-ollama.py --instance ollama-1 --model llama3.2:1b --model qwen2.5:7b --prompt-file prompts.txt
+
+import argparse
+import json
+import sys
+
+import gpuaas_ollama
+
+parser = argparse.ArgumentParser(description="benchmark the Ollama HTTP API (TTFT, tokens/s, latency percentiles)")
+parser.add_argument("url", nargs="?", help="Ollama URL or host[:port] (default port %d)" % gpuaas_ollama.OLLAMA_PORT)
+parser.add_argument("--instance", help="benchmark the Ollama of this instance (using its floating IP) instead of url")
+parser.add_argument("--model", action="append", default=[],
+                    help="model to use, can be given multiple times, requests cycle through the models (default: llama3.2:1b)")
+parser.add_argument("--prompt", action="append", default=[], help="prompt to use, can be given multiple times")
+parser.add_argument("--prompt-file", help="file with one prompt per line")
+parser.add_argument("--concurrency", default="1",
+                    help="comma separated concurrency levels, every level is benchmarked separately (default: %(default)s)")
+parser.add_argument("--requests", type=int, default=20, help="requests per concurrency level (default: %(default)s)")
+parser.add_argument("--num-predict", type=int, help="max. number of tokens to generate per request")
+parser.add_argument("--warmup", type=int, default=1,
+                    help="requests per model sent before measuring, e.g., to load the model (default: %(default)s)")
+parser.add_argument("--json", help="write the report and all measurements to this JSON file")
+args = parser.parse_args()
+
+if not args.url and not args.instance:
+    parser.error("give the Ollama url or --instance")
+
+MODELS = args.model or ["llama3.2:1b"]
+PROMPTS = list(args.prompt)
+if args.prompt_file:
+    with open(args.prompt_file) as f:
+        PROMPTS += [line.strip() for line in f if line.strip()]
+PROMPTS = PROMPTS or ["Why is the sky blue? Answer in three sentences."]
+OPTIONS = {"num_predict": args.num_predict} if args.num_predict else None
+try:
+    CONCURRENCY = [int(c) for c in args.concurrency.split(",")]
+except ValueError:
+    parser.error("invalid --concurrency %s" % args.concurrency)
+
+url = args.url
+if args.instance:
+    # OpenStack is only needed to look up the instance
+    import gpuaas_auth
+    import gpuaas_fip
+
+    conn = gpuaas_auth.connect(cloud='openstack')
+    server = conn.compute.find_server(args.instance)
+    url = server and gpuaas_fip.floating_ip_of(conn.compute.get_server(server))
+    if not url:
+        print("Instance %s not found or it has no floating IP" % args.instance)
+        sys.exit(1)
+
+print("Benchmarking Ollama at %s:%d, models: %s, %d prompt(s)" % (gpuaas_ollama.parse_url(url) + (", ".join(MODELS), len(PROMPTS))))
+
+if args.warmup:
+    results, seconds = gpuaas_ollama.run_benchmark(url, MODELS, PROMPTS, len(MODELS), args.warmup * len(MODELS), OPTIONS)
+    for r in results:
+        if "error" in r:
+            print("Warmup request for %s failed: %s" % (r["model"], r["error"]))
+            sys.exit(1)
+
+def fmt(value, pattern="%.3f"):
+    return "-" if value is None else pattern % value
+
+reports = []
+print("\n%5s %8s %6s %8s %10s %8s %8s %8s %8s %8s %8s %8s" % (
+  "CONC", "REQUESTS", "ERRORS", "REQ/S", "TOKENS/S", "TTFT P50", "TTFT P95", "TTFT P99",
+  "LAT P50", "LAT P95", "LAT P99", "TOK/S P50"))
+for concurrency in CONCURRENCY:
+    results, seconds = gpuaas_ollama.run_benchmark(url, MODELS, PROMPTS, concurrency, args.requests, OPTIONS)
+    report = gpuaas_ollama.summarize(results, seconds)
+    report["concurrency"] = concurrency
+    reports.append((report, results))
+    print("%5d %8d %6d %8s %10s %8s %8s %8s %8s %8s %8s %8s" % (
+      concurrency, report["requests"], report["errors"], fmt(report["requests_per_second"], "%.2f"),
+      fmt(report["tokens_per_second_total"], "%.1f"),
+      fmt(report["ttft_p50"]), fmt(report["ttft_p95"]), fmt(report["ttft_p99"]),
+      fmt(report["latency_p50"]), fmt(report["latency_p95"]), fmt(report["latency_p99"]),
+      fmt(report["tokens_per_second_p50"], "%.1f")))
+    for error in sorted({r["error"] for r in results if "error" in r}):
+        print("      error: %s" % error)
+
+if args.json:
+    with open(args.json, "w") as f:
+        json.dump({"url": url, "models": MODELS, "prompts": PROMPTS, "options": OPTIONS,
+                   "levels": [dict(report, results=results) for report, results in reports]}, f, indent=1)
+
+if any(report["errors"] for report, results in reports):
+    sys.exit(1)
@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+
+# collect GPU telemetry of instances started with --telemetry in the OpenStack environment of NetLab - Hochschule Fulda
+#
+# Only the samples taken since the last run are pulled from every selected instance (concurrently, over multiplexed
+# ssh connections), appended to a JSON lines file and optionally written as Prometheus textfile (latest sample per
+# GPU), see gpuaas_telemetry.py. With --follow the collection is repeated, e.g., while gpu-burn or the Ollama
+# benchmark runs:
+#
+#   collect-gpu-telemetry.py --prefix burn-
+#   collect-gpu-telemetry.py --prefix burn- --follow 10 --prometheus-textfile /var/lib/node_exporter/gpuaas_gpu.prom
+
+import argparse
+import concurrent.futures
+import sys
+import time
+
+import gpuaas_auth
+import gpuaas_fip
+import gpuaas_fleet
+import gpuaas_telemetry
+
+parser = argparse.ArgumentParser(description="collect GPU telemetry samples of instances incrementally")
+parser.add_argument("instance_names", metavar="instance-name", nargs="*", help="instance name or glob pattern")
+parser.add_argument("--prefix", help="collect from all instances whose name starts with PREFIX")
+parser.add_argument("--tag", action="append", default=[],
+                    help="only collect from instances with this metadata (key=value or key, can be given multiple times)")
+parser.add_argument("--key", default="nvidia-test-keypair.key", help="ssh private key (default: %(default)s)")
+parser.add_argument("--jsonl", default=gpuaas_telemetry.TELEMETRY_FILE,
+                    help="append the samples to this JSON lines file, empty to disable (default: %(default)s)")
+parser.add_argument("--prometheus-textfile", help="write the latest sample of every GPU to this Prometheus textfile")
+parser.add_argument("--follow", type=int, metavar="SECONDS", help="collect again every SECONDS until interrupted")
+parser.add_argument("--reset", action="store_true", help="collect all samples still buffered in the instances")
+parser.add_argument("--max-workers", type=int, default=gpuaas_fleet.MAX_WORKERS,
+                    help="max. number of instances collected from concurrently (default: %(default)s)")
+args = parser.parse_args()
+
+if not (args.instance_names or args.prefix or args.tag):
+    parser.error("select instances by instance-name, --prefix or --tag")
+
+# Initialize and turn on debug logging
+#openstack.enable_logging(debug=True)
+
+# Initialize connection
+# a cached Keystone token is reused if possible, see gpuaas_auth.py
+conn = gpuaas_auth.connect(cloud='openstack')
+
+servers = [s for s in gpuaas_fleet.select_servers(conn, args.instance_names, args.prefix, tags=args.tag)
+           if s.status == "ACTIVE" and gpuaas_fip.floating_ip_of(s)]
+if not servers:
+    print("No matching ACTIVE instances with floating IP found")
+    sys.exit(1)
+
+cursors = gpuaas_telemetry.Cursors()
+if args.reset:
+    cursors.cursors = {}
+
+# latest samples of every instance for the Prometheus textfile
+latest = {}
+
+
+def collect(server):
+    return gpuaas_telemetry.fetch(gpuaas_fip.floating_ip_of(server), cursors.get(server.id), args.key)
+
+
+def fmt(value, pattern="%d"):
+    return "-" if value is None else pattern % value
+
+
+def collect_all():
+    # collect the new samples of all servers once, returns False if collecting failed for any of them
+    ok = True
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(args.max_workers, len(servers)))) as pool:
+        futures = {pool.submit(collect, server): server for server in servers}
+        for future in concurrent.futures.as_completed(futures):
+            server = futures[future]
+            try:
+                samples, seq = future.result()
+            except Exception as e:
+                print("[%s] failed: %s" % (server.name, e))
+                ok = False
+                continue
+            # samples are written before the cursor is saved, so none are lost if the collector is interrupted
+            if args.jsonl and samples:
+                gpuaas_telemetry.write_jsonl(args.jsonl, server.name, samples)
+            cursors.set(server.id, seq)
+            if samples:
+                latest[server.name] = gpuaas_telemetry.latest(samples)
+            for sample in gpuaas_telemetry.latest(samples):
+                print("[%s] GPU %d: %d new samples, %s%% util, %s MiB, %s MHz, %s W, %s C%s" % (
+                  server.name, sample["gpu"], sum(s["gpu"] == sample["gpu"] for s in samples),
+                  fmt(sample["utilization_gpu"]), fmt(sample["memory_used_mib"]), fmt(sample["clock_sm_mhz"]),
+                  fmt(sample["power_watts"], "%.0f"), fmt(sample["temperature_c"]),
+                  ", throttled: %s" % ", ".join(sample["throttled_by"]) if sample["throttled_by"] else ""))
+            if not samples:
+                print("[%s] no new samples" % server.name)
+    cursors.save()
+    if args.prometheus_textfile:
+        gpuaas_telemetry.write_prometheus(args.prometheus_textfile, latest)
+    return ok
+
+
+ok = collect_all()
+try:
+    while args.follow:
+        time.sleep(args.follow)
+        ok = collect_all() and ok
+except KeyboardInterrupt:
+    pass
+
+if not ok:
+    sys.exit(1)
@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+
+# collect gpu-burn results of instances started by start-gpuburn-openstack-instance.py in the OpenStack environment of
+# NetLab - Hochschule Fulda
+#
+# The gpu-burn logs (gpu-burn-results_<timestamp>.log) of all selected instances are streamed over ssh and parsed
+# line by line into per-GPU records (Gflop/s, errors and temperature over time, OK/FAULTY), see gpuaas_gpuburn.py.
+# The records are written to a JSON and optionally a CSV file and a per-GPU summary is printed, e.g.:
+#
+#   collect-gpuburn-results.py burn-1 burn-2
+#   collect-gpuburn-results.py --prefix burn- --latest --csv gpuburn-results.csv
+
+import argparse
+import concurrent.futures
+import sys
+
+import gpuaas_auth
+import gpuaas_fip
+import gpuaas_fleet
+import gpuaas_gpuburn
+
+parser = argparse.ArgumentParser(description="collect and summarize gpu-burn results of instances")
+parser.add_argument("instance_names", metavar="instance-name", nargs="*", help="instance name or glob pattern")
+parser.add_argument("--prefix", help="collect from all instances whose name starts with PREFIX")
+parser.add_argument("--tag", action="append", default=[],
+                    help="only collect from instances with this metadata (key=value or key, can be given multiple times)")
+parser.add_argument("--key", default="nvidia-test-keypair.key", help="ssh private key (default: %(default)s)")
+parser.add_argument("--latest", action="store_true", help="only collect the latest gpu-burn log of every instance")
+parser.add_argument("--json", default="gpuburn-results.json",
+                    help="write the per-GPU records to this JSON file, empty to disable (default: %(default)s)")
+parser.add_argument("--csv", help="also write all samples to this CSV file")
+parser.add_argument("--max-workers", type=int, default=gpuaas_fleet.MAX_WORKERS,
+                    help="max. number of instances collected from concurrently (default: %(default)s)")
+args = parser.parse_args()
+
+if not (args.instance_names or args.prefix or args.tag):
+    parser.error("select instances by instance-name, --prefix or --tag")
+
+# Initialize and turn on debug logging
+#openstack.enable_logging(debug=True)
+
+# Initialize connection
+# a cached Keystone token is reused if possible, see gpuaas_auth.py
+conn = gpuaas_auth.connect(cloud='openstack')
+
+servers = gpuaas_fleet.select_servers(conn, args.instance_names, args.prefix, tags=args.tag)
+if not servers:
+    print("No matching instances found")
+    sys.exit(1)
+
+def collect(server):
+    host = gpuaas_fip.floating_ip_of(server)
+    if not host:
+        raise RuntimeError("no floating IP")
+    return [{"instance": server.name, "log": name, "gpus": records}
+            for name, records in gpuaas_gpuburn.fetch_logs(host, args.key, args.latest)]
+
+results = []
+failed = False
+with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(args.max_workers, len(servers)))) as pool:
+    futures = {pool.submit(collect, server): server for server in servers}
+    for future in concurrent.futures.as_completed(futures):
+        server = futures[future]
+        try:
+            collected = future.result()
+        except Exception as e:
+            print("[%s] failed: %s" % (server.name, e))
+            failed = True
+            continue
+        if not collected:
+            print("[%s] no gpu-burn logs found" % server.name)
+        results += collected
+
+results.sort(key=lambda r: (r["instance"], r["log"]))
+
+if args.json:
+    gpuaas_gpuburn.write_json(args.json, results)
+if args.csv:
+    gpuaas_gpuburn.write_csv(args.csv, results)
+
+print("\n%-20s %-40s %3s %-32s %10s %10s %6s %6s %s" % (
+  "INSTANCE", "LOG", "GPU", "NAME", "GFLOPS MAX", "GFLOPS AVG", "TEMP", "ERRORS", "RESULT"))
+for result in results:
+    for record in result["gpus"]:
+        s = gpuaas_gpuburn.summarize(record)
+        print("%-20s %-40s %3d %-32s %10s %10s %6s %6d %s" % (
+          result["instance"], result["log"], s["gpu"], (s["name"] or "-")[:32],
+          "-" if s["gflops_max"] is None else "%.0f" % s["gflops_max"],
+          "-" if s["gflops_mean"] is None else "%.0f" % s["gflops_mean"],
+          "-" if s["temp_max"] is None else "%d C" % s["temp_max"],
+          s["errors"], s["result"] or "incomplete"))
+
+if failed or any(record["result"] == "FAULTY" for result in results for record in result["gpus"]):
+    sys.exit(1)
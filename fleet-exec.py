@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+
+# run a command on or copy files to/from many instances in the OpenStack environment of NetLab - Hochschule Fulda
+#
+# Instead of one manual ssh per IP (see ssh-login-example.sh), the command runs on all selected instances
+# concurrently and its output is printed line by line as it arrives, tagged with the instance name. All ssh and scp
+# calls to an instance share one multiplexed connection (see gpuaas_ssh.py), which is kept open for --persist seconds,
+# so following calls skip the handshake. Host keys of floating IPs that now belong to another instance are removed
+# before connecting, e.g.:
+#
+#   fleet-exec.py --prefix burn- -- nvidia-smi -L
+#   fleet-exec.py --tag gpuaas_pool=gpu-jobs --sudo -- "docker ps"
+#   fleet-exec.py --prefix burn- --copy prompts.txt data/ /home/ubuntu/
+#   fleet-exec.py --prefix burn- --fetch /var/log/cloud-init-output.log logs/
+
+import argparse
+import concurrent.futures
+import os
+import shlex
+import sys
+import threading
+import time
+
+import gpuaas_auth
+import gpuaas_fip
+import gpuaas_fleet
+import gpuaas_ssh
+
+parser = argparse.ArgumentParser(description="run a command on or copy files to/from many instances concurrently",
+                                 usage="%(prog)s [options] [instance-name ...] [-- command ...]")
+parser.add_argument("instance_names", metavar="instance-name", nargs="*", help="instance name or glob pattern")
+parser.add_argument("--prefix", help="select all instances whose name starts with PREFIX")
+parser.add_argument("--tag", action="append", default=[],
+                    help="only select instances with this metadata (key=value or key, can be given multiple times)")
+parser.add_argument("--copy", nargs="+", metavar="PATH",
+                    help="copy local files/directories to all instances, the last PATH is the remote destination")
+parser.add_argument("--fetch", nargs=2, metavar=("REMOTE", "LOCAL"),
+                    help="copy a remote file/directory of all instances to LOCAL/<instance-name>/")
+parser.add_argument("--sudo", action="store_true", help="run the command using sudo")
+parser.add_argument("--key", default="nvidia-test-keypair.key", help="ssh private key (default: %(default)s)")
+parser.add_argument("--timeout", type=int, help="kill the command on instances still running it after TIMEOUT seconds")
+parser.add_argument("--persist", type=int, default=gpuaas_ssh.CONTROL_PERSIST,
+                    help="keep the multiplexed ssh connections open for this many seconds (default: %(default)s)")
+parser.add_argument("--max-workers", type=int, default=32,
+                    help="max. number of instances connected to concurrently (default: %(default)s)")
+
+# everything after -- is the command, its arguments are joined by spaces and run by the login shell of the instances
+argv = sys.argv[1:]
+COMMAND = argv[argv.index("--") + 1:] if "--" in argv else []
+args = parser.parse_args(argv[:argv.index("--")] if "--" in argv else argv)
+
+if not (args.instance_names or args.prefix or args.tag):
+    parser.error("select instances by instance-name, --prefix or --tag")
+if sum(bool(a) for a in (COMMAND, args.copy, args.fetch)) != 1:
+    parser.error("give either a command after --, --copy or --fetch")
+if args.copy and len(args.copy) < 2:
+    parser.error("--copy needs at least one local path and the remote destination")
+
+gpuaas_ssh.CONTROL_PERSIST = args.persist
+
+# Initialize and turn on debug logging
+#openstack.enable_logging(debug=True)
+
+# Initialize connection
+# a cached Keystone token is reused if possible, see gpuaas_auth.py
+conn = gpuaas_auth.connect(cloud='openstack')
+
+servers = [s for s in gpuaas_fleet.select_servers(conn, args.instance_names, args.prefix, tags=args.tag)
+           if s.status == "ACTIVE"]
+if not servers:
+    print("No matching ACTIVE instances found")
+    sys.exit(1)
+
+width = max(len(s.name) for s in servers)
+print_lock = threading.Lock()
+
+
+def output(server, line):
+    # print a line tagged with the instance name, lines of concurrent instances are not mixed
+    with print_lock:
+        print("[%-*s] %s" % (width, server.name, line), flush=True)
+
+
+def run(server):
+    # run the command or copy on server, returns the exit code
+    host = gpuaas_fip.floating_ip_of(server)
+    if not host:
+        output(server, "no floating IP")
+        return 255
+    gpuaas_ssh.check_host_key(host, server.id)
+
+    if args.copy:
+        code, out = gpuaas_ssh.scp(host, args.copy[:-1], args.copy[-1], key=args.key, timeout=args.timeout)
+    elif args.fetch:
+        destination = os.path.join(args.fetch[1], server.name)
+        os.makedirs(destination, exist_ok=True)
+        code, out = gpuaas_ssh.scp(host, [args.fetch[0]], destination, key=args.key, download=True,
+                                   timeout=args.timeout)
+    else:
+        command = " ".join(COMMAND)
+        if args.sudo:
+            command = "sudo sh -c %s" % shlex.quote(command)
+        return gpuaas_ssh.ssh_stream(host, command, lambda line: output(server, line), key=args.key,
+                                     timeout=args.timeout)
+    for line in out.splitlines():
+        output(server, line)
+    return code
+
+
+start = time.monotonic()
+codes = {}
+with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(args.max_workers, len(servers)))) as pool:
+    futures = {pool.submit(run, server): server for server in servers}
+    for future in concurrent.futures.as_completed(futures):
+        server = futures[future]
+        try:
+            codes[server.name] = future.result()
+        except Exception as e:
+            output(server, "failed: %s" % e)
+            codes[server.name] = 255
+
+failed = sorted(name for name, code in codes.items() if code != 0)
+print("\n%d of %d instances succeeded in %.1fs" % (len(codes) - len(failed), len(codes), time.monotonic() - start))
+if failed:
+    print("failed: %s" % ", ".join("%s (exit code %d)" % (name, codes[name]) for name in failed))
+    sys.exit(1)
@@ -0,0 +1,345 @@
+#!/usr/bin/python3
+
+# GPU job queue and scheduler for the OpenStack environment of NetLab - Hochschule Fulda
+#
+# Instead of starting an instance with its own USERDATA per workload, jobs (container image, command, number of GPUs)
+# are queued and run as Docker containers on worker instances that are provisioned once (NVIDIA driver, Docker,
+# NVIDIA container toolkit) and reused for many jobs. The scheduler packs the queued jobs onto the free GPUs of the
+# running workers and only starts (or unshelves) workers for jobs that do not fit, see gpuaas_jobs.py, e.g.:
+#
+#   gpu-jobs.py submit --gpus 2 --max-runtime 7200 pytorch/pytorch:latest "python3 /workspace/train.py"
+#   gpu-jobs.py submit nvidia/cuda:12.2.0-base-ubuntu22.04 nvidia-smi
+#   gpu-jobs.py schedule --max-instances 4
+#   gpu-jobs.py list
+#   gpu-jobs.py logs 2
+#
+# The queue is stored in ~/.cache/hfd-gpuaas/jobs.sqlite, so jobs can be submitted while the scheduler runs (e.g.,
+# using "schedule --forever").
+
+import argparse
+import concurrent.futures
+import os
+import sys
+import time
+
+import gpuaas_jobs
+import gpuaas_placement
+import gpuaas_profiles
+
+
+
+###########################
+#
+# Config
+#
+###########################
+
+parser = argparse.ArgumentParser(description="queue GPU jobs and run them on reused worker instances")
+subparsers = parser.add_subparsers(dest="action", required=True)
+
+submit_parser = subparsers.add_parser("submit", help="queue a job")
+submit_parser.add_argument("image", help="container image of the job")
+submit_parser.add_argument("command", nargs="?", help="command run using sh -c in the container (default: the image's)")
+submit_parser.add_argument("--gpus", type=int, default=1, help="number of GPUs of the job (default: %(default)s)")
+submit_parser.add_argument("--max-runtime", type=int, default=gpuaas_jobs.DEFAULT_MAX_RUNTIME,
+                           help="seconds after which the job is stopped, less than one week (default: %(default)s)")
+submit_parser.add_argument("--name", help="name of the job")
+
+list_parser = subparsers.add_parser("list", help="list jobs and workers")
+list_parser.add_argument("--status", action="append", choices=gpuaas_jobs.JOB_STATUSES,
+                         help="only list jobs with this status, can be given multiple times")
+
+cancel_parser = subparsers.add_parser("cancel", help="cancel queued or running jobs")
+cancel_parser.add_argument("job_ids", metavar="job-id", type=int, nargs="+")
+
+logs_parser = subparsers.add_parser("logs", help="print the output of a finished job")
+logs_parser.add_argument("job_id", metavar="job-id", type=int)
+
+schedule_parser = subparsers.add_parser("schedule", help="run the queued jobs, starting workers if needed")
+schedule_parser.add_argument("--pool", default="gpu-jobs",
+                             help="warm pool (and name prefix) of the workers (default: %(default)s)")
+schedule_parser.add_argument("--max-instances", type=int, default=4,
+                             help="max. number of workers (default: %(default)s)")
+schedule_parser.add_argument("--instance-gpus", type=int, default=1,
+                             help="min. number of GPUs of new workers, more jobs are packed on larger workers "
+                                  "(default: %(default)s)")
+schedule_parser.add_argument("--gpu-model", default=",".join(gpuaas_placement.GPU_MODELS),
+                             help="acceptable GPU models of new workers in order of preference (default: %(default)s)")
+schedule_parser.add_argument("--idle-timeout", type=int, default=1800,
+                             help="shelve workers idle for this many seconds (default: %(default)s)")
+schedule_parser.add_argument("--interval", type=int, default=30,
+                             help="seconds between scheduler runs (default: %(default)s)")
+schedule_parser.add_argument("--forever", action="store_true",
+                             help="keep running when the queue is empty instead of shelving the workers and exiting")
+schedule_parser.add_argument("--no-golden", action="store_true",
+                             help="do not boot from golden images even if they were baked for the worker USERDATA")
+args = parser.parse_args()
+
+# image, network and keypair of the gpuburn profile of gpuaas-profiles.yaml (start-gpuburn-openstack-instance.py),
+# its keypair is created by starting an instance using the profile once
+PROFILE = gpuaas_profiles.load()["gpuburn"]
+
+IMAGE_NAME = PROFILE["image"]
+NETWORK_NAME = PROFILE["network"]
+KEYPAIR_NAME = PROFILE["keypair"]
+PRIVATE_KEYPAIR_FILE = PROFILE["private_keypair_file"]
+READY_SENTINEL_FILE = PROFILE["ready_sentinel_file"]
+
+# jobs needing more GPUs than the largest flavor offers could never be placed
+MAX_JOB_GPUS = max(gpuaas_placement.parse_flavor(f)[0] or 0 for f in gpuaas_placement.FLAVOR_CANDIDATES)
+
+# workers only provide the NVIDIA driver, Docker and the NVIDIA container toolkit, the jobs bring their own images
+WORKER_MODULES = ["base", "driver-535", "docker", "container-toolkit"]
+
+
+
+###########################
+#
+# Code
+#
+###########################
+
+def fmt_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp)) if timestamp else "-"
+
+
+def list_jobs():
+    print("%5s %-20s %-10s %4s %-40s %-20s %-16s %-16s %s" % (
+      "ID", "NAME", "STATUS", "GPUS", "IMAGE", "WORKER", "STARTED", "FINISHED", "ERROR"))
+    for job in gpuaas_jobs.jobs(db, args.status):
+        worker = "%s:%s" % (job["worker"], job["devices"]) if job["worker"] else "-"
+        print("%5d %-20s %-10s %4d %-40s %-20s %-16s %-16s %s" % (
+          job["id"], job["name"] or "-", job["status"], job["gpus"], job["image"], worker,
+          fmt_time(job["started"]), fmt_time(job["finished"]), job["error"] or ""))
+
+    running = gpuaas_jobs.jobs(db, ["running"])
+    workers = gpuaas_jobs.workers(db)
+    if workers:
+        print("\n%-20s %-16s %9s %-16s %-16s" % ("WORKER", "ADDRESS", "FREE GPUS", "LAST BUSY", "SHELVED BY CLOUD"))
+    for worker in workers:
+        print("%-20s %-16s %9s %-16s %-16s" % (
+          worker["name"], worker["address"],
+          "%d/%d" % (len(gpuaas_jobs.free_devices(worker, running)), worker["gpus"]),
+          fmt_time(worker["last_busy"]), fmt_time(gpuaas_jobs.expires(worker))))
+
+
+def boot_source():
+    # (image, userdata) of new workers, a golden image baked for the same USERDATA is preferred
+    if not args.no_golden:
+        golden_image = gpuaas_golden.find_golden_image(conn, USERDATA_HASH)
+        if golden_image:
+            print("Using golden image %s for new workers" % golden_image.name)
+            return golden_image, gpuaas_golden.GOLDEN_USERDATA
+    return resolver.image(IMAGE_NAME), USERDATA
+
+
+def new_worker_name(servers):
+    # first free <pool>-<n>, also considering the workers currently booting
+    n = 1
+    while "%s-%d" % (args.pool, n) in servers or "%s-%d" % (args.pool, n) in booting:
+        n += 1
+    return "%s-%d" % (args.pool, n)
+
+
+def boot_worker(name, flavor_names, warm_servers):
+    # start (or unshelve) a worker using the first of flavor_names and wait until it is provisioned, returns its
+    # LaunchResult
+    def ready_check(server, timeline):
+        gpuaas_ready.wait_for_guest(server, timeline, key=PRIVATE_KEYPAIR_FILE, sentinel=READY_SENTINEL_FILE,
+                                    gpus=gpuaas_ready.flavor_gpus(timeline.labels["flavor"]) or 0)
+
+    flavor, *fallback_flavors = [resolver.flavor(f) for f in flavor_names]
+    result, = gpuaas_fleet.start_instances(
+      conn, [name], PRIVATE_KEYPAIR_FILE, resolver=resolver,
+      timeline=gpuaas_timing.Timeline(launcher=os.path.basename(sys.argv[0]), image=boot_image.name, flavor=flavor.name),
+      ready_check=ready_check, fallback_flavors=fallback_flavors, warm_servers=warm_servers, fip_pool=fip_pool,
+      meta=gpuaas_pool.pool_metadata(args.pool, USERDATA_HASH),
+      image=boot_image, flavor=flavor, network=network, key_name=KEYPAIR_NAME, userdata=boot_userdata)
+    gpuaas_timing.export([result.timeline])
+    return result
+
+
+def boot_workers(unplaced, servers):
+    # start workers for the jobs that did not fit, considering the workers already booting
+    sizes = gpuaas_jobs.plan_instances(unplaced, args.instance_gpus)
+    for gpus in booting.values():
+        if gpus in sizes:
+            sizes.remove(gpus)
+    free_slots = args.max_instances - len(gpuaas_jobs.workers(db)) - len(booting)
+    for gpus in sizes[:max(0, free_slots)]:
+        flavor_names = gpuaas_placement.rank_flavors(conn, gpus, args.gpu_model.split(","))
+        if not flavor_names:
+            print("No flavor with %d GPUs available, jobs stay queued" % gpus)
+            continue
+        # pool members unshelved for an earlier size (of this or a previous pass) are still shelved until they are
+        # ACTIVE, don't pick them twice
+        warm_servers = [s for s in gpuaas_pool.find_shelved(conn, args.pool, USERDATA_HASH, flavor_names,
+                                                            len(booting) + 1)
+                        if s.name not in booting][:1]
+        name = warm_servers[0].name if warm_servers else new_worker_name(servers)
+        print("[%s] %s worker with %s for %d queued job(s)" % (
+          name, "unshelving" if warm_servers else "starting", flavor_names[0], len(unplaced)))
+        booting[name] = gpus
+        futures[executor.submit(boot_worker, name, flavor_names, warm_servers)] = name
+
+
+def register_booted():
+    # register the workers that finished booting
+    for future in [f for f in futures if f.done()]:
+        name = futures.pop(future)
+        booting.pop(name, None)
+        try:
+            result = future.result()
+        except Exception as e:
+            result = gpuaas_fleet.LaunchResult(name, None, e, 0)
+        if result.error:
+            print("[%s] worker failed to start: %s" % (name, result.error))
+            if result.server is not None:
+                gpuaas_fleet.delete_servers(conn, [result.server])
+            continue
+        gpus = gpuaas_ready.flavor_gpus(result.timeline.labels.get("flavor")) or 1
+        gpuaas_jobs.add_worker(db, name, result.server.id, result.server.public_v4, gpus)
+        print("[%s] worker ready with %d GPU(s)" % (name, gpus))
+
+
+def sync_workers():
+    # forget workers that were shelved or deleted and adopt provisioned pool members (e.g., started by a previous
+    # scheduler run that was interrupted), returns the servers of the pool by name
+    servers = {s.name: s for s in gpuaas_pool.pool_members(conn, args.pool)}
+    for worker in gpuaas_jobs.workers(db):
+        server = servers.get(worker["name"])
+        if server is None or server.id != worker["server_id"]:
+            gpuaas_jobs.remove_worker(db, worker["name"], "was deleted")
+        elif server.status != "ACTIVE":
+            gpuaas_jobs.remove_worker(db, worker["name"], "is %s" % server.status)
+
+    known = {w["name"] for w in gpuaas_jobs.workers(db)}
+    for server in servers.values():
+        if server.status != "ACTIVE" or server.name in known or server.name in booting:
+            continue
+        if server.metadata.get(gpuaas_pool.USERDATA_HASH_METADATA_KEY) != USERDATA_HASH:
+            continue
+        address = gpuaas_fip.floating_ip_of(server)
+        checks, gpus = gpuaas_ready.probe(address, PRIVATE_KEYPAIR_FILE, READY_SENTINEL_FILE) if address else (set(), 0)
+        if "sentinel" in checks and "cloud_init" in checks and gpus:
+            gpuaas_jobs.add_worker(db, server.name, server.id, address, gpus, gpuaas_jobs.launched_at(server))
+            print("[%s] adopted running worker with %d GPU(s)" % (server.name, gpus))
+    return servers
+
+
+def schedule_once():
+    # one scheduler run, returns True while there are queued or running jobs or workers are booting
+    register_booted()
+    servers = sync_workers()
+    workers = gpuaas_jobs.workers(db)
+
+    # all workers are checked concurrently using a single ssh command each
+    def containers(worker):
+        try:
+            return gpuaas_jobs.list_containers(worker, PRIVATE_KEYPAIR_FILE)
+        except RuntimeError as e:
+            print("[%s] %s" % (worker["name"], e))
+            return None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(workers))) as pool:
+        for worker, worker_containers in zip(workers, pool.map(containers, workers)):
+            if worker_containers is not None:
+                gpuaas_jobs.update_worker(db, worker, worker_containers, PRIVATE_KEYPAIR_FILE)
+
+    placements, unplaced = gpuaas_jobs.plan(gpuaas_jobs.jobs(db, ["queued"]), workers, gpuaas_jobs.jobs(db, ["running"]))
+    for job, worker, devices in placements:
+        try:
+            if gpuaas_jobs.start_job(db, job, worker, devices, PRIVATE_KEYPAIR_FILE):
+                print("[job %d] started on %s (GPU %s)" % (job["id"], worker["name"], ",".join(map(str, devices))))
+            else:
+                print("[job %d] failed to start: %s" % (job["id"], gpuaas_jobs.get_job(db, job["id"])["error"]))
+        except RuntimeError as e:
+            print("[job %d] %s" % (job["id"], e))
+
+    # workers idle for too long or close to being shelved by the cloud are shelved now, so no job is killed and
+    # unshelving them starts a new week
+    active = bool(unplaced or futures or gpuaas_jobs.jobs(db, ["queued", "running"]))
+    idle_timeout = args.idle_timeout if active or args.forever else 0
+    for worker in gpuaas_jobs.idle_workers(db, idle_timeout):
+        print("[%s] shelving idle worker into warm pool %s" % (worker["name"], args.pool))
+        try:
+            gpuaas_pool.release(conn, servers[worker["name"]])
+        except Exception as e:
+            print("[%s] cannot shelve worker: %s" % (worker["name"], e))
+            continue
+        gpuaas_jobs.remove_worker(db, worker["name"], "was shelved")
+
+    if unplaced:
+        boot_workers(unplaced, servers)
+    return active
+
+
+db = gpuaas_jobs.connect()
+
+if args.action == "submit":
+    try:
+        job_id = gpuaas_jobs.submit(db, args.image, args.command, args.gpus, args.max_runtime, args.name,
+                                    MAX_JOB_GPUS)
+    except ValueError as e:
+        parser.error(str(e))
+    print("Queued job %d" % job_id)
+
+elif args.action == "list":
+    list_jobs()
+
+elif args.action == "cancel":
+    failed = False
+    for job_id in args.job_ids:
+        if gpuaas_jobs.cancel(db, job_id):
+            print("[job %d] cancelled" % job_id)
+        else:
+            print("[job %d] not found or already finished" % job_id)
+            failed = True
+    if failed:
+        sys.exit(1)
+
+elif args.action == "logs":
+    job = gpuaas_jobs.get_job(db, args.job_id)
+    if job is None or not os.path.exists(gpuaas_jobs.log_path(args.job_id)):
+        print("No output of job %d (yet)" % args.job_id)
+        sys.exit(1)
+    with open(gpuaas_jobs.log_path(args.job_id)) as f:
+        sys.stdout.write(f.read())
+
+elif args.action == "schedule":
+    # OpenStack is only needed to schedule
+    import gpuaas_auth
+    import gpuaas_cache
+    import gpuaas_fip
+    import gpuaas_fleet
+    import gpuaas_golden
+    import gpuaas_pool
+    import gpuaas_ready
+    import gpuaas_timing
+    import gpuaas_userdata
+
+    USERDATA = gpuaas_userdata.compose(WORKER_MODULES, sentinel=READY_SENTINEL_FILE)
+    USERDATA_HASH = gpuaas_golden.userdata_hash(USERDATA, IMAGE_NAME)
+
+    # Initialize connection
+    # a cached Keystone token is reused if possible, see gpuaas_auth.py
+    conn = gpuaas_auth.connect(cloud='openstack')
+
+    resolver = gpuaas_cache.Resolver(conn)
+    network = resolver.network(NETWORK_NAME)
+    if not resolver.keypair(KEYPAIR_NAME):
+        print("Keypair %s not found, create it by starting an instance using start-gpuburn-openstack-instance.py" % KEYPAIR_NAME)
+        sys.exit(1)
+    boot_image, boot_userdata = boot_source()
+    fip_pool = gpuaas_fip.FloatingIPPool(conn)
+
+    # workers are booted in the background while the scheduler keeps running jobs on the others
+    booting = {}
+    futures = {}
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.max_instances))
+    try:
+        while schedule_once() or args.forever:
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("Interrupted, running jobs keep running and are picked up by the next scheduler run")
+    finally:
+        executor.shutdown(wait=False)
@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+
+# GPU telemetry sampler running inside instances, see gpuaas_telemetry.py and collect-gpu-telemetry.py
+#
+# "sample" keeps a single nvidia-smi process running in loop mode (no process per sample) and writes every line it
+# prints, prefixed by a sequence number and the unix time, into a bounded ring buffer of segment files
+# (segment-<first sequence number>.csv, the oldest segment is removed when a new one is started). Sequence numbers
+# continue after restarts, so "read --since <seq>" returns exactly the samples a collector has not seen yet. The
+# first line printed by "read" is "# <first seq> <last seq>" of the buffer.
+#
+# Only uses the standard library (python3 of the Ubuntu cloud image), e.g.:
+#
+#   gpu-telemetry-sampler.py sample --dir /var/lib/gpu-telemetry --interval-ms 1000
+#   gpu-telemetry-sampler.py read --dir /var/lib/gpu-telemetry --since 1234
+
+import argparse
+import glob
+import os
+import subprocess
+import sys
+import time
+
+parser = argparse.ArgumentParser(description="sample GPU telemetry into a ring buffer and read it incrementally")
+parser.add_argument("action", choices=["sample", "read"])
+parser.add_argument("--dir", default="/var/lib/gpu-telemetry", help="ring buffer directory (default: %(default)s)")
+parser.add_argument("--interval-ms", type=int, default=1000, help="sampling interval (default: %(default)s)")
+parser.add_argument("--segment-lines", type=int, default=3600, help="lines per segment file (default: %(default)s)")
+parser.add_argument("--segments", type=int, default=24, help="segment files kept (default: %(default)s)")
+parser.add_argument("--fields", default="index,uuid,utilization.gpu,utilization.memory,memory.used,memory.total,"
+                                        "clocks.sm,clocks.mem,power.draw,temperature.gpu,pstate,"
+                                        "clocks_throttle_reasons.active",
+                    help="nvidia-smi --query-gpu fields (default: %(default)s)")
+parser.add_argument("--since", type=int, default=-1, help="read: only samples after this sequence number")
+args = parser.parse_args()
+
+# nvidia-smi is retried after this many seconds if it is not available (yet), e.g., before the driver is installed
+RETRY_SECONDS = 30
+
+
+def segments():
+    # segment files sorted by their first sequence number
+    return sorted(glob.glob(os.path.join(args.dir, "segment-*.csv")))
+
+
+def first_seq(path):
+    return int(os.path.basename(path)[8:-4])
+
+
+def last_seq():
+    # sequence number of the last sample in the buffer, -1 if it is empty
+    for path in reversed(segments()):
+        with open(path, "rb") as f:
+            # complete lines only, the last one may have been cut off
+            lines = [line for line in f.read().split(b"\n")[:-1] if line[:1].isdigit()]
+        if lines:
+            return int(lines[-1].split(b",", 1)[0])
+    return -1
+
+
+def sample():
+    os.makedirs(args.dir, exist_ok=True)
+    seq = last_seq() + 1
+    segment, lines = None, 0
+    command = ["nvidia-smi", "--query-gpu=" + args.fields, "--format=csv,noheader,nounits", "-lms", str(args.interval_ms)]
+    while True:
+        try:
+            p = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        except OSError:
+            time.sleep(RETRY_SECONDS)
+            continue
+        for line in p.stdout:
+            line = line.strip()
+            if not line or not line[0].isdigit():
+                continue
+            if segment is None or lines >= args.segment_lines:
+                if segment is not None:
+                    segment.close()
+                segment = open(os.path.join(args.dir, "segment-%012d.csv" % seq), "a", buffering=1)
+                lines = 0
+                for old in segments()[:-args.segments]:
+                    os.remove(old)
+            segment.write("%d,%.3f,%s\n" % (seq, time.time(), ",".join(v.strip() for v in line.split(","))))
+            seq += 1
+            lines += 1
+        p.wait()
+        time.sleep(RETRY_SECONDS)
+
+
+def read():
+    paths = segments()
+    first = first_seq(paths[0]) if paths else -1
+    print("# %d %d" % (first, last_seq()))
+    for i, path in enumerate(paths):
+        # segments completely read before are skipped without opening them
+        if i + 1 < len(paths) and first_seq(paths[i + 1]) <= args.since + 1:
+            continue
+        with open(path) as f:
+            for line in f:
+                seq, _, rest = line.partition(",")
+                # the last line may still be written
+                if line.endswith("\n") and seq.isdigit() and int(seq) > args.since:
+                    sys.stdout.write(line)
+
+
+try:
+    sample() if args.action == "sample" else read()
+except (KeyboardInterrupt, BrokenPipeError):
+    pass
@@ -0,0 +1,435 @@
+#!/usr/bin/python3
+
+# unified launcher for instances offering NVIDIA GPUs in the OpenStack environment of NetLab - Hochschule Fulda
+#
+# The instance types of the former start scripts (start-nvidia-openstack-instance.py, start-gpuburn-openstack-instance.py,
+# start-nvidia-ollama-mutligpu-openstack-instance.py, which are wrappers for this script now) are declarative profiles
+# in gpuaas-profiles.yaml (see gpuaas_profiles.py): image, flavor, network, keypair, readiness checks, USERDATA and
+# their positional arguments, e.g.:
+#
+#   gpuaas.py start plain <openstack-username> node 12
+#   gpuaas.py start gpuburn burn-1 300 -d --telemetry
+#   gpuaas.py start ollama llm-1 --ollama-per-gpu --models llama3.1:8b
+#   gpuaas.py profiles
+#   gpuaas.py startup-time
+#
+# Wrappers and shell completions may call the script many times per minute, so only the standard library is imported
+# before the arguments are parsed. The OpenStack SDK is imported by gpuaas_auth.connect() when the first cloud call is
+# made, yaml only when the profiles or USERDATA need it. "gpuaas.py startup-time" measures the time until --help,
+# argument errors and the profile list are done, the time until the cloud is called is the "startup" phase of the
+# boot timings (see gpuaas_timing.py).
+
+import time
+
+STARTED = time.time()
+
+import argparse
+import os
+import sys
+
+
+
+###########################
+#
+# Config
+#
+###########################
+
+COMMANDS = {
+    "start": "start instance(s) of a profile",
+    "profiles": "list the profiles of gpuaas-profiles.yaml",
+    "startup-time": "measure the startup time of gpuaas.py without cloud calls",
+}
+
+# commands measured by startup-time (arguments of gpuaas.py)
+STARTUP_COMMANDS = [["--help"], ["start", "--help"], ["start", "plain"], ["profiles", "--names"]]
+STARTUP_REPEATS = 10
+
+# launcher label of the boot timings, the wrapper scripts pass their own name (runpy sets sys.argv[0] to gpuaas.py),
+# so timings of the former start scripts stay comparable
+LAUNCHER = globals().get("LAUNCHER") or os.path.basename(sys.argv[0])
+
+parser = argparse.ArgumentParser(description="start instances offering NVIDIA GPUs using declarative profiles",
+                                 epilog="commands: " + "; ".join("%s: %s" % c for c in COMMANDS.items()))
+parser.add_argument("command", choices=COMMANDS)
+parser.add_argument("options", nargs=argparse.REMAINDER, help="options of the command, see <command> --help")
+args = parser.parse_args()
+
+PROG = "%s %s" % (os.path.basename(sys.argv[0]), args.command)
+
+
+
+###########################
+#
+# Code
+#
+###########################
+
+def profiles_command(argv):
+    import gpuaas_profiles
+
+    command_parser = argparse.ArgumentParser(prog=PROG, description=COMMANDS["profiles"])
+    command_parser.add_argument("--names", action="store_true", help="only print the names, e.g., for shell completion")
+    command_parser.add_argument("--profiles", default=gpuaas_profiles.PROFILES_FILE,
+                                help="profile file (default: $GPUAAS_PROFILES or %(default)s)")
+    command_args = command_parser.parse_args(argv)
+
+    profiles = gpuaas_profiles.load(command_args.profiles)
+    for name, profile in profiles.items():
+        if command_args.names:
+            print(name)
+            continue
+        print("%s: %s" % (name, profile["description"]))
+        print("  usage:   %s start %s %s" % (os.path.basename(sys.argv[0]), name, gpuaas_profiles.usage(profile)))
+        print("  image:   %s" % profile["image"])
+        print("  flavor:  %s" % profile["flavor"])
+        print("  network: %s" % profile["network"])
+        features = [f for f in ("golden", "ollama") if profile[f]]
+        if features:
+            print("  options: %s" % ", ".join(features))
+
+
+def startup_time_command(argv):
+    import statistics
+    import subprocess
+
+    command_parser = argparse.ArgumentParser(prog=PROG, description=COMMANDS["startup-time"],
+                                             usage="%(prog)s [--repeats N] [-- gpuaas.py arguments ...]")
+    command_parser.add_argument("--repeats", type=int, default=STARTUP_REPEATS,
+                                help="runs per command (default: %(default)s)")
+    commands = [argv[argv.index("--") + 1:]] if "--" in argv else STARTUP_COMMANDS
+    command_args = command_parser.parse_args(argv[:argv.index("--")] if "--" in argv else argv)
+
+    # the interpreter itself is the lower bound
+    runs = [("python3 -c pass", [sys.executable, "-c", "pass"])]
+    runs += [("gpuaas.py " + " ".join(c), [sys.executable, os.path.abspath(__file__)] + c) for c in commands]
+    print("%-40s %8s %8s %8s" % ("COMMAND", "MEAN", "MIN", "MAX"))
+    for label, command in runs:
+        durations = []
+        for _ in range(command_args.repeats):
+            start = time.monotonic()
+            subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            durations.append((time.monotonic() - start) * 1000)
+        print("%-40s %6.1fms %6.1fms %6.1fms" % (label, statistics.mean(durations), min(durations), max(durations)))
+    print("\nModules imported by a command: python3 -X importtime gpuaas.py ... 2>&1 | sort -t'|' -k2 -n | tail")
+
+
+def start_command(argv):
+    import gpuaas_placement
+    import gpuaas_profiles
+    import gpuaas_timing
+    import gpuaas_userdata
+
+    command_parser = argparse.ArgumentParser(
+      prog=PROG, description=COMMANDS["start"], allow_abbrev=False,
+      usage="%(prog)s [options] profile argument ...",
+      epilog="the positional arguments of every profile are shown by \"gpuaas.py profiles\"")
+    command_parser.add_argument("profile", help="profile of gpuaas-profiles.yaml, e.g., plain, gpuburn or ollama")
+    command_parser.add_argument("arguments", metavar="argument", nargs="*",
+                                help="positional arguments of the profile, e.g., instance-name")
+    command_parser.add_argument("--profiles", default=gpuaas_profiles.PROFILES_FILE,
+                                help="profile file (default: $GPUAAS_PROFILES or %(default)s)")
+    command_parser.add_argument("--max-workers", type=int,
+                                help="max. number of instances created concurrently (default: gpuaas_fleet.MAX_WORKERS)")
+    command_parser.add_argument("--no-wait", action="store_true",
+                                help="only create the instance(s) and print their IDs, do not wait for them to become ACTIVE")
+    command_parser.add_argument("--gpus", type=int,
+                                help="choose the flavor by number of GPUs instead of using the flavor of the profile, "
+                                     "falling back to the next candidate flavor if no host with free GPUs is found")
+    command_parser.add_argument("--gpu-model", default=",".join(gpuaas_placement.GPU_MODELS),
+                                help="acceptable GPU models for --gpus in order of preference (default: %(default)s)")
+    command_parser.add_argument("--pool",
+                                help="unshelve a matching instance of this warm pool instead of creating a new one if "
+                                     "possible, new instances become members of the pool (release them using "
+                                     "release-nvidia-openstack-instance.py)")
+    command_parser.add_argument("--no-fip-pool", action="store_true",
+                                help="allocate a new floating IP instead of reusing one of the floating IP pool")
+    command_parser.add_argument("--no-guest-wait", action="store_true",
+                                help="do not wait for ssh, cloud-init, nvidia-smi etc. inside the instance after it is ACTIVE")
+    command_parser.add_argument("--ready-port", type=int, action="append", default=[],
+                                help="also wait until this port of the instance accepts connections (can be given "
+                                     "multiple times)")
+    command_parser.add_argument("--timings-file", default=gpuaas_timing.TIMINGS_FILE,
+                                help="append boot phase timings as JSON lines to this file, empty to disable "
+                                     "(default: %(default)s)")
+    command_parser.add_argument("--prometheus-textfile", help="also write boot phase timings to this Prometheus textfile")
+    gpuaas_userdata.add_userdata_arguments(command_parser)
+    # profiles with golden: true
+    command_parser.add_argument("--bake", action="store_true",
+                                help="provision the instance using USERDATA and snapshot it into a golden image used by "
+                                     "later starts")
+    command_parser.add_argument("--no-golden", action="store_true",
+                                help="do not boot from a golden image even if one was baked for USERDATA")
+    # profiles with ollama: true
+    command_parser.add_argument("--ollama-per-gpu", action="store_true",
+                                help="run one Ollama container per GPU behind a load balancing router on port 11434 "
+                                     "instead of a single container using all GPUs")
+    command_parser.add_argument("--models",
+                                help="comma separated Ollama models to provide, taken from --model-volume or a golden "
+                                     "image if possible and pulled otherwise (with --bake: pulled and baked into the "
+                                     "golden image)")
+    command_parser.add_argument("--model-volume",
+                                help="clone this Cinder volume holding an Ollama model store and mount it as the ollama "
+                                     "Docker volume")
+    command_parser.add_argument("--model-check", choices=["sha256", "size"], default="sha256",
+                                help="verify the model blobs by their sha256 digest or only by their size "
+                                     "(default: %(default)s)")
+    # positional arguments may follow options, unknown options (e.g., "-d" of gpu-burn) go to the rest argument
+    args, extras = command_parser.parse_known_intermixed_args(argv)
+
+    try:
+        profiles = gpuaas_profiles.load(args.profiles)
+    except (OSError, ValueError) as e:
+        command_parser.error("cannot load profiles: %s" % e)
+    if args.profile not in profiles:
+        command_parser.error("unknown profile %s, choose from %s" % (args.profile, ", ".join(profiles)))
+    profile = profiles[args.profile]
+
+    try:
+        bound = gpuaas_profiles.bind(profile, args.arguments, extras)
+        profile = gpuaas_profiles.apply(profile, bound)
+        instance_names = instance_names_of(bound)
+    except ValueError as e:
+        command_parser.error(str(e))
+    if (args.bake or args.no_golden) and not profile["golden"]:
+        command_parser.error("profile %s does not support golden images" % profile["name"])
+    if (args.ollama_per_gpu or args.models or args.model_volume) and not profile["ollama"]:
+        command_parser.error("profile %s does not run Ollama" % profile["name"])
+    if (args.bake or args.models or args.model_volume) and len(instance_names) > 1:
+        command_parser.error("--bake, --models and --model-volume can only be used for a single instance")
+
+    start(profile, instance_names, args)
+
+
+def instance_names_of(bound):
+    # instance names of the instance_name and count arguments, see gpuaas_fleet.instance_names()
+    import gpuaas_fleet
+    import gpuaas_profiles
+
+    count = bound.get(gpuaas_profiles.COUNT_ARGUMENT, "1")
+    if not count.isdigit():
+        raise ValueError("invalid instance count %s" % count)
+    return gpuaas_fleet.instance_names(bound[gpuaas_profiles.INSTANCE_NAME_ARGUMENT], int(count))
+
+
+def get_keypair(conn, resolver, profile):
+    keypair = resolver.keypair(profile["keypair"])
+    pubkey_file = profile["import_existing_pubkey_file"]
+
+    if not keypair:
+        if pubkey_file != "":
+            print("Importing public key from %s" % (pubkey_file))
+
+            with open(os.path.expanduser(pubkey_file), 'r') as f:
+                pubkey = f.read()
+                keypair = conn.compute.create_keypair(name=profile["keypair"], public_key=pubkey)
+                ssh_privkey = "<private key corresponding to " + pubkey_file + ">"
+
+        else:
+            print("Create Key Pair:")
+
+            keypair = conn.compute.create_keypair(name=profile["keypair"])
+
+            print(keypair)
+
+            with open(profile["private_keypair_file"], 'w') as f:
+                f.write("%s" % keypair.private_key)
+
+            os.chmod(profile["private_keypair_file"], 0o400)
+            ssh_privkey = profile["private_keypair_file"]
+    else:
+        if pubkey_file != "":
+            ssh_privkey = "<private key corresponding to existing " + pubkey_file + ">"
+        else:
+            ssh_privkey = profile["private_keypair_file"]
+
+    return keypair, ssh_privkey
+
+
+def start(profile, instance_names, args):
+    # the former start scripts, instances of profile are created concurrently (fleet) if there are multiple names
+    import concurrent.futures
+
+    import gpuaas_auth
+    import gpuaas_cache
+    import gpuaas_fip
+    import gpuaas_fleet
+    import gpuaas_golden
+    import gpuaas_models
+    import gpuaas_ollama
+    import gpuaas_placement
+    import gpuaas_pool
+    import gpuaas_ready
+    import gpuaas_timing
+    import gpuaas_userdata
+
+    max_workers = args.max_workers or gpuaas_fleet.MAX_WORKERS
+    models = [m for m in (args.models or "").split(",") if m]
+    image_name = profile["image"]
+    userdata = profile["userdata"]
+
+    # one Ollama container per GPU (localhost:11435, 11436, ...) behind ollama-router.py on port 11434, see gpuaas_ollama.py
+    if args.ollama_per_gpu:
+        userdata = gpuaas_ollama.per_gpu_userdata(userdata)
+
+    # apt and Docker Hub downloads go through a shared cache host if configured, redundant provisioning steps are
+    # removed using --optimize-userdata, see gpuaas_userdata.py
+    userdata = gpuaas_userdata.prepare(userdata, args)
+
+    # Initialize and turn on debug logging
+    # openstack.enable_logging(debug=True)
+
+    # boot phases of every instance are recorded and written to --timings-file/--prometheus-textfile, see
+    # gpuaas_timing.py, the startup phase lasts from the start of gpuaas.py until the first cloud call
+    boot_timeline = gpuaas_timing.Timeline(launcher=LAUNCHER, profile=profile["name"],
+                                           image=image_name, flavor=profile["flavor"])
+    boot_timeline.started = boot_timeline.last = STARTED
+    boot_timeline.mark("startup")
+
+    # Initialize connection
+    # a cached Keystone token is reused if possible, see gpuaas_auth.py
+    conn = gpuaas_auth.connect(cloud='openstack')
+    boot_timeline.mark("auth")
+
+    # names are resolved to IDs using the on-disk cache in ~/.cache/hfd-gpuaas, see gpuaas_cache.py
+    resolver = gpuaas_cache.Resolver(conn)
+    image = resolver.image(image_name)
+
+    # with --gpus the best candidate flavor is used, the others are tried if no host with free GPUs is found
+    fallback_flavors = []
+    if args.gpus:
+        flavor_names = gpuaas_placement.rank_flavors(conn, args.gpus, args.gpu_model.split(","),
+                                                     instances=len(instance_names))
+        if not flavor_names:
+            print("No flavor with %d GPUs of model %s available" % (args.gpus, args.gpu_model))
+            sys.exit(1)
+        print("Flavor candidates: %s" % ", ".join(flavor_names))
+        flavor, *fallback_flavors = [resolver.flavor(name) for name in flavor_names]
+        boot_timeline.labels["flavor"] = flavor_names[0]
+    else:
+        flavor = resolver.flavor(profile["flavor"])
+
+    network = resolver.network(profile["network"])
+    keypair, ssh_privkey = get_keypair(conn, resolver, profile)
+    userdata_hash = gpuaas_golden.userdata_hash(userdata, image_name)
+
+    # boot from a golden image baked from the same base image and USERDATA using --bake (see gpuaas_golden.py)
+    if profile["golden"] and not (args.bake or args.no_golden):
+        golden_image = gpuaas_golden.find_golden_image(conn, userdata_hash)
+        if golden_image:
+            print("Using golden image %s" % golden_image.name)
+            image = golden_image
+            userdata = gpuaas_golden.GOLDEN_USERDATA
+            boot_timeline.labels["image"] = golden_image.name
+
+    # instances of a warm pool are identified by the hash of image and USERDATA and their flavor, see gpuaas_pool.py
+    meta = None
+    warm_servers = []
+    if args.pool and not args.bake:
+        meta = gpuaas_pool.pool_metadata(args.pool, userdata_hash)
+        warm_servers = gpuaas_pool.find_shelved(
+          conn, args.pool, userdata_hash, [f.name for f in [flavor] + fallback_flavors], len(instance_names))
+        print("Found %d matching shelved instance(s) in warm pool %s" % (len(warm_servers), args.pool))
+    boot_timeline.mark("lookup")
+
+    # the model volume is cloned while the instance boots, see gpuaas_models.py
+    model_volume = None
+    if args.model_volume and not (args.bake or args.no_wait):
+        volume_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        model_volume = volume_executor.submit(
+          lambda: gpuaas_models.wait_for_volume(
+            conn, gpuaas_models.clone_volume(conn, args.model_volume, instance_names[0] + "-models")))
+        # the clone keeps running, the thread exits once it is done
+        volume_executor.shutdown(wait=False)
+
+    # The public IP address is taken from the pool of floating IPs released by terminate-nvidia-openstack-instance.py
+    # (see gpuaas_fip.py) and associated with the port of the server in a single call as soon as it is ACTIVE.
+    fip_pool = None if args.no_fip_pool else gpuaas_fip.FloatingIPPool(conn)
+
+    def ready_check(server, timeline):
+        # the flavor may differ from the flavor of the profile if --gpus is used
+        gpus = (gpuaas_ready.flavor_gpus(timeline.labels["flavor"]) or 0) if profile["ready_nvidia_smi"] else None
+        gpuaas_ready.wait_for_guest(server, timeline, key=ssh_privkey, sentinel=profile["ready_sentinel_file"],
+                                    gpus=gpus, ports=tuple(profile["ready_ports"]) + tuple(args.ready_port))
+
+    # Servers are created without waiting, their IDs are printed immediately. Afterwards all servers are watched using
+    # a single server list call per interval and a floating IP is associated as soon as a server is ACTIVE.
+    if len(instance_names) > 1:
+        print("Starting %d instances (max. %d concurrently) ..." % (len(instance_names), max_workers))
+
+    results = gpuaas_fleet.start_instances(
+      conn, instance_names, ssh_privkey, max_workers=max_workers, wait=not args.no_wait, resolver=resolver,
+      timeline=boot_timeline, ready_check=None if args.no_guest_wait or args.bake else ready_check,
+      fallback_flavors=fallback_flavors, warm_servers=warm_servers, fip_pool=fip_pool, meta=meta,
+      image=image, flavor=flavor, network=network, key_name=keypair.name,
+      userdata=gpuaas_userdata.compress(userdata) if args.optimize_userdata else userdata)
+
+    # mount the model volume and provide the models, only missing or corrupt models are pulled
+    result = results[0]
+    if model_volume and result.error:
+        # not attached, terminate-nvidia-openstack-instance.py would not find it, the launch error is reported even
+        # if the clone failed as well
+        if model_volume.exception() is None:
+            try:
+                conn.block_storage.delete_volume(model_volume.result())
+            except Exception as e:
+                print("[%s] cannot delete model volume: %s" % (result.name, e))
+        else:
+            print("[%s] cloning the model volume failed: %s" % (result.name, model_volume.exception()))
+    elif (model_volume or models) and not (result.error or args.no_wait or args.bake):
+        try:
+            if model_volume:
+                volume = model_volume.result()
+                gpuaas_models.mount_model_volume(conn, result.server, volume, key=ssh_privkey)
+                result.timeline.mark("model_volume")
+                print("[%s] mounted model volume %s" % (result.name, volume.name))
+            if models:
+                status = gpuaas_models.seed_models(result.server.public_v4, models, key=ssh_privkey,
+                                                   check=args.model_check)
+                result.timeline.mark("models")
+                print("[%s] models: %s" % (result.name, ", ".join("%s (%s)" % m for m in status.items())))
+        except Exception as e:
+            print("[%s] providing models failed: %s" % (result.name, e))
+            results[0] = result._replace(error=e)
+
+    gpuaas_timing.export([r.timeline for r in results], args.timings_file, args.prometheus_textfile)
+
+    failed = [r.name for r in results if r.error]
+    if len(results) > 1:
+        print("\n%d of %d instances %s" % (len(results) - len(failed), len(results),
+                                           "created" if args.no_wait else "started"))
+    if failed:
+        print("failed: %s" % ", ".join(failed))
+        sys.exit(1)
+    if len(results) > 1 or args.no_wait:
+        return
+
+    server = results[0].server
+
+    def bake_models(server):
+        # Ollama is started by cron after the reboot of the provisioning
+        gpuaas_ready.wait_for_guest(server, results[0].timeline, key=ssh_privkey, ports=(gpuaas_ollama.OLLAMA_PORT,))
+        gpuaas_models.seed_models(server.public_v4, models, key=ssh_privkey, check=args.model_check)
+
+    if args.bake:
+        print("\nWaiting for cloud-init to provision %s, this takes a while ..." % server.name)
+        golden_image = gpuaas_golden.bake(conn, server, userdata_hash, image_name, key=ssh_privkey,
+                                          before_snapshot=bake_models if models else None,
+                                          metadata={"gpuaas_ollama_models": ",".join(models)} if models else None)
+        print("\nGolden image %s created, it is used automatically by the next start with the same USERDATA"
+              % golden_image.name)
+        return
+
+    print("\nServer instance started:\n\n%s" % server)
+
+    print("\n\nLogin using, e.g.:\n\nssh -i {key} ubuntu@{ip}".format(
+      key=ssh_privkey,
+      ip=server.public_v4))
+
+
+if args.command == "start":
+    start_command(args.options)
+elif args.command == "profiles":
+    profiles_command(args.options)
+else:
+    startup_time_command(args.options)
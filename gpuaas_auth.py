@@ -0,0 +1,107 @@
+# Keystone token reuse for the scripts in the OpenStack environment of NetLab - Hochschule Fulda
+#
+# openstack.connect() authenticates against the auth_url from clouds.yaml on every run. connect() below stores the
+# keystoneauth auth state (token and service catalog) in ~/.cache/hfd-gpuaas/token-<hash>.json, readable for the
+# current user only, and hands it to the next script run as long as the token is not about to expire. Expired or
+# revoked tokens are replaced by keystoneauth automatically, the new token is written back when the script exits.
+#
+# If GPUAAS_FAKE_CLOUD is set, connect() returns the in-process fake cloud of gpuaas_fake.py instead.
+
+import atexit
+import hashlib
+import json
+import os
+import stat
+import time
+
+import gpuaas_cache
+
+
+
+###########################
+#
+# Config
+#
+###########################
+
+# cached tokens are only reused if they are valid for at least this many seconds
+TOKEN_EXPIRY_MARGIN = 300
+
+# set GPUAAS_TOKEN_CACHE=0 to always authenticate
+TOKEN_CACHE = os.environ.get("GPUAAS_TOKEN_CACHE", "1") != "0"
+
+
+
+###########################
+#
+# Code
+#
+###########################
+
+def token_cache_path(conn):
+    # one cache file per cloud, auth_url, user and project
+    auth = conn.config.config.get("auth", {})
+    identity = [conn.config.name or ""] + [str(auth.get(k, "")) for k in (
+        "auth_url", "username", "user_id", "user_domain_name", "project_id", "project_name")]
+    digest = hashlib.sha256("\n".join(identity).encode()).hexdigest()[:16]
+    return gpuaas_cache.cache_path("token-%s.json" % digest)
+
+
+def load_auth_state(path):
+    # returns the cached auth state if it is still valid and the file is not readable by others
+    try:
+        st = os.stat(path)
+        if st.st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+            print("warning: ignoring token cache %s, it is accessible by other users" % path)
+            return None
+        with open(path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if cached.get("expires", 0) - TOKEN_EXPIRY_MARGIN < time.time():
+        return None
+    return cached.get("state")
+
+
+def save_auth_state(path, auth):
+    state = auth.get_auth_state()
+    if not state or auth.auth_ref is None:
+        return None
+    try:
+        gpuaas_cache.write_private_file(path, json.dumps({
+            "expires": auth.auth_ref.expires.timestamp(),
+            "state": state}))
+    except OSError as e:
+        print("warning: cannot write token cache %s: %s" % (path, e))
+    return state
+
+
+def connect(cloud="openstack"):
+    # openstack.connect(cloud=cloud) reusing a cached Keystone token
+    if os.environ.get("GPUAAS_FAKE_CLOUD"):
+        import gpuaas_fake
+        return gpuaas_fake.connect(os.environ["GPUAAS_FAKE_CLOUD"])
+
+    import openstack
+
+    conn = openstack.connect(cloud=cloud)
+    if not TOKEN_CACHE:
+        return conn
+
+    auth = conn.session.auth
+    path = token_cache_path(conn)
+    state = load_auth_state(path)
+    if state:
+        auth.set_auth_state(state)
+    else:
+        conn.authorize()
+        state = save_auth_state(path, auth)
+
+    # keystoneauth re-authenticates if the cached token was revoked meanwhile, keep the new one for the next run
+    def save_if_changed():
+        if auth.auth_ref is not None and auth.get_auth_state() != state:
+            save_auth_state(path, auth)
+
+    atexit.register(save_if_changed)
+    return conn
@@ -0,0 +1,188 @@
+# on-disk cache for name -> ID lookups of images, flavors, networks and keypairs in the OpenStack environment of
+# NetLab - Hochschule Fulda
+#
+# find_image/find_flavor/find_network/find_keypair by name list and filter on the API side, which adds up over the
+# VPN. Resolved IDs are stored in ~/.cache/hfd-gpuaas/resolve.json (shared by all start scripts) and passed to
+# create_server as {"id": ...} dicts, which the SDK uses as-is without looking them up again. Entries expire after
+# RESOLVE_TTL seconds and are dropped as soon as create_server reports that a cached ID could not be found.
+
+import json
+import os
+import re
+import threading
+import time
+
+
+
+###########################
+#
+# Config
+#
+###########################
+
+CACHE_DIR = os.path.expanduser(os.environ.get("GPUAAS_CACHE_DIR", "~/.cache/hfd-gpuaas"))
+RESOLVE_CACHE_FILE = "resolve.json"
+
+# seconds a resolved ID is used without asking the API again, set GPUAAS_RESOLVE_TTL=0 to disable the cache
+RESOLVE_TTL = int(os.environ.get("GPUAAS_RESOLVE_TTL", 24 * 3600))
+
+# create_server keyword args that can hold resolved resources and their kind
+CREATE_KWARG_KINDS = {"image": "image", "flavor": "flavor", "network": "network", "key_name": "keypair"}
+
+
+
+###########################
+#
+# Code
+#
+###########################
+
+def cache_path(filename):
+    # path of a file in CACHE_DIR, the directory is created readable for the current user only
+    os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+    return os.path.join(CACHE_DIR, filename)
+
+
+def write_private_file(path, content):
+    # atomically replace path with content, readable for the current user only
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def is_not_found(error):
+    # True if error says that a referenced image, flavor, network or keypair does not exist (anymore)
+    #
+    # Nova answers unknown resources in a create request with 400 "... could not be found." instead of 404.
+    status = getattr(error, "status_code", None)
+    if status == 404:
+        return True
+    return status in (None, 400) and re.search(r"could not be found|not found|invalid key_name", str(error), re.I) is not None
+
+
+class CachedResource(dict):
+    # minimal stand-in for an SDK resource, create_server only needs the id of image/flavor/network dicts
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class Resolver:
+    # resolves image/flavor/network/keypair names using the on-disk cache, falling back to the find_* API calls
+
+    def __init__(self, conn, ttl=RESOLVE_TTL, path=None):
+        self.conn = conn
+        self.ttl = ttl
+        self.path = path or cache_path(RESOLVE_CACHE_FILE)
+        self.scope = "%s/%s" % (getattr(conn.config, "name", None) or "default",
+                                getattr(conn.config, "region_name", None) or "")
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        # {(kind, ID): requested name} of the resources handed out from the cache
+        self.served = {}
+        # {(kind, stale ID): resource looked up again}, see refresh()
+        self.replaced = {}
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def _key(self, kind, name):
+        return "%s:%s:%s" % (self.scope, kind, name)
+
+    def _find(self, kind, name):
+        if kind == "image":
+            return self.conn.compute.find_image(name)
+        if kind == "flavor":
+            return self.conn.compute.find_flavor(name)
+        if kind == "network":
+            return self.conn.network.find_network(name)
+        if kind == "keypair":
+            return self.conn.compute.find_keypair(name)
+        raise ValueError("unknown resource kind %s" % kind)
+
+    def _save(self):
+        now = time.time()
+        self.entries = {k: v for k, v in self.entries.items() if v["expires"] > now}
+        try:
+            write_private_file(self.path, json.dumps(self.entries, indent=1, sort_keys=True))
+        except OSError as e:
+            print("warning: cannot write resolve cache %s: %s" % (self.path, e))
+
+    def resolve(self, kind, name):
+        # returns a CachedResource for cached names, otherwise the SDK resource (or None if not found)
+        key = self._key(kind, name)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry["expires"] > time.time():
+                self.served[(kind, entry["id"])] = name
+                return CachedResource(id=entry["id"], name=entry["name"])
+
+            resource = self._find(kind, name)
+            if resource is not None and self.ttl > 0:
+                # keypairs are identified by their name
+                self.entries[key] = {"id": resource.id or resource.name, "name": resource.name,
+                                     "expires": time.time() + self.ttl}
+                self._save()
+            return resource
+
+    def image(self, name):
+        return self.resolve("image", name)
+
+    def flavor(self, name):
+        return self.resolve("flavor", name)
+
+    def network(self, name):
+        return self.resolve("network", name)
+
+    def keypair(self, name):
+        return self.resolve("keypair", name)
+
+    def invalidate(self):
+        # drop all entries handed out from the cache
+        with self.lock:
+            for (kind, _), name in self.served.items():
+                self.entries.pop(self._key(kind, name), None)
+            self.served.clear()
+            self._save()
+
+    def current(self, create_kwargs):
+        # create_kwargs with the resources already looked up again by refresh() replaced, no API calls
+        kwargs = dict(create_kwargs)
+        for kwarg, kind in CREATE_KWARG_KINDS.items():
+            value = kwargs.get(kwarg)
+            resource = self.replaced.get((kind, value if kind == "keypair" else getattr(value, "id", None)))
+            if value is not None and resource is not None:
+                kwargs[kwarg] = resource.name if kind == "keypair" else resource
+        return kwargs
+
+    def refresh(self, create_kwargs):
+        # create_kwargs with the resources handed out from the cache looked up again, e.g., after create_server failed
+        # because one of them is stale
+        #
+        # Every resource is looked up by the name it was requested with for the keyword arg it is passed as, others
+        # (e.g., a golden image) are kept, so the image and flavor chosen by the caller never change. Each stale
+        # resource is only looked up once, concurrent and later callers get the same replacement.
+        with self.refresh_lock:
+            for kwarg, kind in CREATE_KWARG_KINDS.items():
+                value = create_kwargs.get(kwarg)
+                if not (isinstance(value, CachedResource) or (kind == "keypair" and isinstance(value, str))):
+                    continue
+                stale_id = value if kind == "keypair" else value.id
+                with self.lock:
+                    name = self.served.pop((kind, stale_id), None)
+                    if name is None:
+                        # not from the cache or already looked up again
+                        continue
+                    self.entries.pop(self._key(kind, name), None)
+                    self._save()
+                resource = self.resolve(kind, name)
+                if resource is not None:
+                    self.replaced[(kind, stale_id)] = resource
+        return self.current(create_kwargs)
@@ -0,0 +1,116 @@
+# managed floating IP pool for the OpenStack environment of NetLab - Hochschule Fulda
+#
+# create_server(auto_ip=True) allocates a new floating IP for every instance (several API calls including waiting)
+# and deleting the instance leaves it behind. Instead, the start scripts take an unassociated floating IP of the
+# pool (marked by FIP_POOL_DESCRIPTION) and associate it with the port of the ACTIVE instance in a single call. New
+# IPs are only allocated if the pool is empty. terminate-nvidia-openstack-instance.py returns the floating IPs of
+# deleted instances to the pool, so the same addresses are reused over and over.
+
+import threading
+
+
+
+###########################
+#
+# Config
+#
+###########################
+
+FIP_POOL_DESCRIPTION = "gpuaas-fip-pool"
+
+# external network to allocate new floating IPs from, None uses the first external network
+FLOATING_NETWORK_NAME = None
+
+ASSOCIATE_ATTEMPTS = 5
+
+
+
+###########################
+#
+# Code
+#
+###########################
+
+def floating_ip_of(server):
+    # floating IP already associated with server (e.g., unshelved from a warm pool), taken from its addresses
+    for addresses in (server.addresses or {}).values():
+        for address in addresses:
+            if address.get("OS-EXT-IPS:type") == "floating" and address.get("version", 4) == 4:
+                return address["addr"]
+    return None
+
+
+class FloatingIPPool:
+    # floating IPs are handed out to the threads of a fleet start under a lock, so every instance gets another one
+
+    def __init__(self, conn, description=FIP_POOL_DESCRIPTION, network_name=FLOATING_NETWORK_NAME):
+        self.conn = conn
+        self.description = description
+        self.network_name = network_name
+        self.lock = threading.Lock()
+        self.free = None
+        self.network = None
+        # the empty pool is only reported once, not by every thread of a fleet start
+        self.reported_empty = False
+
+    def _allocate(self):
+        if self.network is None:
+            if self.network_name:
+                self.network = self.conn.network.find_network(self.network_name)
+            else:
+                self.network = next(iter(self.conn.network.networks(is_router_external=True)), None)
+            if self.network is None:
+                raise RuntimeError("no external network to allocate floating IPs from")
+        return self.conn.network.create_ip(floating_network_id=self.network.id, description=self.description)
+
+    def acquire(self):
+        # unassociated floating IP of the pool, a new one is allocated if there is none left
+        with self.lock:
+            if self.free is None:
+                self.free = [ip for ip in self.conn.network.ips(description=self.description) if not ip.port_id]
+            if self.free:
+                return self.free.pop(0)
+            report = not self.reported_empty
+            self.reported_empty = True
+        if report:
+            print("Floating IP pool is empty, allocating new floating IPs")
+        return self._allocate()
+
+    def associate(self, server):
+        # associate a floating IP of the pool with the port of server, returns the address
+        address = floating_ip_of(server)
+        if address:
+            return address
+
+        port = next(iter(self.conn.network.ports(device_id=server.id)), None)
+        if port is None:
+            raise RuntimeError("server %s has no port to associate a floating IP with" % server.id)
+        for attempt in range(ASSOCIATE_ATTEMPTS):
+            ip = self.acquire()
+            try:
+                ip = self.conn.network.update_ip(ip, port_id=port.id)
+            except Exception as e:
+                # taken by another script meanwhile
+                if getattr(e, "status_code", None) == 409:
+                    continue
+                raise
+            return ip.floating_ip_address
+        raise RuntimeError("no floating IP could be associated with server %s" % server.id)
+
+    def release(self, server):
+        # disassociate the floating IPs of server and put them (back) into the pool, returns the addresses
+        released = []
+        for port in self.conn.network.ports(device_id=server.id):
+            for ip in self.conn.network.ips(port_id=port.id):
+                self.conn.network.update_ip(ip, port_id=None, description=self.description)
+                released.append(ip.floating_ip_address)
+        return released
+
+    def delete(self, server):
+        # delete the floating IPs of server instead of keeping them in the pool, returns the addresses
+        deleted = []
+        for port in self.conn.network.ports(device_id=server.id):
+            for ip in self.conn.network.ips(port_id=port.id):
+                self.conn.network.delete_ip(ip)
+                deleted.append(ip.floating_ip_address)
+        return deleted
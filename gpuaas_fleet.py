@@ -0,0 +1,374 @@
+# helpers to start a fleet of instances in the OpenStack environment of NetLab - Hochschule Fulda
+#
+# Image, flavor, network and keypair are resolved once by the calling script. Only the create_server calls
+# are issued concurrently on a bounded worker pool, so starting N instances takes roughly as long as starting one.
+#
+# create_server is called without wait=True, so the server IDs are available immediately. Instead of one polling
+# loop per server, a single watcher lists all servers once per tick and reports their status transitions
+# (BUILD -> ACTIVE/ERROR), backing off exponentially while nothing changes.
+
+import collections
+import concurrent.futures
+import fnmatch
+import time
+
+import gpuaas_cache
+import gpuaas_fip
+import gpuaas_models
+import gpuaas_placement
+import gpuaas_pool
+import gpuaas_ssh
+import gpuaas_timing
+
+
+
+###########################
+#
+# Config
+#
+###########################
+
+# max. number of create_server requests running at the same time
+MAX_WORKERS = 8
+
+# watcher polling interval in seconds, doubled while no server changes its status up to WATCH_MAX_INTERVAL
+WATCH_INTERVAL = 2
+WATCH_MAX_INTERVAL = 30
+WATCH_TIMEOUT = 1800
+
+# statuses after which a server is no longer watched, servers that vanished from the list are reported as DELETED
+WATCH_UNTIL = ("ACTIVE", "ERROR")
+
+
+
+###########################
+#
+# Code
+#
+###########################
+
+LaunchResult = collections.namedtuple("LaunchResult", ["name", "server", "error", "duration", "timeline"],
+                                      defaults=(None,))
+
+
+def instance_names(name, count=1):
+    # "node-a,node-b" -> ["node-a", "node-b"], ("node", 3) -> ["node-1", "node-2", "node-3"]
+    names = [n.strip() for n in name.split(",") if n.strip()]
+
+    if not names:
+        raise ValueError("no instance name given")
+    if count < 1:
+        raise ValueError("instance count must be at least 1")
+    if count > 1:
+        if len(names) > 1:
+            raise ValueError("use either a list of instance names or a count, not both")
+        names = ["%s-%d" % (names[0], i) for i in range(1, count + 1)]
+    if len(set(names)) != len(names):
+        raise ValueError("instance names must be unique")
+
+    return names
+
+
+def create_server(conn, name, create_kwargs, resolver=None):
+    # conn.create_server(name, **create_kwargs) using the resources of resolver already looked up again
+    #
+    # If create_server fails because a cached image/flavor/network/keypair ID of resolver does not exist anymore,
+    # they are looked up once again (see gpuaas_cache.Resolver.refresh) and the create request is retried.
+    if resolver is not None:
+        create_kwargs = resolver.current(create_kwargs)
+    try:
+        return conn.create_server(name, **create_kwargs)
+    except Exception as e:
+        if resolver is None or not gpuaas_cache.is_not_found(e):
+            raise
+    return conn.create_server(name, **resolver.refresh(create_kwargs))
+
+
+def launch_fleet(conn, names, max_workers=MAX_WORKERS, on_result=None, resolver=None, **create_kwargs):
+    # start all instances in names concurrently using create_server(conn, name, create_kwargs, resolver)
+    #
+    # on_result(result) is called from the calling thread as soon as a single instance is started or failed,
+    # the returned list of LaunchResult is in the order of names.
+    def launch(name):
+        start = time.monotonic()
+        try:
+            server = create_server(conn, name, create_kwargs, resolver)
+        except Exception as e:
+            return LaunchResult(name, None, e, time.monotonic() - start)
+        return LaunchResult(name, server, None, time.monotonic() - start)
+
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(names)))) as pool:
+        futures = [pool.submit(launch, name) for name in names]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results[result.name] = result
+            if on_result:
+                on_result(result)
+
+    return [results[name] for name in names]
+
+
+def select_servers(conn, names=(), prefix=None, pattern=None, tags=()):
+    # servers of the project selected by a single server list call
+    #
+    # Servers match if their name is one of names (glob patterns allowed), starts with prefix or matches the glob
+    # pattern, and if they have all metadata tags ("key=value" or just "key"). Without name selectors all servers
+    # having the tags are selected.
+    tags = [tag.partition("=") for tag in tags]
+    by_name = bool(names or prefix or pattern)
+    selected = []
+
+    for server in conn.compute.servers(details=True):
+        if by_name and not (any(fnmatch.fnmatchcase(server.name, n) for n in names)
+                            or (prefix and server.name.startswith(prefix))
+                            or (pattern and fnmatch.fnmatchcase(server.name, pattern))):
+            continue
+        metadata = server.metadata or {}
+        if any(key not in metadata or (sep and metadata[key] != value) for key, sep, value in tags):
+            continue
+        selected.append(server)
+
+    return selected
+
+
+def delete_servers(conn, servers, max_workers=MAX_WORKERS, delete_ips=False):
+    # delete servers concurrently, returns {server ID: None or exception} (names need not be unique)
+    #
+    # Their floating IPs are returned to the floating IP pool (see gpuaas_fip.py) or deleted if delete_ips is True,
+    # host keys of the addresses are removed as the next instance using them has another one. Cloned Ollama model
+    # volumes (see gpuaas_models.py) are deleted once the servers released them.
+    fip_pool = gpuaas_fip.FloatingIPPool(conn)
+
+    def delete(server):
+        try:
+            if delete_ips:
+                for address in fip_pool.delete(server):
+                    print("[%s] deleted floating IP %s" % (server.name, address))
+                    gpuaas_ssh.forget_host_key(address)
+            else:
+                for address in fip_pool.release(server):
+                    print("[%s] returned floating IP %s to the pool" % (server.name, address))
+                    gpuaas_ssh.forget_host_key(address)
+            volumes = gpuaas_models.model_volumes(conn, server)
+            conn.compute.delete_server(server)
+            print("[%s] delete requested" % server.name)
+            gpuaas_models.delete_volumes(conn, volumes)
+            for volume in volumes:
+                print("[%s] deleted model volume %s" % (server.name, volume.name))
+        except Exception as e:
+            print("[%s] delete failed: %s" % (server.name, e))
+            return server.id, e
+        return server.id, None
+
+    if not servers:
+        return {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(servers)))) as pool:
+        return dict(pool.map(delete, servers))
+
+
+def watch_servers(conn, server_ids, until=WATCH_UNTIL, interval=WATCH_INTERVAL, max_interval=WATCH_MAX_INTERVAL,
+                  timeout=WATCH_TIMEOUT):
+    # generator yielding (server, old_status, new_status) for every status transition of the watched servers
+    #
+    # Every tick issues a single (batched) server list call for all servers, task states like "spawning" are
+    # included in the status to give some visibility during BUILD. Watching ends when all servers reached
+    # one of the statuses in until or vanished from the list (reported with the last seen server as DELETED, servers
+    # never listed are not reported).
+    #
+    # If server_ids is a set, IDs added to it while iterating (e.g., servers created again with another flavor)
+    # are watched from the next tick on, IDs removed from it are no longer watched.
+    watched = server_ids if isinstance(server_ids, set) else set(server_ids)
+    pending = set()
+    states = {}
+    servers = {}
+    deadline = time.monotonic() + timeout
+    delay = interval
+
+    while True:
+        for server_id in watched - states.keys():
+            states[server_id] = None
+            pending.add(server_id)
+        pending &= watched
+        if not pending:
+            break
+        changed = False
+        listed = set()
+
+        for server in conn.compute.servers(details=True):
+            if server.id not in states:
+                continue
+            listed.add(server.id)
+            servers[server.id] = server
+
+            state = server.status
+            if server.status not in until and getattr(server, "task_state", None):
+                state = "%s (%s)" % (server.status, server.task_state)
+            if state != states[server.id]:
+                old, states[server.id] = states[server.id], state
+                changed = True
+                if server.id in pending and server.status in until:
+                    pending.discard(server.id)
+                yield server, old, state
+
+        for server_id in pending - listed:
+            if states[server_id] is None:
+                # already gone before the first list call, nothing to report
+                states[server_id] = "DELETED"
+                pending.discard(server_id)
+                continue
+            old, states[server_id] = states[server_id], "DELETED"
+            pending.discard(server_id)
+            changed = True
+            yield servers[server_id], old, "DELETED"
+
+        if not pending and not watched - states.keys():
+            break
+        if time.monotonic() > deadline:
+            raise TimeoutError("timeout waiting for servers %s" % ", ".join(sorted(pending)))
+
+        delay = interval if changed else min(delay * 2, max_interval)
+        time.sleep(delay)
+
+
+def attach_public_ip(conn, server, fip_pool=None):
+    # associate a floating IP of fip_pool (see gpuaas_fip.py) with an ACTIVE server, without fip_pool a new one is
+    # allocated and attached like create_server(auto_ip=True) does after waiting
+    if fip_pool is not None:
+        server.public_v4 = fip_pool.associate(server)
+        return server
+    server = conn.add_ips_to_server(server, auto_ip=True, wait=True)
+    if not getattr(server, "public_v4", None):
+        server = conn.get_server(server.id)
+    return server
+
+
+def start_instances(conn, names, ssh_privkey, max_workers=MAX_WORKERS, wait=True, resolver=None, timeline=None,
+                    ready_check=None, fallback_flavors=(), warm_servers=(), fip_pool=None, **create_kwargs):
+    # create all instances without blocking, print their IDs and (if wait is True) watch them until they are
+    # ACTIVE or ERROR, attaching a floating IP (of fip_pool if given) to every server as soon as it is ACTIVE
+    #
+    # Servers that could not be scheduled (e.g., NoValidHost as all GPUs are taken) are deleted and created again
+    # right away using the next flavor in fallback_flavors, see gpuaas_placement.py.
+    #
+    # The first instances are taken from warm_servers (shelved servers of a warm pool, see gpuaas_pool.py) if given,
+    # these are unshelved instead of created. If unshelving fails, a new server is created instead.
+    #
+    # ready_check(server, timeline) is called afterwards (concurrently for all instances) to wait until the guest
+    # is usable, see gpuaas_ready.py. The phases of every instance are recorded in a copy of timeline.
+    #
+    # returns a list of LaunchResult in the order of names
+    timeline = timeline or gpuaas_timing.Timeline()
+    timelines = {name: timeline.fork(name) for name in names}
+    fallbacks = {name: list(fallback_flavors) for name in names}
+
+    def print_created(result):
+        timelines[result.name].mark("create")
+        if result.error:
+            print("[%s] create failed: %s" % (result.name, result.error))
+        else:
+            print("[%s] created server %s" % (result.name, result.server.id))
+
+    reused = dict(zip(names, warm_servers))
+    # IDs of servers with a requested unshelve that did not reach ACTIVE yet
+    unshelving = set()
+    created = []
+    if reused:
+        for name, server in gpuaas_pool.unshelve_all(conn, list(reused.values()), list(reused)).items():
+            timelines[name].mark("unshelve")
+            if isinstance(server, Exception):
+                print("[%s] unshelve failed (%s), creating a new server" % (name, server))
+                del reused[name]
+            else:
+                print("[%s] unshelving server %s from warm pool" % (name, server.id))
+                unshelving.add(server.id)
+                timelines[name].labels["flavor"] = gpuaas_pool.flavor_name(server) or timelines[name].labels.get("flavor")
+                created.append(LaunchResult(name, server, None, 0))
+    created += launch_fleet(conn, [n for n in names if n not in reused], max_workers=max_workers,
+                            on_result=print_created, resolver=resolver, wait=False, auto_ip=False, **create_kwargs)
+    results = {r.name: r._replace(timeline=timelines[r.name]) for r in created}
+    if not wait:
+        return [results[name] for name in names]
+
+    start = time.monotonic()
+    names_by_id = {r.server.id: r.name for r in created if not r.error}
+    watched = set(names_by_id)
+    attaching = {}
+
+    def recreate(name, **kwargs):
+        # resources looked up again by launch_fleet after a stale cache entry are used here as well
+        new_server = create_server(conn, name, dict(create_kwargs, wait=False, auto_ip=False, **kwargs), resolver)
+        names_by_id[new_server.id] = name
+        watched.add(new_server.id)
+
+    def reschedule(name, server, fault):
+        # create the server again using the next fallback flavor, returns False if there is none left
+        if not fallbacks[name] or not gpuaas_placement.is_scheduling_error(fault):
+            return False
+        flavor = fallbacks[name].pop(0)
+        print("[%s] %s, retrying with flavor %s" % (name, fault, flavor.name))
+        # the deleted server must not be reported as DELETED for name anymore
+        watched.discard(server.id)
+        conn.delete_server(server.id)
+        recreate(name, flavor=flavor)
+        timelines[name].labels["flavor"] = flavor.name
+        timelines[name].mark("reschedule")
+        return True
+
+    def attach(name, server):
+        if server.id in unshelving:
+            # pool members are renamed only after unshelving succeeded
+            unshelving.discard(server.id)
+            server = gpuaas_pool.rename(conn, server, name)
+        server = attach_public_ip(conn, server, fip_pool)
+        timelines[name].mark("floating_ip")
+        gpuaas_ssh.check_host_key(server.public_v4, server.id)
+        if ready_check:
+            print("[%s] ACTIVE with IP %s, waiting for the instance to be ready ..." % (name, server.public_v4))
+            ready_check(server, timelines[name])
+        result = LaunchResult(name, server, None, time.monotonic() - start, timelines[name])
+        print("[%s] ready after %.0fs, login using: ssh -i %s ubuntu@%s" % (
+          name, timelines[name].total(), ssh_privkey, server.public_v4))
+        return result
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(names))) as pool:
+        try:
+            for server, old, new in watch_servers(conn, watched):
+                name = names_by_id[server.id]
+                print("[%s] %s -> %s" % (name, old or "-", new))
+                if new == "ACTIVE":
+                    timelines[name].mark("build")
+                    attaching[name] = pool.submit(attach, name, server)
+                elif new in gpuaas_pool.SHELVED_STATUSES and server.id in unshelving:
+                    # still or again shelved without task state (new would be, e.g., "SHELVED_OFFLOADED (unshelving)"
+                    # otherwise) after unshelving was requested: the unshelve failed (e.g., no free GPUs), the server
+                    # stays in the pool under its pool name
+                    print("[%s] unshelve of %s failed, creating a new server" % (name, server.id))
+                    unshelving.discard(server.id)
+                    watched.discard(server.id)
+                    try:
+                        recreate(name)
+                    except Exception as e:
+                        results[name] = LaunchResult(name, server, e, time.monotonic() - start, timelines[name])
+                elif new in ("ERROR", "DELETED"):
+                    fault = (getattr(server, "fault", None) or {}).get("message", "server %s" % new.lower())
+                    try:
+                        if new == "ERROR" and reschedule(name, server, fault):
+                            continue
+                    except Exception as e:
+                        fault = "%s, retry failed: %s" % (fault, e)
+                    results[name] = LaunchResult(name, server, RuntimeError(fault), time.monotonic() - start,
+                                                 timelines[name])
+        except TimeoutError as e:
+            for name in names_by_id.values():
+                if name not in attaching and not results[name].error:
+                    results[name] = results[name]._replace(error=e, duration=time.monotonic() - start)
+
+        for name, future in attaching.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                print("[%s] failed: %s" % (name, e))
+                results[name] = results[name]._replace(error=e, duration=time.monotonic() - start)
+
+    return [results[name] for name in names]
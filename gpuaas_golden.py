@@ -0,0 +1,127 @@
+# golden images for the start scripts in the OpenStack environment of NetLab - Hochschule Fulda
+#
+# Installing the NVIDIA driver, Docker, NVIDIA Container Toolkit etc. using USERDATA takes 15-20 minutes. In bake mode
+# the start scripts boot an instance with their USERDATA, wait until cloud-init created the sentinel file and the
+# instance rebooted, and snapshot it into an image tagged with a hash of USERDATA and the base image. The next start
+# with the same USERDATA boots from this image and only needs GOLDEN_USERDATA to signal that it is up.
+
+import hashlib
+import time
+
+import gpuaas_fleet
+import gpuaas_ssh
+
+
+
+###########################
+#
+# Config
+#
+###########################
+
+GOLDEN_IMAGE_PREFIX = "gpuaas-golden"
+GOLDEN_IMAGE_TAG_PREFIX = "gpuaas-userdata-"
+
+# created by the last runcmd step of USERDATA in the start scripts
+SENTINEL_FILE = "/root/cloud-init-script-ran-successfully"
+
+# everything else is already contained in the golden image, e.g., the @reboot entries in /etc/crontab
+GOLDEN_USERDATA = """
+#cloud-config
+runcmd:
+  - touch %s
+""" % SENTINEL_FILE
+
+# results of the bake instance's own runs removed before the snapshot, otherwise every instance booted from the
+# golden image would start with them, e.g., gpu-burn results of the @reboot job of the gpuburn profile, which would
+# be collected (collect-gpuburn-results.py, benchmark-gpuburn-matrix.py) as results of the new instance
+BAKE_CLEANUP_FILES = ["/home/ubuntu/gpu-burn/gpu-burn-results_*.log"]
+
+BAKE_TIMEOUT = 3600
+BAKE_POLL_INTERVAL = 20
+
+
+
+###########################
+#
+# Code
+#
+###########################
+
+def userdata_hash(userdata, base_image_name):
+    return hashlib.sha256(("%s\0%s" % (base_image_name, userdata)).encode()).hexdigest()
+
+
+def image_tag(digest):
+    return GOLDEN_IMAGE_TAG_PREFIX + digest[:32]
+
+
+def find_golden_image(conn, digest):
+    # newest active golden image baked from the same base image and USERDATA, or None
+    images = [i for i in conn.image.images(tag=image_tag(digest)) if i.status == "active"]
+    if not images:
+        return None
+    return max(images, key=lambda i: i.created_at or "")
+
+
+def wait_for_provisioning(host, key, timeout=BAKE_TIMEOUT):
+    # wait until the sentinel file exists and the instance was rebooted afterwards (last runcmd step in USERDATA) or,
+    # for USERDATA only rebooting if required (see gpuaas_userdata.py), cloud-init is done
+    deadline = time.monotonic() + timeout
+    command = ("sudo stat -c %%Y %s && date +%%s && cut -d. -f1 /proc/uptime && "
+               "(cloud-init status 2>/dev/null | grep -c 'status: done' || true)" % SENTINEL_FILE)
+    status = None
+    while time.monotonic() < deadline:
+        code, out, err = gpuaas_ssh.ssh_run(host, command, key=key)
+        if code == 0:
+            sentinel_mtime, now, uptime, done = (int(v) for v in out.split())
+            if now - uptime > sentinel_mtime or done:
+                return
+            new_status = "cloud-init finished, waiting for reboot"
+        elif code == 255:
+            new_status = "waiting for ssh"
+        else:
+            new_status = "waiting for cloud-init"
+        if new_status != status:
+            status = new_status
+            print("[%s] %s ..." % (host, status))
+        time.sleep(BAKE_POLL_INTERVAL)
+    raise TimeoutError("%s not provisioned after %ds" % (host, timeout))
+
+
+def bake(conn, server, digest, base_image_name, key=None, delete_server=True, before_snapshot=None, metadata=None):
+    # snapshot a provisioned server into a golden image for digest, returns the image
+    #
+    # before_snapshot(server) is called once the server is provisioned, e.g., to add Ollama models to the image,
+    # metadata is added to the image properties
+    host = server.public_v4
+    wait_for_provisioning(host, key)
+    if before_snapshot:
+        before_snapshot(server)
+
+    # new instances create the sentinel again using GOLDEN_USERDATA
+    code, out, err = gpuaas_ssh.ssh_run(host, "sudo rm -f %s %s && sync" % (SENTINEL_FILE, " ".join(BAKE_CLEANUP_FILES)),
+                                        key=key)
+    if code != 0:
+        raise RuntimeError("cannot clean up %s before the snapshot: %s" % (server.name, err.strip()))
+
+    print("[%s] stopping server for snapshot ..." % server.name)
+    conn.compute.stop_server(server)
+    status = None
+    for s, old, status in gpuaas_fleet.watch_servers(conn, [server.id], until=("SHUTOFF", "ERROR")):
+        pass
+    if status != "SHUTOFF":
+        raise RuntimeError("server %s is %s instead of SHUTOFF" % (server.name, status))
+
+    name = "%s-%s-%s" % (GOLDEN_IMAGE_PREFIX, digest[:12], time.strftime("%Y%m%d%H%M%S"))
+    print("[%s] creating image %s ..." % (server.name, name))
+    image = conn.compute.create_server_image(server, name, metadata={
+        "gpuaas_userdata_sha256": digest,
+        "gpuaas_base_image": base_image_name,
+        "gpuaas_version": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        **(metadata or {})}, wait=True, timeout=BAKE_TIMEOUT)
+    conn.image.add_tag(image, image_tag(digest))
+
+    if delete_server:
+        conn.delete_server(server.id)
+    return image
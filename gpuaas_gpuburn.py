@@ -0,0 +1,155 @@
+# gpu-burn result parsing for instances started by start-gpuburn-openstack-instance.py
+#
+# The @reboot crontab of the instance appends the output of gpu-burn to gpu-burn-results_<timestamp>.log in
+# /home/ubuntu/gpu-burn. parse_log() turns such a log, read line by line (e.g., streamed from ssh), into one record
+# per GPU holding the Gflop/s, error count and temperature samples of the progress lines and the final OK/FAULTY
+# result of gpu-burn. Progress lines look like:
+#
+#   53.3%  proc'd: 1620 (4794 Gflop/s) - 1612 (4801 Gflop/s)   errors: 0 - 0   temps: 65 C - 63 C
+#
+# and the run ends with "Tested 2 GPUs:" followed by "GPU 0: OK" lines.
+
+import csv
+import itertools
+import json
+import re
+
+import gpuaas_ssh
+
+
+
+###########################
+#
+# Config
+#
+###########################
+
+GPUBURN_LOG_DIR = "/home/ubuntu/gpu-burn"
+GPUBURN_LOG_GLOB = "gpu-burn-results_*.log"
+
+# every log is preceded by a header line, so multiple logs can be streamed using one ssh command
+LOG_HEADER = "==> "
+FETCH_COMMAND = "cd %s && for f in $(ls %s 2>/dev/null | sort%s); do echo '%s'$f; cat $f; done"
+
+CSV_FIELDS = ["instance", "log", "gpu", "percent", "gflops", "errors", "temp"]
+
+
+
+###########################
+#
+# Code
+#
+###########################
+
+PROGRESS_RE = re.compile(r"([\d.]+)%\s+proc'd:(.*?)errors:(.*?)(?:temps:(.*))?$")
+GFLOPS_RE = re.compile(r"\(([\d.]+) Gflop/s\)")
+DEVICE_RE = re.compile(r"^GPU (\d+): (.+?)(?: \(UUID: (\S+)\))?$")
+RESULT_RE = re.compile(r"^GPU (\d+): (OK|FAULTY)$")
+
+
+def _numbers(text):
+    # "0 - 3  (WARNING!)" -> [0, 3], "65 C - -- C" -> [65, None]
+    return [int(v) if v.isdigit() else None for v in (p.strip().split(" ")[0] for p in text.split(" - ")) if v]
+
+
+def new_record(gpu):
+    return {"gpu": gpu, "name": None, "uuid": None, "samples": [], "result": None}
+
+
+def parse_log(lines):
+    # parse gpu-burn output, returns the list of per-GPU records, samples are [percent, gflops, errors, temp]
+    records = {}
+
+    def record(gpu):
+        return records.setdefault(gpu, new_record(gpu))
+
+    tested = False
+    for line in lines:
+        # gpu-burn redraws its progress line using carriage returns if the output is a terminal
+        for line in line.split("\r"):
+            line = line.strip()
+            m = PROGRESS_RE.search(line)
+            if m:
+                gflops = [float(v) for v in GFLOPS_RE.findall(m.group(2))]
+                errors = _numbers(m.group(3))
+                temps = _numbers(m.group(4) or "")
+                for gpu, value in enumerate(gflops):
+                    record(gpu)["samples"].append([
+                      float(m.group(1)), value,
+                      errors[gpu] if gpu < len(errors) else None,
+                      temps[gpu] if gpu < len(temps) else None])
+                continue
+            if line.startswith("Tested "):
+                tested = True
+                continue
+            m = RESULT_RE.match(line)
+            if m and tested:
+                record(int(m.group(1)))["result"] = m.group(2)
+                continue
+            m = DEVICE_RE.match(line)
+            if m and not tested:
+                r = record(int(m.group(1)))
+                r["name"], r["uuid"] = m.group(2), m.group(3)
+
+    return [records[gpu] for gpu in sorted(records)]
+
+
+def fetch_logs(host, key=None, latest=False):
+    # stream the gpu-burn logs of host over ssh and parse them one after another without keeping them in memory,
+    # returns [(log name, records)], only the latest log if latest is True
+    command = FETCH_COMMAND % (GPUBURN_LOG_DIR, GPUBURN_LOG_GLOB, " | tail -n 1" if latest else "", LOG_HEADER)
+    log = [None]
+
+    def log_name(line):
+        if line.startswith(LOG_HEADER):
+            log[0] = line[len(LOG_HEADER):].strip()
+        return log[0]
+
+    return [(name, parse_log(lines))
+            for name, lines in itertools.groupby(gpuaas_ssh.ssh_lines(host, command, key=key), log_name)
+            if name is not None]
+
+
+def finished(records):
+    # True if gpu-burn printed its result for all GPUs
+    return bool(records) and all(r["result"] for r in records)
+
+
+def summarize(record):
+    # summary of a per-GPU record: max/mean/sustained Gflop/s, max temperature, errors and result (None if gpu-burn is still
+    # running or the log is incomplete)
+    samples = record["samples"]
+    gflops = [s[1] for s in samples if s[1] > 0]
+    # the second half of the run, after clocks and temperatures settled
+    sustained = [s[1] for s in samples if s[1] > 0 and s[0] >= 50]
+    temps = [s[3] for s in samples if s[3] is not None]
+    errors = [s[2] for s in samples if s[2] is not None]
+    return {
+        "gpu": record["gpu"],
+        "name": record["name"],
+        "uuid": record["uuid"],
+        "samples": len(samples),
+        "gflops_max": max(gflops) if gflops else None,
+        "gflops_mean": round(sum(gflops) / len(gflops), 1) if gflops else None,
+        "gflops_sustained": round(sum(sustained) / len(sustained), 1) if sustained else None,
+        "temp_max": max(temps) if temps else None,
+        "errors": max(errors) if errors else 0,
+        "result": record["result"],
+    }
+
+
+def write_json(path, results):
+    # results: list of {"instance": ..., "log": ..., "gpus": [record, ...]}, written compactly
+    with open(path, "w") as f:
+        json.dump(results, f, separators=(",", ":"))
+
+
+def write_csv(path, results):
+    # one row per sample
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDS)
+        for result in results:
+            for record in result["gpus"]:
+                for percent, gflops, errors, temp in record["samples"]:
+                    writer.writerow([result["instance"], result["log"], record["gpu"], percent, gflops, errors, temp])
@@ -0,0 +1,317 @@
+# persistent GPU job queue for the OpenStack environment of NetLab - Hochschule Fulda, see gpu-jobs.py
+#
+# Jobs (container image, command, number of GPUs, max. runtime) are stored in a sqlite database in ~/.cache/hfd-gpuaas
+# and run as Docker containers pinned to free GPUs (--gpus device=...) of already provisioned worker instances. Jobs
+# are placed in submission order on the worker with the fewest free GPUs that still fit (best fit), so large jobs
+# find free workers and small jobs fill the gaps. Only jobs that do not fit on any worker lead to new instances,
+# the number and size of which is found by packing the remaining jobs first fit decreasing.
+#
+# Workers are members of a warm pool (see gpuaas_pool.py). The cloud shelves instances automatically after one week,
+# killing running jobs, so a job is only placed on a worker if it can finish (max. runtime) before that. Idle workers
+# are shelved back into the pool by the scheduler and unshelved (which starts a new week) when jobs need them again,
+# so their provisioning is paid only once. Jobs of workers that were shelved or deleted anyway are queued again.
+
+import datetime
+import os
+import re
+import shlex
+import sqlite3
+import time
+
+import gpuaas_cache
+import gpuaas_ssh
+
+
+
+###########################
+#
+# Config
+#
+###########################
+
+JOBS_DB_FILE = os.environ.get("GPUAAS_JOBS_DB") or "jobs.sqlite"
+JOB_LOG_DIR = "job-logs"
+
+# instances are shelved automatically by the cloud after running for one week
+SHELVE_LIMIT = 7 * 24 * 3600
+# jobs are not placed on workers that are shelved sooner than max. runtime + SHELVE_MARGIN, idle workers are
+# shelved by the scheduler at the latest SHELVE_MARGIN before the limit
+SHELVE_MARGIN = 3600
+
+DEFAULT_MAX_RUNTIME = 24 * 3600
+
+# containers of jobs are named and labeled by the job ID
+JOB_CONTAINER_PREFIX = "gpuaas-job-"
+JOB_LABEL = "gpuaas_job"
+
+# jobs of workers that vanished are queued again up to this many times
+MAX_ATTEMPTS = 3
+
+JOB_STATUSES = ("queued", "running", "done", "failed", "cancelled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    image TEXT NOT NULL,
+    command TEXT,
+    gpus INTEGER NOT NULL,
+    max_runtime INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    worker TEXT,
+    devices TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    submitted REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    exit_code INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+CREATE TABLE IF NOT EXISTS workers (
+    name TEXT PRIMARY KEY,
+    server_id TEXT NOT NULL,
+    address TEXT NOT NULL,
+    gpus INTEGER NOT NULL,
+    active_since REAL NOT NULL,
+    last_busy REAL NOT NULL
+);
+"""
+
+# lists the job containers of a worker: <job ID>\t<state>\t<status>, e.g., "12\texited\tExited (1) 5 minutes ago"
+LIST_CONTAINERS_COMMAND = ("sudo docker ps -a --filter label=%s --format '{{.Label \"%s\"}}\t{{.State}}\t{{.Status}}'"
+                           % (JOB_LABEL, JOB_LABEL))
+
+
+
+###########################
+#
+# Code
+#
+###########################
+
+def connect(path=None):
+    # open (and create) the job database, rows are sqlite3.Row
+    db = sqlite3.connect(path or gpuaas_cache.cache_path(JOBS_DB_FILE), timeout=30)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+    return db
+
+
+def submit(db, image, command=None, gpus=1, max_runtime=DEFAULT_MAX_RUNTIME, name=None, max_gpus=None):
+    # queue a job, returns its ID, max_gpus is the number of GPUs of the largest worker that can be started
+    if gpus < 1:
+        raise ValueError("a job needs at least one GPU")
+    if max_gpus is not None and gpus > max_gpus:
+        raise ValueError("a job can use at most %d GPUs, no flavor offers more" % max_gpus)
+    if max_runtime + SHELVE_MARGIN > SHELVE_LIMIT:
+        raise ValueError("max. runtime has to be less than %dh, instances are shelved after one week"
+                         % ((SHELVE_LIMIT - SHELVE_MARGIN) // 3600))
+    with db:
+        return db.execute("INSERT INTO jobs (name, image, command, gpus, max_runtime, submitted) VALUES (?, ?, ?, ?, ?, ?)",
+                          (name, image, command, gpus, max_runtime, time.time())).lastrowid
+
+
+def jobs(db, statuses=None):
+    # jobs in submission order, optionally only those with one of statuses
+    if statuses:
+        return db.execute("SELECT * FROM jobs WHERE status IN (%s) ORDER BY id" % ",".join("?" * len(statuses)),
+                          list(statuses)).fetchall()
+    return db.execute("SELECT * FROM jobs ORDER BY id").fetchall()
+
+
+def get_job(db, job_id):
+    return db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def cancel(db, job_id):
+    # cancel a queued or running job (its container is removed by the next scheduler run), returns False if the job
+    # already finished
+    with db:
+        return db.execute("UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status IN ('queued', 'running')",
+                          (time.time(), job_id)).rowcount > 0
+
+
+def workers(db):
+    return db.execute("SELECT * FROM workers ORDER BY name").fetchall()
+
+
+def add_worker(db, name, server_id, address, gpus, active_since=None):
+    # register a provisioned (ready) worker, active_since is the time it was booted or unshelved
+    now = time.time()
+    with db:
+        db.execute("INSERT OR REPLACE INTO workers (name, server_id, address, gpus, active_since, last_busy) "
+                   "VALUES (?, ?, ?, ?, ?, ?)", (name, server_id, address, gpus, active_since or now, now))
+
+
+def remove_worker(db, name, reason):
+    # forget a worker that was shelved or deleted, its running jobs are queued again (or fail after MAX_ATTEMPTS)
+    with db:
+        for job in db.execute("SELECT * FROM jobs WHERE status = 'running' AND worker = ?", (name,)).fetchall():
+            if job["attempts"] < MAX_ATTEMPTS:
+                db.execute("UPDATE jobs SET status = 'queued', worker = NULL, devices = NULL, started = NULL "
+                           "WHERE id = ?", (job["id"],))
+                print("[job %d] worker %s %s, queued again" % (job["id"], name, reason))
+            else:
+                db.execute("UPDATE jobs SET status = 'failed', finished = ?, error = ? WHERE id = ?",
+                           (time.time(), "worker %s %s" % (name, reason), job["id"]))
+        db.execute("DELETE FROM workers WHERE name = ?", (name,))
+
+
+def launched_at(server):
+    # time the server was launched (or unshelved) according to Nova, None if unknown
+    try:
+        return datetime.datetime.fromisoformat(server.launched_at).replace(tzinfo=datetime.timezone.utc).timestamp()
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def free_devices(worker, running):
+    # GPU indices of worker not used by the running jobs
+    used = {int(d) for job in running if job["worker"] == worker["name"] for d in job["devices"].split(",")}
+    return [d for d in range(worker["gpus"]) if d not in used]
+
+
+def expires(worker):
+    # time the cloud shelves worker
+    return worker["active_since"] + SHELVE_LIMIT
+
+
+def plan(queued, workers, running, now=None):
+    # place queued jobs (in order) on workers, returns ([(job, worker, devices)], unplaced jobs)
+    #
+    # Every job goes to the worker with the fewest free GPUs that fit and that runs long enough to finish the job
+    # before it is shelved.
+    now = now or time.time()
+    free = {w["name"]: free_devices(w, running) for w in workers}
+    placements, unplaced = [], []
+    for job in queued:
+        candidates = [w for w in workers if len(free[w["name"]]) >= job["gpus"]
+                      and expires(w) - now >= job["max_runtime"] + SHELVE_MARGIN]
+        if not candidates:
+            unplaced.append(job)
+            continue
+        worker = min(candidates, key=lambda w: (len(free[w["name"]]), w["name"]))
+        devices, free[worker["name"]] = free[worker["name"]][:job["gpus"]], free[worker["name"]][job["gpus"]:]
+        placements.append((job, worker, devices))
+    return placements, unplaced
+
+
+def plan_instances(jobs, gpus_per_instance=1):
+    # number of GPUs of the instances needed for jobs, packed first fit decreasing into instances with
+    # gpus_per_instance GPUs (or more for larger jobs)
+    bins = []
+    for job in sorted(jobs, key=lambda j: -j["gpus"]):
+        for i, free in enumerate(bins):
+            if free[1] >= job["gpus"]:
+                bins[i] = (free[0], free[1] - job["gpus"])
+                break
+        else:
+            size = max(gpus_per_instance, job["gpus"])
+            bins.append((size, size - job["gpus"]))
+    return [size for size, free in bins]
+
+
+def container_name(job_id):
+    return "%s%d" % (JOB_CONTAINER_PREFIX, job_id)
+
+
+def run_command(job, devices):
+    # docker run command starting job in the background pinned to devices
+    command = ["sudo", "docker", "run", "-d", "--name", container_name(job["id"]), "--label", "%s=%d" % (JOB_LABEL, job["id"]),
+               "--gpus", '"device=%s"' % ",".join(str(d) for d in devices), job["image"]]
+    if job["command"]:
+        command += ["sh", "-c", job["command"]]
+    return " ".join(shlex.quote(c) for c in command)
+
+
+def start_job(db, job, worker, devices, key=None):
+    # start job on worker, marks it running (or failed if docker run fails)
+    devices = ",".join(str(d) for d in devices)
+    code, out, err = gpuaas_ssh.ssh_run(worker["address"], run_command(job, devices.split(",")), key=key, timeout=600)
+    now = time.time()
+    with db:
+        if code == 0:
+            db.execute("UPDATE jobs SET status = 'running', worker = ?, devices = ?, started = ?, attempts = attempts + 1 "
+                       "WHERE id = ?", (worker["name"], devices, now, job["id"]))
+            db.execute("UPDATE workers SET last_busy = ? WHERE name = ?", (now, worker["name"]))
+        elif code == 255:
+            # worker not reachable, the job stays queued
+            raise RuntimeError("cannot start job %d on %s: %s" % (job["id"], worker["name"], err.strip()))
+        else:
+            db.execute("UPDATE jobs SET status = 'failed', worker = ?, finished = ?, error = ? WHERE id = ?",
+                       (worker["name"], now, err.strip()[-500:] or "docker run failed", job["id"]))
+    return code == 0
+
+
+def list_containers(worker, key=None):
+    # {job ID: (state, exit code or None)} of the job containers on worker
+    code, out, err = gpuaas_ssh.ssh_run(worker["address"], LIST_CONTAINERS_COMMAND, key=key)
+    if code != 0:
+        raise RuntimeError("cannot list containers on %s: %s" % (worker["name"], err.strip()))
+    containers = {}
+    for line in out.splitlines():
+        fields = line.split("\t")
+        if len(fields) != 3 or not fields[0].isdigit():
+            continue
+        m = re.match(r"Exited \((-?\d+)\)", fields[2])
+        containers[int(fields[0])] = (fields[1], int(m.group(1)) if m else None)
+    return containers
+
+
+def log_path(job_id):
+    return os.path.join(gpuaas_cache.cache_path(JOB_LOG_DIR), "%d.log" % job_id)
+
+
+def collect_job(worker, job_id, key=None, keep_log=True):
+    # store the output of a job container in log_path() and remove the container
+    name = container_name(job_id)
+    if keep_log:
+        code, out, err = gpuaas_ssh.ssh_run(worker["address"], "sudo docker logs %s 2>&1" % name, key=key, timeout=600)
+        if code == 0:
+            os.makedirs(os.path.dirname(log_path(job_id)), exist_ok=True)
+            with open(log_path(job_id), "w") as f:
+                f.write(out)
+    gpuaas_ssh.ssh_run(worker["address"], "sudo docker rm -f %s" % name, key=key)
+
+
+def update_worker(db, worker, containers, key=None, now=None):
+    # update the jobs of worker from its containers ({job ID: (state, exit code)}, see list_containers()): finished
+    # jobs are done/failed, jobs exceeding their max. runtime are stopped and containers of cancelled jobs removed
+    now = now or time.time()
+    running = [j for j in jobs(db, ["running"]) if j["worker"] == worker["name"]]
+    for job in running:
+        state, exit_code = containers.pop(job["id"], (None, None))
+        if state == "running" and now - job["started"] <= job["max_runtime"]:
+            continue
+        if state is None:
+            status, error = "failed", "container vanished"
+        elif state == "running":
+            status, error = "failed", "max. runtime of %ds exceeded" % job["max_runtime"]
+        elif state == "exited":
+            status, error = ("done", None) if exit_code == 0 else ("failed", "exit code %s" % exit_code)
+        else:
+            # created, restarting, paused, ... are still running
+            continue
+        if state is not None:
+            collect_job(worker, job["id"], key)
+        with db:
+            db.execute("UPDATE jobs SET status = ?, finished = ?, exit_code = ?, error = ? WHERE id = ?",
+                       (status, now, exit_code, error, job["id"]))
+        print("[job %d] %s on %s%s" % (job["id"], status, worker["name"], ": %s" % error if error else ""))
+
+    # containers of cancelled (or otherwise no longer running) jobs
+    for job_id in containers:
+        collect_job(worker, job_id, key, keep_log=False)
+
+    if running:
+        with db:
+            db.execute("UPDATE workers SET last_busy = ? WHERE name = ?", (now, worker["name"]))
+
+
+def idle_workers(db, idle_timeout, now=None):
+    # workers without running jobs that are idle for idle_timeout seconds or would be shelved by the cloud soon
+    now = now or time.time()
+    busy = {j["worker"] for j in jobs(db, ["running"])}
+    return [w for w in workers(db) if w["name"] not in busy
+            and (now - w["last_busy"] >= idle_timeout or expires(w) - now < SHELVE_MARGIN)]
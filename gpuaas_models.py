@@ -0,0 +1,178 @@
+# Ollama model pre-seeding for instances started by start-nvidia-ollama-mutligpu-openstack-instance.py
+#
+# New instances start with an empty "ollama" Docker volume and would have to pull multi-GB models before the first
+# request. Instead the models can come from
+#
+# - a Cinder volume holding an Ollama model store (models/manifests, models/blobs), e.g., filled on a running
+#   instance: the volume is cloned for every instance (copy-on-write on Ceph, so this is fast), attached and mounted
+#   as the data directory of the "ollama" Docker volume, or
+# - a golden image (see gpuaas_golden.py) baked with --models, already containing the models.
+#
+# Either way the requested models are verified inside the instance: the manifest has to exist and every blob it
+# references has to exist and, as blobs are named by their sha256 digest, hash to its name (or at least have the
+# size given in the manifest). Corrupt blobs are removed and only missing or corrupt models are pulled using the
+# Ollama API.
+
+import concurrent.futures
+import http.client
+import json
+
+import gpuaas_ollama
+import gpuaas_ssh
+
+
+
+###########################
+#
+# Config
+#
+###########################
+
+# data directory of the "ollama" Docker volume mounted at /root/.ollama in the Ollama containers
+OLLAMA_DATA_DIR = "/var/lib/docker/volumes/ollama/_data"
+
+# cloned model volumes are marked by this metadata key (value: the source volume) and deleted together with their
+# instance by terminate-nvidia-openstack-instance.py
+MODEL_VOLUME_METADATA_KEY = "gpuaas_model_volume"
+
+MODEL_VOLUME_TIMEOUT = 600
+PULL_TIMEOUT = 3600
+
+# runs inside the instance using sudo, mounts the attached model volume (device by volume ID) as OLLAMA_DATA_DIR
+# while the Ollama containers are stopped and adds it to /etc/fstab for later boots
+MOUNT_SCRIPT = """
+DEV=/dev/disk/by-id/virtio-$(echo "$1" | cut -c1-20)
+DATA=%s
+for i in $(seq 120); do [ -e $DEV ] && break; sleep 1; done
+[ -e $DEV ] || { echo "volume $1 not found" >&2; exit 1; }
+mountpoint -q $DATA && exit 0
+CONTAINERS=$(docker ps -q --filter ancestor=ollama/ollama)
+[ -n "$CONTAINERS" ] && docker stop $CONTAINERS >/dev/null
+mkdir -p $DATA
+mount $DEV $DATA || exit 1
+grep -q " $DATA " /etc/fstab || echo "UUID=$(blkid -s UUID -o value $DEV) $DATA auto defaults,nofail 0 2" >> /etc/fstab
+[ -n "$CONTAINERS" ] && docker start $CONTAINERS >/dev/null
+exit 0
+"""
+
+# runs inside the instance using sudo: python3 - <check> <models dir> <model>..., prints {model: status} with status
+# ok, missing or corrupt
+VERIFY_SCRIPT = """
+import hashlib, json, os, sys
+
+check, root, models = sys.argv[1], sys.argv[2], sys.argv[3:]
+result = {}
+for model in models:
+    name, _, tag = model.partition(":")
+    if "/" not in name:
+        name = "library/" + name
+    try:
+        with open(os.path.join(root, "manifests", "registry.ollama.ai", name, tag or "latest")) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        result[model] = "missing"
+        continue
+    result[model] = "ok"
+    for layer in [manifest["config"]] + manifest["layers"]:
+        blob = os.path.join(root, "blobs", layer["digest"].replace(":", "-"))
+        try:
+            size = os.path.getsize(blob)
+        except OSError:
+            result[model] = "missing"
+            break
+        if check == "sha256" and size == layer.get("size", size):
+            h = hashlib.sha256()
+            with open(blob, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 22), b""):
+                    h.update(chunk)
+            ok = "sha256:" + h.hexdigest() == layer["digest"]
+        else:
+            ok = size == layer.get("size", size)
+        if not ok:
+            # pulled again
+            os.remove(blob)
+            result[model] = "corrupt"
+            break
+print(json.dumps(result))
+"""
+
+
+
+###########################
+#
+# Code
+#
+###########################
+
+def clone_volume(conn, source_name, name):
+    # clone the model volume source_name for an instance, returns the new volume (creating, see wait_for_volume())
+    source = conn.block_storage.find_volume(source_name, ignore_missing=False)
+    return conn.block_storage.create_volume(name=name, size=source.size, source_volume_id=source.id,
+                                            description="Ollama models cloned from %s" % source_name,
+                                            metadata={MODEL_VOLUME_METADATA_KEY: source_name})
+
+
+def wait_for_volume(conn, volume):
+    return conn.block_storage.wait_for_status(volume, "available", failures=["error"], wait=MODEL_VOLUME_TIMEOUT)
+
+
+def mount_model_volume(conn, server, volume, key=None):
+    # attach volume to server and mount it as data directory of the ollama Docker volume
+    conn.attach_volume(server, volume, wait=True, timeout=MODEL_VOLUME_TIMEOUT)
+    code, out, err = gpuaas_ssh.ssh_script(server.public_v4, MOUNT_SCRIPT % OLLAMA_DATA_DIR, args=[volume.id], key=key,
+                                           timeout=MODEL_VOLUME_TIMEOUT)
+    if code != 0:
+        raise RuntimeError("cannot mount model volume %s: %s" % (volume.name, err.strip()))
+
+
+def model_volumes(conn, server):
+    # cloned model volumes attached to server, one volume list call instead of one get_volume per attachment
+    attached = {v["id"] for v in (server.attached_volumes or [])}
+    if not attached:
+        return []
+    return [v for v in conn.block_storage.volumes(details=True)
+            if v.id in attached and MODEL_VOLUME_METADATA_KEY in (v.metadata or {})]
+
+
+def delete_volumes(conn, volumes):
+    # delete volumes as soon as they are detached from their (deleted) server
+    for volume in volumes:
+        conn.block_storage.wait_for_status(volume, "available", failures=["error"], wait=MODEL_VOLUME_TIMEOUT)
+        conn.block_storage.delete_volume(volume)
+
+
+def verify_models(host, models, key=None, check="sha256"):
+    # {model: "ok" | "missing" | "corrupt"} of the model store inside the instance
+    code, out, err = gpuaas_ssh.ssh_script(host, VERIFY_SCRIPT, args=[check, OLLAMA_DATA_DIR + "/models"] + list(models),
+                                           key=key, interpreter="python3", timeout=PULL_TIMEOUT)
+    if code != 0:
+        raise RuntimeError("cannot verify models: %s" % err.strip())
+    return json.loads(out)
+
+
+def pull_model(host, model, timeout=PULL_TIMEOUT):
+    # pull model using the Ollama API of host
+    host, port = gpuaas_ollama.parse_url(host)
+    connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        connection.request("POST", "/api/pull", json.dumps({"model": model, "stream": False}),
+                           {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        body = response.read().decode(errors="replace")
+    finally:
+        connection.close()
+    if response.status != 200:
+        raise RuntimeError("pulling %s failed (HTTP %d): %s" % (model, response.status, body.strip()[:200]))
+
+
+def seed_models(host, models, key=None, check="sha256"):
+    # verify models inside the instance and pull the missing/corrupt ones concurrently, returns {model: status}
+    # with status "ok" (already there) or "pulled"
+    status = verify_models(host, models, key, check)
+    missing = [m for m in models if status.get(m) != "ok"]
+    for model in missing:
+        print("[%s] model %s is %s, pulling it" % (host, model, status.get(model, "missing")))
+    if missing:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(missing)) as pool:
+            list(pool.map(lambda m: pull_model(host, m), missing))
+    return {m: "pulled" if m in missing else "ok" for m in models}
@@ -0,0 +1,196 @@
+# Ollama HTTP API benchmark helpers for instances started by start-nvidia-ollama-mutligpu-openstack-instance.py
+#
+# Requests are sent to /api/generate with streaming enabled, so the time to first token (TTFT) can be measured on the
+# client side. Tokens/s are taken from the eval_count/eval_duration Ollama reports in its final message. Every
+# worker thread keeps one HTTP/1.1 keep-alive connection, so connection setup is not part of the measured latency
+# (except for the first request of every worker).
+#
+# Only the standard library is used, the benchmark can run anywhere, e.g., against ollama-stub-server.py.
+#
+# per_gpu_userdata() changes the USERDATA of the ollama profile (gpuaas.py, gpuaas-profiles.yaml) to run one Ollama
+# container per GPU (pinned using --gpus device=N, listening on localhost:11435, 11436, ...) behind
+# ollama-router.py on port 11434, which balances the requests over the containers.
+
+import base64
+import concurrent.futures
+import http.client
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+
+
+
+###########################
+#
+# Config
+#
+###########################
+
+OLLAMA_PORT = 11434
+REQUEST_TIMEOUT = 600
+
+PERCENTILES = (50, 95, 99)
+
+# one Ollama container per GPU, see per_gpu_userdata()
+OLLAMA_BACKEND_BASE_PORT = 11435
+ROUTER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ollama-router.py")
+ROUTER_PATH = "/usr/local/bin/ollama-router.py"
+PER_GPU_SCRIPT_PATH = "/usr/local/bin/ollama-per-gpu.sh"
+
+# started by cron after every boot, starts (or restarts) a container for every GPU listed by nvidia-smi and runs the
+# router in front of them
+PER_GPU_SCRIPT = """#!/bin/sh
+GPUS=$(nvidia-smi -L 2>/dev/null | grep -c '^GPU ')
+docker volume create ollama
+BACKENDS=""
+i=0
+while [ $i -lt $GPUS ] || [ $i -eq 0 ]; do
+  PORT=$((%(base_port)d + i))
+  if [ $GPUS -gt 0 ]; then DEVICE="device=$i"; else DEVICE="all"; fi
+  docker start ollama-gpu$i || docker run -d -v ollama:/root/.ollama -p 127.0.0.1:$PORT:11434 --name ollama-gpu$i --restart=unless-stopped --gpus $DEVICE ollama/ollama
+  BACKENDS="$BACKENDS 127.0.0.1:$PORT"
+  i=$((i + 1))
+done
+exec python3 %(router)s --host 0.0.0.0 --port %(port)d $BACKENDS
+"""
+
+PER_GPU_CRONTAB = "@reboot root sleep 20 && %s >> /var/log/ollama-router.log 2>&1" % PER_GPU_SCRIPT_PATH
+
+
+
+###########################
+#
+# Code
+#
+###########################
+
+def per_gpu_userdata(userdata):
+    # replace the Ollama container started by the crontab of userdata by one container per GPU and the router
+    crontab = re.compile(r"^( *)@reboot root .*ollama/ollama.*$", re.M)
+    if not crontab.search(userdata) or "\nwrite_files:\n" not in userdata:
+        raise ValueError("USERDATA does not start Ollama using the crontab in write_files")
+
+    with open(ROUTER_SOURCE, "rb") as f:
+        router = f.read()
+    script = (PER_GPU_SCRIPT % {"base_port": OLLAMA_BACKEND_BASE_PORT, "router": ROUTER_PATH,
+                                "port": OLLAMA_PORT}).encode()
+    files = "".join("  - path: %s\n    permissions: '0755'\n    encoding: b64\n    content: %s\n"
+                    % (path, base64.b64encode(content).decode())
+                    for path, content in ((ROUTER_PATH, router), (PER_GPU_SCRIPT_PATH, script)))
+
+    userdata = crontab.sub(lambda m: m.group(1) + PER_GPU_CRONTAB, userdata, count=1)
+    return userdata.replace("\nwrite_files:\n", "\nwrite_files:\n" + files, 1)
+
+
+def parse_url(url):
+    # "host", "host:port" or "http://host:port" -> (host, port)
+    if "://" not in url:
+        url = "http://" + url
+    parsed = urllib.parse.urlsplit(url)
+    return parsed.hostname, parsed.port or OLLAMA_PORT
+
+
+def generate(connection, model, prompt, options=None):
+    # one streamed /api/generate request over connection (http.client.HTTPConnection), returns its measurements
+    body = {"model": model, "prompt": prompt, "stream": True}
+    if options:
+        body["options"] = options
+    start = time.monotonic()
+    connection.request("POST", "/api/generate", json.dumps(body), {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    if response.status != 200:
+        text = response.read().decode(errors="replace")
+        raise RuntimeError("HTTP %d: %s" % (response.status, text.strip()[:200]))
+
+    ttft = None
+    chunks = 0
+    final = {}
+    for line in response:
+        if not line.strip():
+            continue
+        message = json.loads(line)
+        if "error" in message:
+            raise RuntimeError(message["error"])
+        if message.get("response") and ttft is None:
+            ttft = time.monotonic() - start
+        chunks += 1
+        if message.get("done"):
+            final = message
+            break
+    # the final message ends the stream, read the rest to be able to reuse the connection
+    response.read()
+    latency = time.monotonic() - start
+
+    tokens = final.get("eval_count", chunks)
+    eval_seconds = final.get("eval_duration", 0) / 1e9
+    return {
+        "model": model,
+        "latency": latency,
+        "ttft": ttft,
+        "tokens": tokens,
+        "prompt_tokens": final.get("prompt_eval_count"),
+        # generation speed reported by Ollama, measured on the client if it is missing (e.g., other servers)
+        "tokens_per_second": tokens / eval_seconds if eval_seconds else
+                             (tokens / (latency - ttft) if ttft is not None and latency > ttft else None),
+    }
+
+
+def percentile(values, p):
+    # p-th percentile using linear interpolation between the closest ranks, None for no values
+    values = sorted(values)
+    if not values:
+        return None
+    k = (len(values) - 1) * p / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (k - lower)
+
+
+def run_benchmark(url, models, prompts, concurrency, requests, options=None, timeout=REQUEST_TIMEOUT):
+    # send requests requests (cycling through models and prompts) using concurrency workers, returns
+    # (list of measurements, wall clock seconds), failed requests have an "error" instead of measurements
+    host, port = parse_url(url)
+    local = threading.local()
+    jobs = [(models[i % len(models)], prompts[i % len(prompts)]) for i in range(requests)]
+
+    def run(job):
+        model, prompt = job
+        if getattr(local, "connection", None) is None:
+            local.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        start = time.time()
+        try:
+            result = generate(local.connection, model, prompt, options)
+        except Exception as e:
+            # a broken connection is not reused
+            local.connection.close()
+            local.connection = None
+            result = {"model": model, "error": str(e) or e.__class__.__name__}
+        result["start"] = start
+        return result
+
+    start = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        results = list(pool.map(run, jobs))
+    return results, time.monotonic() - start
+
+
+def summarize(results, wall_seconds):
+    # report of a benchmark run: request/token throughput and percentiles of latency, TTFT and tokens/s
+    ok = [r for r in results if "error" not in r]
+    report = {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "wall_seconds": round(wall_seconds, 3),
+        "requests_per_second": round(len(ok) / wall_seconds, 3) if wall_seconds else None,
+        "tokens_per_second_total": round(sum(r["tokens"] for r in ok) / wall_seconds, 1) if wall_seconds else None,
+    }
+    for metric in ("latency", "ttft", "tokens_per_second"):
+        values = [r[metric] for r in ok if r[metric] is not None]
+        for p in PERCENTILES:
+            value = percentile(values, p)
+            report["%s_p%d" % (metric, p)] = round(value, 4) if value is not None else None
+        report["%s_mean" % metric] = round(sum(values) / len(values), 4) if values else None
+    return report
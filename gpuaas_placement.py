@@ -0,0 +1,118 @@
+# GPU capacity aware flavor selection for the OpenStack environment of NetLab - Hochschule Fulda
+#
+# Instead of a fixed FLAVOR_NAME the start scripts can be asked for "N GPUs of any of these models". The candidate
+# flavors offering at least N of the GPUs are ranked: flavors not fitting into the remaining compute quota or for
+# which placement reports no host with enough free GPUs are dropped, exact GPU counts are preferred over larger
+# flavors and the GPU models are preferred in the given order. If the scheduler still fails to find a host
+# (NoValidHost, e.g., because another user took the GPUs meanwhile), the server is deleted and immediately created
+# again with the next candidate flavor (see start_instances() in gpuaas_fleet.py).
+
+import re
+
+
+
+###########################
+#
+# Config
+#
+###########################
+
+FLAVOR_CANDIDATES = [
+    "g1-1x2060.medium",  # NVIDIA Corporation TU106 [GeForce RTX 2060 SUPER]
+    "g1-2x2060.medium",
+    "g1-4x2060.medium",
+    "g1-1x2080.medium",  # NVIDIA Corporation TU102 [GeForce RTX 2080 Ti Rev. A]
+    "g1-2x2080.medium",
+]
+
+GPU_MODELS = ["2060", "2080"]
+
+# placement resource classes of the passthrough GPUs (PCI in placement, vendor and product ID), used to check for
+# free GPUs if the placement API is accessible for the user
+GPU_RESOURCE_CLASSES = {
+    "2060": "CUSTOM_PCI_10DE_1F06",
+    "2080": "CUSTOM_PCI_10DE_1E07",
+}
+
+# faults of servers that could not be scheduled
+SCHEDULING_ERRORS = r"No valid host|NoValidHost|Exceeded maximum number of retries|PCI device request|Insufficient compute resources"
+
+
+
+###########################
+#
+# Code
+#
+###########################
+
+def parse_flavor(flavor_name):
+    # ("g1-4x2060.medium") -> (4, "2060"), (None, None) for flavors without GPUs in their name
+    m = re.search(r"(\d+)x(\d+)", flavor_name or "")
+    if not m:
+        return None, None
+    return int(m.group(1)), m.group(2)
+
+
+def is_scheduling_error(fault):
+    return re.search(SCHEDULING_ERRORS, str(fault), re.I) is not None
+
+
+def remaining_quota(conn):
+    # remaining (cores, ram in MB, instances) of the project, None means unlimited or unknown
+    try:
+        limits = conn.get_compute_limits()
+    except Exception as e:
+        print("warning: cannot get compute limits: %s" % e)
+        return None, None, None
+
+    def remaining(maximum, used):
+        if maximum is None or maximum < 0:
+            return None
+        return maximum - (used or 0)
+
+    return (remaining(limits.max_total_cores, limits.total_cores_used),
+            remaining(limits.max_total_ram_size, limits.total_ram_used),
+            remaining(limits.max_total_instances, limits.total_instances_used))
+
+
+def gpu_capacity(conn, model, count):
+    # True/False if placement knows whether a single host has count free GPUs of model, None if it can't be asked
+    resource_class = GPU_RESOURCE_CLASSES.get(model)
+    if not resource_class:
+        return None
+    try:
+        response = conn.placement.get("/allocation_candidates", microversion="1.16",
+                                      params={"resources": "%s:%d" % (resource_class, count), "limit": 1})
+    except Exception:
+        return None
+    if response.status_code != 200:
+        return None
+    return bool(response.json().get("allocation_requests"))
+
+
+def rank_flavors(conn, gpus, models=GPU_MODELS, candidates=FLAVOR_CANDIDATES, instances=1):
+    # candidate flavor names offering at least gpus GPUs of one of models, best first
+    ranked = []
+    cores, ram, free_instances = remaining_quota(conn)
+    if free_instances is not None and free_instances < instances:
+        print("No instance quota left (%d remaining)" % free_instances)
+        return []
+    flavors = {f.name: f for f in conn.compute.flavors()}
+
+    for name in candidates:
+        count, model = parse_flavor(name)
+        if count is None or model not in models or count < gpus:
+            continue
+        flavor = flavors.get(name)
+        if flavor is None:
+            continue
+        if (cores is not None and flavor.vcpus * instances > cores) or (ram is not None and flavor.ram * instances > ram):
+            print("Skipping flavor %s, not enough cores/RAM quota left" % name)
+            continue
+        capacity = gpu_capacity(conn, model, count)
+        if capacity is False:
+            print("Skipping flavor %s, no host with %d free RTX %s GPUs" % (name, count, model))
+            continue
+        ranked.append(((capacity is None, count - gpus, models.index(model)), name))
+
+    return [name for key, name in sorted(ranked)]
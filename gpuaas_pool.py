@@ -0,0 +1,94 @@
+# warm pool of shelved GPU instances in the OpenStack environment of NetLab - Hochschule Fulda
+#
+# Instances started with --pool <name> get metadata naming the pool and the hash of their image and USERDATA (see
+# gpuaas_golden.py). Instead of deleting them, release-nvidia-openstack-instance.py shelves them back into the pool.
+# The next start with the same pool, USERDATA and flavor unshelves a matching instance (renamed to the requested
+# instance name) instead of creating a new one, which skips the boot and the whole provisioning. Instances shelved
+# automatically after one week are picked up the same way.
+
+import concurrent.futures
+
+
+
+###########################
+#
+# Config
+#
+###########################
+
+POOL_METADATA_KEY = "gpuaas_pool"
+USERDATA_HASH_METADATA_KEY = "gpuaas_userdata_sha256"
+
+SHELVED_STATUSES = ("SHELVED", "SHELVED_OFFLOADED")
+
+
+
+###########################
+#
+# Code
+#
+###########################
+
+def pool_metadata(pool, userdata_hash):
+    # metadata for create_server(meta=...) of pool members
+    return {POOL_METADATA_KEY: pool, USERDATA_HASH_METADATA_KEY: userdata_hash}
+
+
+def flavor_name(server):
+    # servers list their flavor by name with compute API microversion 2.47 and later
+    flavor = server.flavor or {}
+    return flavor.get("original_name") or flavor.get("name")
+
+
+def pool_members(conn, pool):
+    return [s for s in conn.compute.servers(details=True) if (s.metadata or {}).get(POOL_METADATA_KEY) == pool]
+
+
+def find_shelved(conn, pool, userdata_hash, flavors, count):
+    # up to count shelved members of pool with the same USERDATA hash and one of the flavors (names), in the order
+    # of flavors
+    matches = [s for s in pool_members(conn, pool)
+               if s.status in SHELVED_STATUSES
+               and s.metadata.get(USERDATA_HASH_METADATA_KEY) == userdata_hash
+               and flavor_name(s) in flavors]
+    matches.sort(key=lambda s: flavors.index(flavor_name(s)))
+    return matches[:count]
+
+
+def unshelve(conn, server):
+    # request unshelving server, returns the server
+    #
+    # The server keeps its pool name until it is ACTIVE (see rename()), so an unshelve failing later (e.g., no free
+    # GPUs) and the new server created instead never leave two servers with the same name.
+    conn.compute.unshelve_server(server)
+    return server
+
+
+def rename(conn, server, name):
+    # rename an unshelved server to the requested instance name once it is ACTIVE, returns the server
+    if server.name != name:
+        conn.compute.update_server(server, name=name)
+        server.name = name
+    return server
+
+
+def unshelve_all(conn, servers, names, max_workers=8):
+    # request unshelving servers concurrently for names, returns {name: server or exception}
+    def run(server, name):
+        try:
+            return name, unshelve(conn, server)
+        except Exception as e:
+            return name, e
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(servers)))) as pool:
+        return dict(pool.map(lambda args: run(*args), zip(servers, names)))
+
+
+def release(conn, server):
+    # shelve a pool member, keeping its disk (and floating IP) for the next start
+    if POOL_METADATA_KEY not in (server.metadata or {}):
+        raise ValueError("%s is not a member of a warm pool, use terminate-nvidia-openstack-instance.py" % server.name)
+    if server.status in SHELVED_STATUSES:
+        return False
+    conn.compute.shelve_server(server)
+    return True
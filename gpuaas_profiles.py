@@ -0,0 +1,122 @@
+# launcher profiles of gpuaas.py in the OpenStack environment of NetLab - Hochschule Fulda
+#
+# The start scripts only differed in their constants (image, flavor, network, keypair, readiness checks, USERDATA)
+# and their positional arguments. These are declared per profile in PROFILES_FILE (gpuaas-profiles.yaml), e.g.,
+# "gpuaas.py start gpuburn burn-1 300 -d" uses the gpuburn profile with the arguments instance-name, burn-duration
+# and parameter. Every argument <name> given on the command line replaces the placeholder <name> in the string
+# settings of the profile (e.g., USERDATA or the network name).
+#
+# yaml is only imported when the profiles are loaded, so --help and argument errors of gpuaas.py don't pay for it.
+
+import os
+
+
+
+###########################
+#
+# Config
+#
+###########################
+
+PROFILES_FILE = os.environ.get("GPUAAS_PROFILES") or os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                  "gpuaas-profiles.yaml")
+
+# settings of a profile and their defaults
+DEFAULTS = {
+    "description": "",
+    "image": None,
+    "flavor": None,
+    "network": None,
+    "keypair": "gpuaas-keypair",
+    "private_keypair_file": "nvidia-test-keypair.key",
+    "import_existing_pubkey_file": "",
+    "ready_sentinel_file": None,
+    "ready_nvidia_smi": False,
+    "ready_ports": [],
+    # --bake and golden images (see gpuaas_golden.py)
+    "golden": False,
+    # --ollama-per-gpu, --models and --model-volume (see gpuaas_ollama.py and gpuaas_models.py)
+    "ollama": False,
+    # positional arguments in order: name, metavar, help, default (optional if given), rest (gets all unknown options)
+    "arguments": [{"name": "instance_name", "metavar": "instance-name"}],
+    "userdata": "",
+}
+
+REQUIRED = ("image", "flavor", "network", "userdata")
+
+# arguments used by gpuaas.py itself instead of replacing placeholders
+INSTANCE_NAME_ARGUMENT = "instance_name"
+COUNT_ARGUMENT = "count"
+
+
+
+###########################
+#
+# Code
+#
+###########################
+
+def load(path=None):
+    # {name: profile} of path, settings missing in a profile are taken from DEFAULTS
+    import yaml
+
+    # the C loader (if PyYAML was built with libyaml) parses the profiles about 10 times faster
+    with open(path or PROFILES_FILE) as f:
+        config = yaml.load(f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)) or {}
+    profiles = {}
+    for name, settings in config.items():
+        unknown = set(settings) - set(DEFAULTS)
+        if unknown:
+            raise ValueError("unknown setting(s) %s in profile %s" % (", ".join(sorted(unknown)), name))
+        missing = [key for key in REQUIRED if not settings.get(key)]
+        if missing:
+            raise ValueError("profile %s misses %s" % (name, ", ".join(missing)))
+        if INSTANCE_NAME_ARGUMENT not in [a["name"] for a in settings.get("arguments", DEFAULTS["arguments"])]:
+            raise ValueError("profile %s has no %s argument" % (name, INSTANCE_NAME_ARGUMENT))
+        profiles[name] = dict(DEFAULTS, name=name, **settings)
+    return profiles
+
+
+def usage(profile):
+    # e.g. "instance-name burn-duration [parameter]"
+    words = []
+    for argument in profile["arguments"]:
+        metavar = argument.get("metavar", argument["name"])
+        words.append("[%s]" % metavar if "default" in argument else metavar)
+    return " ".join(words)
+
+
+def bind(profile, values, extras=()):
+    # {argument name: value} of the positional values, unknown options (extras, e.g., "-d" for gpu-burn) are appended
+    # to the rest argument, raises ValueError if the values don't match the arguments of profile
+    arguments = profile["arguments"]
+    if len(values) > len(arguments):
+        raise ValueError("too many arguments for profile %s, expected: %s" % (profile["name"], usage(profile)))
+    bound = {}
+    for i, argument in enumerate(arguments):
+        if i < len(values):
+            bound[argument["name"]] = values[i]
+        elif "default" in argument:
+            bound[argument["name"]] = str(argument["default"])
+        else:
+            raise ValueError("missing %s for profile %s, expected: %s" % (
+              argument.get("metavar", argument["name"]), profile["name"], usage(profile)))
+
+    if extras:
+        rest = [a["name"] for a in arguments if a.get("rest")]
+        if not rest:
+            raise ValueError("unrecognized arguments: %s" % " ".join(extras))
+        bound[rest[0]] = " ".join([bound[rest[0]]] + list(extras)).strip()
+    return bound
+
+
+def apply(profile, bound):
+    # profile with the placeholders <name> of the arguments replaced in its string settings
+    result = dict(profile)
+    for key, value in profile.items():
+        if isinstance(value, str):
+            for name, argument in bound.items():
+                if name not in (INSTANCE_NAME_ARGUMENT, COUNT_ARGUMENT):
+                    value = value.replace("<%s>" % name, argument)
+            result[key] = value
+    return result
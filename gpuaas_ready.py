@@ -0,0 +1,119 @@
+# guest readiness checks for instances in the OpenStack environment of NetLab - Hochschule Fulda
+#
+# Nova reports ACTIVE long before an instance is usable: cloud-init still installs drivers etc., reboots and only
+# afterwards nvidia-smi works and services like Ollama answer. wait_for_guest() probes an instance until ssh works,
+# cloud-init created the sentinel file and is done, nvidia-smi lists as many GPUs as the flavor has and the
+# service ports accept connections. Every milestone is marked in the timeline of the instance (see gpuaas_timing.py).
+#
+# All checks inside the instance are done by a single command per probe, run over one multiplexed ssh connection
+# per host (see gpuaas_ssh.py). The start scripts run wait_for_guest() concurrently for all started instances.
+
+import re
+import socket
+import time
+
+import gpuaas_ssh
+
+
+
+###########################
+#
+# Config
+#
+###########################
+
+READY_TIMEOUT = 3600
+READY_POLL_INTERVAL = 10
+
+# single probe command, prints one line per satisfied check and the number of GPUs listed by nvidia-smi
+PROBE_COMMAND = ("echo ssh; "
+                 "sudo test -f %s && echo sentinel; "
+                 "cloud-init status 2>/dev/null | grep -o 'status: [a-z]*'; "
+                 "echo gpus=$(nvidia-smi -L 2>/dev/null | grep -c '^GPU ')")
+
+
+
+###########################
+#
+# Code
+#
+###########################
+
+def flavor_gpus(flavor_name):
+    # number of GPUs of a flavor named like g1-4x2060.medium, None if unknown
+    m = re.search(r"(\d+)x\d+", flavor_name or "")
+    return int(m.group(1)) if m else None
+
+
+def port_open(host, port, timeout=5):
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def probe(host, key=None, sentinel=None):
+    # returns the set of satisfied checks inside the instance ("ssh", "sentinel", "cloud_init") and the GPU count
+    code, out, err = gpuaas_ssh.ssh_run(host, PROBE_COMMAND % (sentinel or "/nonexistent"), key=key, timeout=60)
+    checks, gpus = set(), 0
+    if code == 255:
+        return checks, gpus
+    for line in out.splitlines():
+        line = line.strip()
+        if line in ("ssh", "sentinel"):
+            checks.add(line)
+        elif line.startswith("status: ") and line != "status: running" and line != "status: not":
+            checks.add("cloud_init")
+            if line == "status: error":
+                checks.add("cloud_init_error")
+        elif line.startswith("gpus="):
+            gpus = int(line[5:] or 0)
+    return checks, gpus
+
+
+def wait_for_guest(server, timeline, key=None, sentinel=None, gpus=None, ports=(), timeout=READY_TIMEOUT):
+    # wait until server is ready, milestones are reached in order: ssh, cloud_init (sentinel file exists and
+    # cloud-init is done), nvidia_smi (exactly gpus GPUs listed, skipped if gpus is None, any number if 0) and
+    # port_<port> for every port in ports
+    host = server.public_v4
+    name = getattr(server, "name", host)
+    deadline = time.monotonic() + timeout
+    pending = ["ssh", "cloud_init"] + (["nvidia_smi"] if gpus is not None else []) + ["port_%d" % p for p in ports]
+    status = None
+
+    while pending:
+        if pending[0] in ("ssh", "cloud_init", "nvidia_smi"):
+            checks, found_gpus = probe(host, key, sentinel)
+        reached = {
+            "ssh": "ssh" in checks,
+            "cloud_init": "cloud_init" in checks and (not sentinel or "sentinel" in checks),
+            "nvidia_smi": found_gpus > 0 and (not gpus or found_gpus == gpus),
+        }
+
+        while pending:
+            milestone = pending[0]
+            if milestone.startswith("port_"):
+                ok = port_open(host, int(milestone[5:]))
+            else:
+                ok = reached[milestone]
+            if not ok:
+                break
+            timeline.mark(milestone)
+            pending.pop(0)
+            if milestone == "cloud_init" and "cloud_init_error" in checks:
+                print("[%s] warning: cloud-init reported errors, see /var/log/cloud-init-output.log" % name)
+
+        if not pending:
+            break
+
+        new_status = "waiting for %s" % {"cloud_init": "cloud-init", "nvidia_smi": "nvidia-smi"}.get(
+            pending[0], pending[0].replace("_", " "))
+        if pending[0] == "nvidia_smi" and found_gpus and gpus:
+            new_status += " (%d of %d GPUs)" % (found_gpus, gpus)
+        if new_status != status:
+            status = new_status
+            print("[%s] %s ..." % (name, status))
+        if time.monotonic() > deadline:
+            raise TimeoutError("%s not ready after %ds, still %s" % (name, timeout, status))
+        time.sleep(READY_POLL_INTERVAL)
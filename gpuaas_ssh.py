@@ -0,0 +1,174 @@
+# SSH helpers for instances in the OpenStack environment of NetLab - Hochschule Fulda
+#
+# Uses the ssh client (like ssh-login-example.sh) in batch mode. Host keys of instances are kept in a separate
+# known_hosts file in ~/.cache/hfd-gpuaas, as floating IPs are recycled and would otherwise clash with ~/.ssh/known_hosts.
+#
+# Connections are multiplexed (ControlMaster), so repeated commands to the same host, e.g., readiness probes, reuse
+# one ssh connection instead of doing a new handshake every time.
+#
+# The server ID last seen at every floating IP is kept in host-ids.json next to the known_hosts file. When an IP
+# belongs to another server now (recycled), its old host key is removed and its master connection closed before
+# connecting, see check_host_key().
+
+import base64
+import json
+import os
+import shlex
+import subprocess
+import threading
+
+import gpuaas_cache
+
+
+
+###########################
+#
+# Config
+#
+###########################
+
+SSH_USER = "ubuntu"
+SSH_CONNECT_TIMEOUT = 10
+KNOWN_HOSTS_FILE = "known_hosts"
+HOST_IDS_FILE = "host-ids.json"
+
+# master connections are kept open for this many seconds after the last command
+CONTROL_PERSIST = 120
+
+
+
+###########################
+#
+# Code
+#
+###########################
+
+def known_hosts_path():
+    return gpuaas_cache.cache_path(KNOWN_HOSTS_FILE)
+
+
+def ssh_options(key=None):
+    # key can be a path or a placeholder like "<private key corresponding to ...>" printed by get_keypair(), the
+    # default identity of the ssh client is used in the latter case
+    options = ["-o", "BatchMode=yes",
+               "-o", "StrictHostKeyChecking=accept-new",
+               "-o", "UserKnownHostsFile=%s" % known_hosts_path(),
+               "-o", "ConnectTimeout=%d" % SSH_CONNECT_TIMEOUT,
+               "-o", "ServerAliveInterval=15",
+               "-o", "LogLevel=ERROR",
+               "-o", "ControlMaster=auto",
+               "-o", "ControlPath=%s" % gpuaas_cache.cache_path("cm-%C"),
+               "-o", "ControlPersist=%d" % CONTROL_PERSIST]
+    if key and os.path.isfile(os.path.expanduser(key)):
+        options += ["-i", os.path.expanduser(key)]
+    return options
+
+
+def ssh_command(host, command, key=None, user=SSH_USER):
+    return ["ssh"] + ssh_options(key) + ["%s@%s" % (user, host), command]
+
+
+def ssh_run(host, command, key=None, user=SSH_USER, timeout=60):
+    # run command on host, returns (exit code, stdout, stderr), exit code 255 means ssh itself failed
+    try:
+        p = subprocess.run(ssh_command(host, command, key, user),
+                           stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired as e:
+        return 255, e.stdout or "", "timeout after %ds" % timeout
+    return p.returncode, p.stdout, p.stderr
+
+
+def ssh_script(host, script, args=(), key=None, interpreter="sh", sudo=True, timeout=600):
+    # run a (multi-line) script on host without quoting issues, it is passed base64 encoded and read by the
+    # interpreter ("sh" or "python3") from stdin, returns (exit code, stdout, stderr) like ssh_run()
+    command = "echo %s | base64 -d | %s%s %s %s" % (
+      base64.b64encode(script.encode()).decode(), "sudo " if sudo else "", interpreter,
+      "-s --" if interpreter == "sh" else "-", " ".join(shlex.quote(str(a)) for a in args))
+    return ssh_run(host, command, key=key, timeout=timeout)
+
+
+def ssh_lines(host, command, key=None, user=SSH_USER):
+    # run command on host and yield its output line by line while it runs (e.g., to parse large logs without
+    # reading them completely), raises RuntimeError if ssh or the command fails
+    p = subprocess.Popen(ssh_command(host, command, key, user), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE, text=True, errors="replace")
+    try:
+        yield from p.stdout
+        err = p.stderr.read()
+        if p.wait() != 0:
+            raise RuntimeError("ssh %s failed (exit code %d): %s" % (host, p.returncode, err.strip()))
+    finally:
+        if p.poll() is None:
+            p.kill()
+        p.wait()
+        p.stdout.close()
+        p.stderr.close()
+
+
+def ssh_stream(host, command, on_line, key=None, user=SSH_USER, timeout=None):
+    # run command on host and call on_line(line) for every line of its output (stdout and stderr) as soon as it
+    # arrives, returns the exit code (255 if ssh itself failed, -9 if it was killed after timeout seconds)
+    p = subprocess.Popen(ssh_command(host, command, key, user), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                         stderr=subprocess.STDOUT, text=True, errors="replace")
+    timer = threading.Timer(timeout, p.kill) if timeout else None
+    if timer:
+        timer.start()
+    try:
+        for line in p.stdout:
+            on_line(line.rstrip("\n"))
+        return p.wait()
+    finally:
+        if timer:
+            timer.cancel()
+        if p.poll() is None:
+            p.kill()
+        p.wait()
+        p.stdout.close()
+
+
+def scp(host, sources, destination, key=None, user=SSH_USER, download=False, timeout=600):
+    # copy local sources (files or directories) to destination on host, or remote sources to the local destination
+    # if download is True, using the multiplexed connection of host, returns (exit code, output) like ssh_run()
+    remote = "%s@%s:" % (user, host)
+    if download:
+        paths = [remote + s for s in sources] + [destination]
+    else:
+        paths = list(sources) + [remote + destination]
+    try:
+        p = subprocess.run(["scp", "-r", "-p", "-q"] + ssh_options(key) + paths,
+                           stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                           timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return 255, "timeout after %ds" % timeout
+    return p.returncode, p.stdout
+
+
+# ssh-keygen -R rewrites the known_hosts file, which must not happen concurrently
+_known_hosts_lock = threading.Lock()
+
+
+def forget_host_key(host):
+    # remove the host key of a (recycled) floating IP before connecting to a new instance using it, a master
+    # connection still open to the old instance is closed as well
+    subprocess.run(["ssh"] + ssh_options() + ["-O", "exit", "%s@%s" % (SSH_USER, host)],
+                   stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with _known_hosts_lock:
+        subprocess.run(["ssh-keygen", "-f", known_hosts_path(), "-R", host],
+                       stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def check_host_key(host, server_id):
+    # forget the host key of host unless it was last used by the server server_id, returns True if it was forgotten
+    with _known_hosts_lock:
+        path = gpuaas_cache.cache_path(HOST_IDS_FILE)
+        try:
+            with open(path) as f:
+                host_ids = json.load(f)
+        except (OSError, ValueError):
+            host_ids = {}
+        if host_ids.get(host) == server_id:
+            return False
+        host_ids[host] = server_id
+        gpuaas_cache.write_private_file(path, json.dumps(host_ids, indent=1, sort_keys=True))
+    forget_host_key(host)
+    return True
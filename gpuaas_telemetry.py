@@ -0,0 +1,221 @@
+# GPU telemetry of instances in the OpenStack environment of NetLab - Hochschule Fulda, see collect-gpu-telemetry.py
+#
+# With --telemetry the start scripts add gpu-telemetry-sampler.py to USERDATA (see inject()): it runs inside the
+# instance after every boot and samples utilization, memory, clocks, power, temperature, P-state and clock throttle
+# reasons of every GPU using a single long-running nvidia-smi process into a bounded ring buffer on disk (24h at one
+# sample per second by default).
+#
+# The collector pulls only the samples it has not seen yet: the last sequence number read from every instance (by
+# server ID) is kept in ~/.cache/hfd-gpuaas/telemetry-cursors.json and passed to "gpu-telemetry-sampler.py read
+# --since". Samples are appended as JSON lines and the latest sample per GPU can be written as Prometheus textfile,
+# so throughput (e.g., of gpu-burn or the Ollama benchmark) can be correlated with thermal throttling.
+
+import base64
+import json
+import os
+import threading
+
+import gpuaas_cache
+import gpuaas_ssh
+import gpuaas_timing
+
+
+
+###########################
+#
+# Config
+#
+###########################
+
+SAMPLER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gpu-telemetry-sampler.py")
+SAMPLER_PATH = "/usr/local/bin/gpu-telemetry-sampler.py"
+TELEMETRY_DIR = "/var/lib/gpu-telemetry"
+
+SAMPLE_INTERVAL_MS = 1000
+SEGMENT_LINES = 3600
+SEGMENTS = 24
+
+SAMPLER_COMMAND = "python3 %s sample --dir %s --interval-ms %d --segment-lines %d --segments %d" % (
+  SAMPLER_PATH, TELEMETRY_DIR, SAMPLE_INTERVAL_MS, SEGMENT_LINES, SEGMENTS)
+SAMPLER_CRONTAB = "@reboot root %s >/dev/null 2>&1" % SAMPLER_COMMAND
+READ_COMMAND = "python3 %s read --dir %s --since %%d" % (SAMPLER_PATH, TELEMETRY_DIR)
+
+CURSOR_FILE = "telemetry-cursors.json"
+TELEMETRY_FILE = "gpu-telemetry.jsonl"
+
+# names of the nvidia-smi fields sampled by gpu-telemetry-sampler.py (in its default order) in the samples
+FIELDS = ["gpu", "uuid", "utilization_gpu", "utilization_memory", "memory_used_mib", "memory_total_mib",
+          "clock_sm_mhz", "clock_mem_mhz", "power_watts", "temperature_c", "pstate", "throttle_reasons"]
+
+# bits of clocks_throttle_reasons.active
+THROTTLE_REASONS = {
+    0x1: "gpu_idle",
+    0x2: "applications_clocks_setting",
+    0x4: "sw_power_cap",
+    0x8: "hw_slowdown",
+    0x10: "sync_boost",
+    0x20: "sw_thermal_slowdown",
+    0x40: "hw_thermal_slowdown",
+    0x80: "hw_power_brake_slowdown",
+    0x100: "display_clock_setting",
+}
+
+PROMETHEUS_METRIC_PREFIX = "gpuaas_gpu"
+PROMETHEUS_GAUGES = [
+    ("utilization_gpu", "utilization_percent", "GPU utilization."),
+    ("utilization_memory", "memory_utilization_percent", "GPU memory controller utilization."),
+    ("memory_used_mib", "memory_used_mib", "Used GPU memory."),
+    ("clock_sm_mhz", "clock_sm_mhz", "SM clock."),
+    ("clock_mem_mhz", "clock_mem_mhz", "Memory clock."),
+    ("power_watts", "power_watts", "Power draw."),
+    ("temperature_c", "temperature_celsius", "GPU temperature."),
+    ("throttle_reasons", "throttle_reasons", "Bit mask of the active clock throttle reasons."),
+]
+
+
+
+###########################
+#
+# Code
+#
+###########################
+
+def module():
+    # gpuaas_userdata.compose() module installing and starting the sampler
+    with open(SAMPLER_SOURCE, "rb") as f:
+        sampler = f.read()
+    return {
+        "write_files": [{"path": SAMPLER_PATH, "permissions": "0755", "encoding": "b64",
+                         "content": base64.b64encode(sampler).decode()}],
+        "crontab": [SAMPLER_COMMAND + " >/dev/null 2>&1"],
+    }
+
+
+def inject(userdata):
+    # userdata (cloud-config or shell script) additionally installing the sampler, started after every boot by cron
+    with open(SAMPLER_SOURCE, "rb") as f:
+        sampler = base64.b64encode(f.read()).decode()
+
+    if not userdata.lstrip().startswith("#cloud-config"):
+        # shell script, the sampler is started right away as the script does not reboot
+        shebang, _, script = userdata.partition("\n") if userdata.startswith("#!") else ("#!/bin/sh", "", userdata)
+        lines = ["echo %s | base64 -d > %s && chmod 755 %s" % (sampler, SAMPLER_PATH, SAMPLER_PATH),
+                 "echo '%s' >> /etc/crontab" % SAMPLER_CRONTAB,
+                 "nohup %s >/dev/null 2>&1 &" % SAMPLER_COMMAND]
+        return "%s\n%s\n%s" % (shebang, "\n".join(lines), script)
+
+    files = ("  - path: %s\n    permissions: '0755'\n    encoding: b64\n    content: %s\n"
+             "  - path: /etc/crontab\n    append: true\n    content: |\n      %s\n") % (SAMPLER_PATH, sampler, SAMPLER_CRONTAB)
+    if "\nwrite_files:\n" in userdata:
+        return userdata.replace("\nwrite_files:\n", "\nwrite_files:\n" + files, 1)
+    return userdata.rstrip("\n") + "\nwrite_files:\n" + files
+
+
+def _number(value):
+    # nvidia-smi prints [N/A] or [Not Supported] for missing values
+    try:
+        return float(value) if "." in value else int(value)
+    except ValueError:
+        return None
+
+
+def parse_sample(line):
+    # "<seq>,<unix time>,<nvidia-smi fields>" -> (seq, sample dict), None for lines that can't be parsed
+    values = line.rstrip("\n").split(",")
+    if len(values) != len(FIELDS) + 2 or not values[0].isdigit():
+        return None
+    sample = {"time": float(values[1])}
+    for field, value in zip(FIELDS, values[2:]):
+        if field in ("uuid", "pstate"):
+            sample[field] = value
+        elif field == "throttle_reasons":
+            mask = int(value, 16) if value.startswith("0x") else None
+            sample[field] = mask
+            sample["throttled_by"] = [name for bit, name in sorted(THROTTLE_REASONS.items())
+                                      if mask and mask & bit and bit != 0x1]
+        else:
+            sample[field] = _number(value)
+    return int(values[0]), sample
+
+
+def fetch(host, since=-1, key=None):
+    # samples of host after sequence number since, returns (samples, last sequence number)
+    #
+    # If the buffer was reset (e.g., a new instance got the floating IP) or older samples were already dropped from
+    # the ring buffer, everything still in the buffer is returned.
+    lines = gpuaas_ssh.ssh_lines(host, READ_COMMAND % since, key=key)
+    header = next(lines, "").split()
+    if len(header) != 3 or header[0] != "#":
+        raise RuntimeError("unexpected answer of the telemetry sampler: %s" % " ".join(header))
+    first, last = int(header[1]), int(header[2])
+    if last < since:
+        # sequence numbers start again, read everything
+        lines.close()
+        return fetch(host, -1, key)
+
+    samples = []
+    seq = since
+    for line in lines:
+        parsed = parse_sample(line)
+        if parsed:
+            seq, sample = parsed
+            samples.append(sample)
+    return samples, seq
+
+
+class Cursors:
+    # last sequence number collected per server ID, stored in CURSOR_FILE
+
+    def __init__(self, path=None):
+        self.path = path or gpuaas_cache.cache_path(CURSOR_FILE)
+        self.lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self.cursors = json.load(f)
+        except (OSError, ValueError):
+            self.cursors = {}
+
+    def get(self, server_id):
+        return self.cursors.get(server_id, -1)
+
+    def set(self, server_id, seq):
+        with self.lock:
+            self.cursors[server_id] = seq
+
+    def save(self):
+        with self.lock:
+            gpuaas_cache.write_private_file(self.path, json.dumps(self.cursors, indent=1, sort_keys=True))
+
+
+def write_jsonl(path, instance, samples):
+    with open(path, "a") as f:
+        for sample in samples:
+            f.write(json.dumps(dict(sample, instance=instance), sort_keys=True) + "\n")
+
+
+def latest(samples):
+    # latest sample of every GPU
+    result = {}
+    for sample in samples:
+        result[sample["gpu"]] = sample
+    return [result[gpu] for gpu in sorted(result)]
+
+
+def write_prometheus(path, samples_by_instance):
+    # latest samples ({instance: [sample]}) as gauges, replaces path atomically like gpuaas_timing.write_prometheus()
+    lines = []
+    for field, metric, description in PROMETHEUS_GAUGES:
+        lines += ["# HELP %s_%s %s" % (PROMETHEUS_METRIC_PREFIX, metric, description),
+                  "# TYPE %s_%s gauge" % (PROMETHEUS_METRIC_PREFIX, metric)]
+        for instance, samples in sorted(samples_by_instance.items()):
+            for sample in samples:
+                if sample.get(field) is None:
+                    continue
+                labels = {"instance": instance, "gpu": sample["gpu"], "uuid": sample["uuid"]}
+                lines.append("%s_%s{%s} %s" % (PROMETHEUS_METRIC_PREFIX, metric, gpuaas_timing.prometheus_labels(labels),
+                                               sample[field]))
+
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
@@ -0,0 +1,100 @@
+# boot phase timing for the start scripts in the OpenStack environment of NetLab - Hochschule Fulda
+#
+# Every started instance gets a timeline of consecutive phases (startup of gpuaas.py, auth, lookup, create, build,
+# floating_ip, ssh, cloud_init, nvidia_smi, port_<port>). Timelines are appended as JSON lines to TIMINGS_FILE and can
+# also be written as a Prometheus textfile (e.g., for the node_exporter textfile collector) to track time-to-GPU-ready
+# over images and flavors.
+
+import json
+import os
+import time
+
+
+
+###########################
+#
+# Config
+#
+###########################
+
+TIMINGS_FILE = os.environ.get("GPUAAS_TIMINGS_FILE", "gpuaas-boot-timings.jsonl")
+
+PROMETHEUS_METRIC_PREFIX = "gpuaas_boot"
+
+
+
+###########################
+#
+# Code
+#
+###########################
+
+class Timeline:
+    # consecutive phases, each phase lasts from the end of the previous one (or the start) until mark(phase)
+
+    def __init__(self, instance=None, **labels):
+        self.instance = instance
+        self.labels = labels
+        self.started = time.time()
+        self.last = self.started
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.time()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def fork(self, instance, **labels):
+        # copy of the phases so far (e.g., auth and lookup shared by a fleet) for a single instance
+        timeline = Timeline(instance, **dict(self.labels, **labels))
+        timeline.started, timeline.last, timeline.phases = self.started, self.last, list(self.phases)
+        return timeline
+
+    def total(self):
+        return self.last - self.started
+
+    def as_dict(self):
+        return {"instance": self.instance,
+                "labels": self.labels,
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(self.started)),
+                "phases": {phase: round(duration, 3) for phase, duration in self.phases},
+                "total": round(self.total(), 3)}
+
+
+def write_jsonl(path, timelines):
+    with open(path, "a") as f:
+        for timeline in timelines:
+            f.write(json.dumps(timeline.as_dict(), sort_keys=True) + "\n")
+
+
+def prometheus_labels(labels):
+    escape = lambda v: str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return ",".join('%s="%s"' % (k, escape(v)) for k, v in sorted(labels.items()))
+
+
+def write_prometheus(path, timelines):
+    # replaces path atomically, so a textfile collector never reads a partially written file
+    lines = ["# HELP %s_phase_seconds Duration of a boot phase of an instance." % PROMETHEUS_METRIC_PREFIX,
+             "# TYPE %s_phase_seconds gauge" % PROMETHEUS_METRIC_PREFIX]
+    for timeline in timelines:
+        for phase, duration in timeline.phases:
+            labels = dict(timeline.labels, instance=timeline.instance, phase=phase)
+            lines.append("%s_phase_seconds{%s} %.3f" % (PROMETHEUS_METRIC_PREFIX, prometheus_labels(labels), duration))
+    lines += ["# HELP %s_total_seconds Time from script start until the last recorded phase of an instance." % PROMETHEUS_METRIC_PREFIX,
+              "# TYPE %s_total_seconds gauge" % PROMETHEUS_METRIC_PREFIX]
+    for timeline in timelines:
+        labels = dict(timeline.labels, instance=timeline.instance)
+        lines.append("%s_total_seconds{%s} %.3f" % (PROMETHEUS_METRIC_PREFIX, prometheus_labels(labels), timeline.total()))
+
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+
+
+def export(timelines, jsonl_path=TIMINGS_FILE, prometheus_path=None):
+    timelines = [t for t in timelines if t is not None]
+    if jsonl_path:
+        write_jsonl(jsonl_path, timelines)
+    if prometheus_path:
+        write_prometheus(prometheus_path, timelines)
@@ -0,0 +1,323 @@
+# USERDATA helpers for the start scripts in the OpenStack environment of NetLab - Hochschule Fulda
+#
+# Provisioning downloads the same gigabytes (Ubuntu packages, NVIDIA driver, Docker images) for every instance. If a
+# shared cache host is available in the LAN, e.g., apt-cacher-ng and a Docker registry in pull-through cache mode,
+# inject_package_cache() points apt and Docker of the instance to it, so parallel provisioning of a fleet downloads
+# everything only once. Both cloud-config and shell script USERDATA are supported.
+#
+# The cache can also be configured using the environment variables GPUAAS_APT_PROXY, GPUAAS_APT_MIRROR and
+# GPUAAS_DOCKER_MIRROR instead of the --apt-proxy, --apt-mirror and --docker-mirror options of the start scripts.
+#
+# The provisioning itself can be composed from MODULES (driver, Docker, NVIDIA Container Toolkit, gpu-burn, Ollama)
+# using compose(): packages of the Ubuntu archive are installed in one transaction, all apt repositories are added
+# before a single apt-get update and the packages of these repositories are installed in one apt-get install.
+# optimize() does the same for existing cloud-config USERDATA (e.g., of the start scripts, --optimize-userdata):
+# redundant apt-get update/upgrade passes are removed, installs are merged and the final reboot only happens if
+# required. compress() gzips USERDATA (cloud-init detects it), keeping it small for the Nova user_data limit.
+
+import gzip
+import json
+import os
+import re
+
+import gpuaas_telemetry
+
+
+
+###########################
+#
+# Config
+#
+###########################
+
+# e.g. http://cache.example.org:3142 (apt-cacher-ng)
+APT_PROXY = os.environ.get("GPUAAS_APT_PROXY") or None
+# e.g. http://mirror.example.org/ubuntu, replaces archive.ubuntu.com and security.ubuntu.com
+APT_MIRROR = os.environ.get("GPUAAS_APT_MIRROR") or None
+# e.g. http://cache.example.org:5000 (Docker Hub pull-through cache, used for ollama/ollama and the gpu-burn base image)
+DOCKER_MIRROR = os.environ.get("GPUAAS_DOCKER_MIRROR") or None
+
+DOCKER_DAEMON_CONFIG = "/etc/docker/daemon.json"
+APT_PROXY_CONFIG = "/etc/apt/apt.conf.d/90gpuaas-proxy"
+
+SENTINEL_FILE = "/root/cloud-init-script-ran-successfully"
+
+# replaces the final reboot: reboot only if a package requires it or the NVIDIA driver is not loaded yet, otherwise
+# run the @reboot jobs of /etc/crontab right away (like cron does, "\%" is "%")
+CONDITIONAL_REBOOT = ("if [ -f /var/run/reboot-required ] || ! nvidia-smi >/dev/null 2>&1; then reboot; "
+                      "else grep '^@reboot' /etc/crontab | sed -e 's/^@reboot *[a-z]* *//' -e 's/\\\\%/%/g' | "
+                      "while read -r job; do nohup sh -c \"$job\" >/dev/null 2>&1 & done; fi")
+
+APT_INSTALL = "DEBIAN_FRONTEND=noninteractive apt-get install -y"
+
+# provisioning modules for compose()
+#
+# packages: installed from the Ubuntu archive, repos: commands adding apt repositories, repo_packages: installed from
+# these repositories, commands: run after all packages are installed, write_files: like cloud-config, crontab: @reboot
+# commands appended to /etc/crontab
+MODULES = {
+    "base": {
+        "packages": ["update-notifier-common", "unattended-upgrades", "landscape-common"],
+    },
+    "driver-535": {
+        "packages": ["nvidia-driver-535", "nvidia-dkms-535"],
+    },
+    "driver-580": {
+        "packages": ["nvidia-driver-580"],
+    },
+    "docker": {
+        "packages": ["docker.io"],
+    },
+    "docker-ce": {
+        "packages": ["ca-certificates", "curl", "gnupg2"],
+        "repos": [
+            "install -m 0755 -d /etc/apt/keyrings",
+            "curl -fsSL https://download.docker.com/linux/ubuntu/gpg -o /etc/apt/keyrings/docker.asc",
+            "chmod a+r /etc/apt/keyrings/docker.asc",
+            "echo \"deb [arch=$(dpkg --print-architecture) signed-by=/etc/apt/keyrings/docker.asc] "
+            "https://download.docker.com/linux/ubuntu $(. /etc/os-release && echo ${UBUNTU_CODENAME:-$VERSION_CODENAME}) "
+            "stable\" > /etc/apt/sources.list.d/docker.list",
+        ],
+        "repo_packages": ["docker-ce", "docker-ce-cli", "containerd.io", "docker-buildx-plugin", "docker-compose-plugin"],
+    },
+    "container-toolkit": {
+        "packages": ["curl", "gnupg2"],
+        "repos": [
+            "curl -fsSL https://nvidia.github.io/libnvidia-container/gpgkey | gpg --dearmor -o /usr/share/keyrings/nvidia-container-toolkit-keyring.gpg",
+            "curl -s -L https://nvidia.github.io/libnvidia-container/stable/deb/nvidia-container-toolkit.list | sed 's#deb https://#deb [signed-by=/usr/share/keyrings/nvidia-container-toolkit-keyring.gpg] https://#g' > /etc/apt/sources.list.d/nvidia-container-toolkit.list",
+        ],
+        "repo_packages": ["nvidia-container-toolkit"],
+        "commands": ["nvidia-ctk runtime configure --runtime=docker", "systemctl restart docker"],
+    },
+    "gpu-burn": {
+        "commands": [
+            "git clone https://github.com/wilicc/gpu-burn /home/ubuntu/gpu-burn",
+            "cd /home/ubuntu/gpu-burn && sed -i 's/60/<duration> <parameter>/g' Dockerfile && docker build -t gpu_burn .",
+        ],
+        "crontab": ["sleep 40 && chdir /home/ubuntu/gpu-burn && docker build -t gpu_burn . && docker run --rm --gpus all gpu_burn >> \"gpu-burn-results_$(date +'\\%Y-\\%m-\\%d_\\%H-\\%M-\\%S').log\""],
+    },
+    "ollama": {
+        "crontab": ["sleep 20 && docker volume create ollama && (docker start ollama || docker run -d -v ollama:/root/.ollama -p 11434:11434 --name ollama --restart=unless-stopped --gpus all ollama/ollama)"],
+    },
+}
+
+
+
+###########################
+#
+# Code
+#
+###########################
+
+def add_userdata_arguments(parser):
+    # --apt-proxy, --apt-mirror, --docker-mirror, --telemetry and --optimize-userdata options of the start scripts
+    parser.add_argument("--apt-proxy", default=APT_PROXY,
+                        help="apt proxy used during provisioning, e.g., http://cache:3142 (default: $GPUAAS_APT_PROXY)")
+    parser.add_argument("--apt-mirror", default=APT_MIRROR,
+                        help="Ubuntu mirror used instead of archive.ubuntu.com (default: $GPUAAS_APT_MIRROR)")
+    parser.add_argument("--docker-mirror", default=DOCKER_MIRROR,
+                        help="Docker Hub registry mirror, e.g., http://cache:5000 (default: $GPUAAS_DOCKER_MIRROR)")
+    parser.add_argument("--telemetry", action="store_true",
+                        help="sample GPU utilization, clocks, power and temperature inside the instance, see "
+                             "collect-gpu-telemetry.py")
+    parser.add_argument("--optimize-userdata", action="store_true",
+                        help="remove redundant apt-get update/upgrade steps, merge package installs, only reboot if "
+                             "required and gzip USERDATA")
+
+
+def is_cloud_config(userdata):
+    return userdata.lstrip().startswith("#cloud-config")
+
+
+def _indent(text, prefix):
+    return "".join(prefix + line for line in text.splitlines(True))
+
+
+def inject_package_cache(userdata, apt_proxy=None, apt_mirror=None, docker_mirror=None):
+    # userdata using the apt proxy/mirror and Docker registry mirror (all optional)
+    if not (apt_proxy or apt_mirror or docker_mirror):
+        return userdata
+    docker_config = json.dumps({"registry-mirrors": [docker_mirror]}) + "\n" if docker_mirror else None
+
+    if not is_cloud_config(userdata):
+        # shell script, configure everything before the first command
+        shebang, _, script = userdata.partition("\n") if userdata.startswith("#!") else ("#!/bin/sh", "", userdata)
+        lines = []
+        if apt_proxy:
+            lines.append("echo 'Acquire::http::Proxy \"%s\";' > %s" % (apt_proxy, APT_PROXY_CONFIG))
+        if apt_mirror:
+            lines.append("sed -i -E 's#https?://(archive|security|[a-z]+\\.archive)\\.ubuntu\\.com/ubuntu/?#%s#' "
+                         "/etc/apt/sources.list /etc/apt/sources.list.d/*.sources 2>/dev/null" % apt_mirror.rstrip("/"))
+        if docker_config:
+            lines.append("mkdir -p /etc/docker && echo '%s' > %s" % (docker_config.strip(), DOCKER_DAEMON_CONFIG))
+        return "%s\n%s\n%s" % (shebang, "\n".join(lines), script)
+
+    if "\napt:" in userdata:
+        raise ValueError("USERDATA already has an apt configuration, add the proxy/mirror there")
+    apt = ""
+    if apt_proxy:
+        apt += "  http_proxy: %s\n" % apt_proxy
+    if apt_mirror:
+        apt += "".join("  %s:\n    - arches: [default]\n      uri: %s\n" % (key, apt_mirror) for key in ("primary", "security"))
+    if apt:
+        userdata = userdata.rstrip("\n") + "\napt:\n" + apt
+
+    if docker_config:
+        # written before packages are installed, Docker is started with the mirror configured (nvidia-ctk keeps it)
+        entry = "  - path: %s\n    content: |\n%s" % (DOCKER_DAEMON_CONFIG, _indent(docker_config, "      "))
+        if "\nwrite_files:\n" in userdata:
+            userdata = userdata.replace("\nwrite_files:\n", "\nwrite_files:\n" + entry, 1)
+        else:
+            userdata = userdata.rstrip("\n") + "\nwrite_files:\n" + entry
+    return userdata
+
+
+def compose(modules, sentinel=SENTINEL_FILE, upgrade=True, replacements=None):
+    # cloud-config USERDATA provisioning the modules (names of MODULES or dicts like them), placeholders like
+    # "<duration>" in module commands are replaced using replacements
+    def unique(items):
+        return list(dict.fromkeys(items))
+
+    modules = [MODULES[m] if isinstance(m, str) else m for m in modules]
+    packages = unique(p for m in modules for p in m.get("packages", []))
+    repos = unique(c for m in modules for c in m.get("repos", []))
+    repo_packages = unique(p for m in modules for p in m.get("repo_packages", []))
+    crontab = [job for m in modules for job in m.get("crontab", [])]
+
+    runcmd = list(repos)
+    if repos:
+        runcmd.append("apt-get update")
+    if repo_packages:
+        runcmd.append("%s %s" % (APT_INSTALL, " ".join(repo_packages)))
+    runcmd += [c for m in modules for c in m.get("commands", [])]
+    runcmd += ["touch %s" % sentinel, CONDITIONAL_REBOOT]
+
+    config = {"package_update": True, "package_upgrade": upgrade}
+    if packages:
+        config["packages"] = packages
+    write_files = [f for m in modules for f in m.get("write_files", [])]
+    if crontab:
+        write_files.append({"path": "/etc/crontab", "append": True,
+                            "content": "".join("@reboot root %s\n" % job for job in crontab)})
+    if write_files:
+        config["write_files"] = write_files
+    config["runcmd"] = runcmd
+
+    userdata = dump(config)
+    for placeholder, value in (replacements or {}).items():
+        userdata = userdata.replace(placeholder, value)
+    return userdata
+
+
+def dump(config):
+    # yaml is imported here and in optimize() only, so scripts not composing USERDATA start faster
+    import yaml
+
+    class Dumper(yaml.SafeDumper):
+        pass
+
+    # multi-line strings (e.g., write_files content) as literal blocks like in the start scripts
+    Dumper.add_representer(str, lambda dumper, data: dumper.represent_scalar(
+      "tag:yaml.org,2002:str", data, style="|" if "\n" in data else None))
+    return "#cloud-config\n" + yaml.dump(config, Dumper=Dumper, sort_keys=False, default_flow_style=False,
+                                         width=2 ** 16)
+
+
+# classification of runcmd commands for optimize()
+APT_UPDATE_RE = re.compile(r"^(sudo )?apt(-get)? (-\S+ )*update( -\S+)*$")
+APT_UPGRADE_RE = re.compile(r"^(sudo )?(DEBIAN_FRONTEND=noninteractive )?apt(-get)? (-\S+ )*(dist-)?upgrade( -\S+)*$")
+APT_INSTALL_RE = re.compile(r"^(sudo )?(DEBIAN_FRONTEND=noninteractive )?apt(-get)? (?P<args>(-\S+ )*install( \S+)+)$")
+APT_REPO_RE = re.compile(r"sources\.list|apt-key|add-apt-repository|keyrings/")
+
+
+def _install_args(command):
+    # (options, packages) of a plain "apt-get install" command, None for other commands (e.g., with versions pinned
+    # using shell variables)
+    m = APT_INSTALL_RE.match(command.strip())
+    if not m or "$" in command or ";" in command or "&" in command or "|" in command:
+        return None
+    words = m.group("args").split()
+    options = tuple(sorted(set(w for w in words if w.startswith("-")) - {"-y", "--yes"}))
+    return options, [w for w in words if not w.startswith("-") and w != "install"]
+
+
+def optimize(userdata):
+    # optimized cloud-config USERDATA and a report of the changed steps, other USERDATA is returned unchanged
+    if not is_cloud_config(userdata):
+        return userdata, []
+    import yaml
+
+    config = yaml.safe_load(userdata)
+    report = []
+    packages = list(config.get("packages") or [])
+
+    # package_update/package_upgrade (and packages) run before runcmd
+    updated = bool(config.get("package_update") or config.get("package_upgrade") or packages)
+    upgraded = bool(config.get("package_upgrade"))
+    repos_changed = False
+    only_apt = True
+    runcmd = []
+    for command in config.get("runcmd") or []:
+        if not isinstance(command, str):
+            runcmd.append(command)
+            only_apt = False
+            continue
+        stripped = command.strip()
+        install = _install_args(stripped)
+
+        if APT_UPDATE_RE.match(stripped):
+            if updated and not repos_changed:
+                report.append("removed redundant '%s'" % stripped)
+                continue
+            updated, repos_changed = True, False
+        elif APT_UPGRADE_RE.match(stripped):
+            if upgraded:
+                report.append("removed redundant '%s' (package_upgrade)" % stripped)
+                continue
+            upgraded = True
+        elif install and only_apt and not install[0]:
+            # nothing but apt-get update/upgrade before, install it with the packages in one transaction
+            packages += [p for p in install[1] if p not in packages]
+            report.append("moved '%s' into packages" % stripped)
+            continue
+        elif install and runcmd and isinstance(runcmd[-1], str) and _install_args(runcmd[-1]) \
+                and _install_args(runcmd[-1])[0] == install[0]:
+            previous = runcmd.pop()
+            options, merged = _install_args(previous)
+            merged += [p for p in install[1] if p not in merged]
+            command = "%s %s" % (" ".join((APT_INSTALL,) + options), " ".join(merged))
+            report.append("merged '%s' into '%s'" % (stripped, previous.strip()))
+        else:
+            if APT_REPO_RE.search(stripped):
+                repos_changed = True
+            only_apt = False
+        runcmd.append(command)
+
+    if runcmd and isinstance(runcmd[-1], str) and runcmd[-1].strip() == "reboot":
+        runcmd[-1] = CONDITIONAL_REBOOT
+        report.append("reboot only if required (packages or NVIDIA driver), otherwise run the @reboot jobs directly")
+
+    if packages:
+        config["packages"] = packages
+    config["runcmd"] = runcmd
+    return dump(config), report
+
+
+def prepare(userdata, args):
+    # USERDATA according to the add_userdata_arguments() options, prints the optimize() report
+    if args.telemetry:
+        userdata = gpuaas_telemetry.inject(userdata)
+    userdata = inject_package_cache(userdata, args.apt_proxy, args.apt_mirror, args.docker_mirror)
+    if args.optimize_userdata:
+        size = len(userdata)
+        userdata, report = optimize(userdata)
+        for line in report:
+            print("USERDATA: %s" % line)
+        print("USERDATA: %d bytes optimized to %d bytes, %d bytes gzip compressed" % (
+          size, len(userdata), len(compress(userdata))))
+    return userdata
+
+
+def compress(userdata):
+    # gzip compressed USERDATA (bytes, deterministic), cloud-init decompresses it
+    return gzip.compress(userdata.encode() if isinstance(userdata, str) else userdata, mtime=0)
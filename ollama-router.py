@@ -0,0 +1,189 @@
+#!/usr/bin/python3
+
+# load balancing router for one Ollama container per GPU, see start-nvidia-ollama-mutligpu-openstack-instance.py
+#
+# Listens on the Ollama port (11434) and forwards every request to the backend (Ollama instance pinned to one GPU)
+# with the least outstanding requests. Connections to the backends are kept alive and pooled, so forwarding a
+# request does not need a new TCP connection. Streamed answers (chunked ndjson) are passed through as they arrive.
+# Backends refusing connections or sending malformed answers are skipped for a few seconds. GET /router/status
+# returns the state of the backends.
+#
+# Only uses the standard library (python3 of the Ubuntu cloud image), e.g.:
+#
+#   ollama-router.py --port 11434 127.0.0.1:11435 127.0.0.1:11436
+#
+# The router only listens on localhost unless another address is given using --host, e.g., --host 0.0.0.0.
+
+import argparse
+import http.client
+import http.server
+import json
+import threading
+import time
+
+parser = argparse.ArgumentParser(description="least outstanding requests router for multiple Ollama instances")
+parser.add_argument("backends", metavar="host:port", nargs="+", help="Ollama backends")
+parser.add_argument("--host", default="127.0.0.1",
+                    help="address to listen on, 0.0.0.0 exposes the router to the network (default: %(default)s)")
+parser.add_argument("--port", type=int, default=11434, help="port to listen on (default: %(default)s)")
+parser.add_argument("--timeout", type=int, default=600, help="backend timeout in seconds (default: %(default)s)")
+parser.add_argument("--pool-size", type=int, default=16,
+                    help="max. idle keep-alive connections per backend (default: %(default)s)")
+args = parser.parse_args()
+
+# backends refusing connections are not used for this many seconds
+BACKEND_DOWN_SECONDS = 5
+
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "proxy-connection", "transfer-encoding", "te", "trailer", "upgrade"}
+
+
+class Backend:
+
+    def __init__(self, address):
+        host, _, port = address.rpartition(":")
+        self.host, self.port = host or "127.0.0.1", int(port)
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.down_until = 0
+        self.idle = []
+
+    def connection(self):
+        # pooled keep-alive connection or a new one, returns (connection, reused)
+        with lock:
+            if self.idle:
+                return self.idle.pop(), True
+        return http.client.HTTPConnection(self.host, self.port, timeout=args.timeout), False
+
+    def release(self, connection, reusable):
+        with lock:
+            if reusable and len(self.idle) < args.pool_size:
+                self.idle.append(connection)
+                return
+        connection.close()
+
+    def status(self):
+        return {"backend": "%s:%d" % (self.host, self.port), "outstanding": self.outstanding,
+                "requests": self.requests, "errors": self.errors, "idle_connections": len(self.idle),
+                "up": self.down_until <= time.monotonic()}
+
+
+backends = [Backend(address) for address in args.backends]
+lock = threading.Lock()
+
+
+def choose(excluded):
+    # backend with the least outstanding requests (then the least requests so far), backends that are down are only
+    # used if all are down
+    with lock:
+        candidates = [b for b in backends if b not in excluded]
+        up = [b for b in candidates if b.down_until <= time.monotonic()]
+        if not (up or candidates):
+            return None
+        backend = min(up or candidates, key=lambda b: (b.outstanding, b.requests))
+        backend.outstanding += 1
+        backend.requests += 1
+        return backend
+
+
+class RouterHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *log_args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def forward(self, backend, body, headers):
+        # send the request to backend, a stale pooled connection is replaced by a new one once
+        while True:
+            connection, reused = backend.connection()
+            try:
+                connection.request(self.command, self.path, body, headers)
+                return connection, connection.getresponse()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                connection.close()
+                if not reused:
+                    raise
+            except Exception:
+                connection.close()
+                raise
+
+    def proxy(self):
+        if self.path == "/router/status":
+            self.send_json(200, [b.status() for b in backends])
+            return
+
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0) or 0)) or None
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+
+        tried = []
+        while True:
+            backend = choose(tried)
+            if backend is None:
+                self.send_json(502, {"error": "no Ollama backend available"})
+                return
+            tried.append(backend)
+            forwarded = False
+            try:
+                connection, response = self.forward(backend, body, headers)
+                forwarded = True
+                break
+            except (OSError, http.client.HTTPException):
+                # connection errors and malformed answers (e.g., BadStatusLine), the next backend is tried or the
+                # client gets a 502
+                with lock:
+                    backend.errors += 1
+                    backend.down_until = time.monotonic() + BACKEND_DOWN_SECONDS
+            finally:
+                if not forwarded:
+                    with lock:
+                        backend.outstanding -= 1
+
+        reusable = False
+        try:
+            self.send_response(response.status, response.reason)
+            for k, v in response.getheaders():
+                if k.lower() not in HOP_BY_HOP_HEADERS and k.lower() != "content-length":
+                    self.send_header(k, v)
+            length = response.getheader("Content-Length")
+            if length is not None:
+                self.send_header("Content-Length", length)
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(response.read())
+            else:
+                # streamed answer, passed through chunk by chunk
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                while True:
+                    data = response.read1(65536)
+                    if not data:
+                        break
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+            reusable = not response.will_close
+        finally:
+            if not reusable:
+                response.close()
+            backend.release(connection, reusable)
+            with lock:
+                backend.outstanding -= 1
+
+    do_GET = do_POST = do_DELETE = do_HEAD = do_PUT = proxy
+
+
+server = http.server.ThreadingHTTPServer((args.host, args.port), RouterHandler)
+server.daemon_threads = True
+print("Ollama router listening on %s:%d, backends: %s" % (args.host, args.port, ", ".join(args.backends)), flush=True)
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    pass
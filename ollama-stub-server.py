@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+
+# minimal Ollama compatible stub server to try benchmark-ollama.py (and the Ollama router) without GPUs
+#
+# Implements /api/generate and /api/chat (streamed and non-streamed), /api/tags, /api/ps and /api/version. Answers
+# are generated with a configurable time to first token and token rate, e.g.:
+#
+#   ollama-stub-server.py --port 11434 --ttft 0.2 --tokens-per-second 40 --tokens 64
+#   benchmark-ollama.py localhost:11434 --concurrency 1,4,8
+
+import argparse
+import http.server
+import json
+import threading
+import time
+
+parser = argparse.ArgumentParser(description="Ollama compatible stub server")
+parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: %(default)s)")
+parser.add_argument("--port", type=int, default=11434, help="port to listen on (default: %(default)s)")
+parser.add_argument("--ttft", type=float, default=0.1, help="seconds until the first token (default: %(default)s)")
+parser.add_argument("--tokens-per-second", type=float, default=50, help="generation speed (default: %(default)s)")
+parser.add_argument("--tokens", type=int, default=32,
+                    help="tokens per answer if the request has no num_predict option (default: %(default)s)")
+parser.add_argument("--parallel", type=int, default=1,
+                    help="requests generated at the same time, like OLLAMA_NUM_PARALLEL, others queue (default: %(default)s)")
+parser.add_argument("--models", default="llama3.2:1b", help="comma separated list of available models (default: %(default)s)")
+args = parser.parse_args()
+
+MODELS = args.models.split(",")
+slots = threading.BoundedSemaphore(args.parallel)
+
+
+class OllamaStubHandler(http.server.BaseHTTPRequestHandler):
+    # HTTP/1.1 for keep-alive connections and chunked streaming responses
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *log_args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_chunk(self, body):
+        data = json.dumps(body).encode() + b"\n"
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/version":
+            self.send_json(200, {"version": "0.0.0-stub"})
+        elif self.path in ("/api/tags", "/api/ps"):
+            self.send_json(200, {"models": [{"name": m, "model": m} for m in MODELS]})
+        elif self.path == "/":
+            self.send_json(200, "Ollama is running")
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path not in ("/api/generate", "/api/chat"):
+            self.send_json(404, {"error": "not found"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError:
+            self.send_json(400, {"error": "invalid JSON"})
+            return
+        model = request.get("model")
+        if model not in MODELS:
+            self.send_json(404, {"error": "model '%s' not found" % model})
+            return
+
+        chat = self.path == "/api/chat"
+        stream = request.get("stream", True)
+        tokens = int((request.get("options") or {}).get("num_predict", args.tokens))
+        prompt = request.get("prompt") or " ".join(m.get("content", "") for m in request.get("messages", []))
+
+        def message(text, done):
+            body = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "done": done}
+            if chat:
+                body["message"] = {"role": "assistant", "content": text}
+            else:
+                body["response"] = text
+            return body
+
+        with slots:
+            start = time.monotonic()
+            if stream:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+            time.sleep(args.ttft)
+            eval_start = time.monotonic()
+            for i in range(tokens):
+                if i:
+                    time.sleep(1 / args.tokens_per_second)
+                if stream:
+                    self.send_chunk(message("tok%d " % i, False))
+            eval_duration = time.monotonic() - eval_start
+
+        final = message("" if stream else " ".join("tok%d" % i for i in range(tokens)), True)
+        final.update({
+            "done_reason": "stop",
+            "total_duration": int((time.monotonic() - start) * 1e9),
+            "load_duration": 0,
+            "prompt_eval_count": len(prompt.split()),
+            "prompt_eval_duration": int(args.ttft * 1e9),
+            "eval_count": tokens,
+            "eval_duration": int(eval_duration * 1e9),
+        })
+        if stream:
+            self.send_chunk(final)
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.send_json(200, final)
+
+
+server = http.server.ThreadingHTTPServer((args.host, args.port), OllamaStubHandler)
+print("Ollama stub server listening on %s:%d" % (args.host, args.port))
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    pass
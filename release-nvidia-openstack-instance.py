@@ -0,0 +1,49 @@
+#!/usr/bin/python3
+
+# release instances started with --pool <name> back into their warm pool by shelving them instead of deleting them
+# (see gpuaas_pool.py). The next start using the same pool, USERDATA and flavor unshelves them, which is much faster
+# than booting and provisioning a new instance.
+
+import argparse
+import sys
+
+import gpuaas_auth
+import gpuaas_pool
+
+parser = argparse.ArgumentParser(description="shelve instances back into their warm pool")
+parser.add_argument("instance_names", metavar="instance-name", nargs="*")
+parser.add_argument("--list", metavar="POOL", help="list the members of a warm pool")
+args = parser.parse_args()
+
+if not args.instance_names and not args.list:
+    parser.error("instance-name or --list required")
+
+# Initialize and turn on debug logging
+#openstack.enable_logging(debug=True)
+
+# Initialize connection
+# a cached Keystone token is reused if possible, see gpuaas_auth.py
+conn = gpuaas_auth.connect(cloud='openstack')
+
+if args.list:
+    for server in gpuaas_pool.pool_members(conn, args.list):
+        print("%-30s %-20s %-20s %s" % (server.name, server.status, gpuaas_pool.flavor_name(server), server.id))
+
+failed = False
+for name in args.instance_names:
+    server = conn.get_server(name)
+    if server is None:
+        print("[%s] not found" % name)
+        failed = True
+        continue
+    try:
+        if gpuaas_pool.release(conn, server):
+            print("[%s] shelving into warm pool %s" % (name, server.metadata[gpuaas_pool.POOL_METADATA_KEY]))
+        else:
+            print("[%s] already shelved" % name)
+    except Exception as e:
+        print("[%s] %s" % (name, e))
+        failed = True
+
+if failed:
+    sys.exit(1)
@@ -1,19 +1,71 @@
 #!/usr/bin/python3
 
-import openstack
-import os
+# terminate instances in the OpenStack environment of NetLab - Hochschule Fulda
+#
+# Instances can be selected by name (glob patterns like "node-*" allowed), name prefix or metadata tag, e.g.:
+#
+#   terminate-nvidia-openstack-instance.py node-1 node-2
+#   terminate-nvidia-openstack-instance.py --prefix node- --wait
+#   terminate-nvidia-openstack-instance.py --tag gpuaas_pool=ollama --release-ips
+#
+# All selected instances are deleted concurrently. Their floating IPs are returned to the floating IP pool of the
+# start scripts (see gpuaas_fip.py) or, using --release-ips, deleted. Using --wait the script watches the instances
+# (one server list call per interval, see gpuaas_fleet.py) until all of them are gone, i.e., their GPUs are free
+# again for the next start.
+
+import argparse
 import sys
 
-if len(sys.argv) < 2:
-    print("usage: %s <instance-name>" % sys.argv[0])
-    exit(-1)
+import gpuaas_auth
+import gpuaas_fleet
+
+parser = argparse.ArgumentParser(description="terminate instances selected by name, prefix, pattern or metadata tag")
+parser.add_argument("instance_names", metavar="instance-name", nargs="*", help="instance name or glob pattern")
+parser.add_argument("--prefix", help="terminate all instances whose name starts with PREFIX")
+parser.add_argument("--match", help="terminate all instances whose name matches this glob pattern")
+parser.add_argument("--tag", action="append", default=[],
+                    help="only terminate instances with this metadata (key=value or key, can be given multiple times)")
+parser.add_argument("--release-ips", action="store_true",
+                    help="delete the floating IPs of the instances instead of returning them to the floating IP pool")
+parser.add_argument("--wait", action="store_true", help="wait until all instances are deleted")
+parser.add_argument("--dry-run", action="store_true", help="only print the selected instances")
+parser.add_argument("--max-workers", type=int, default=gpuaas_fleet.MAX_WORKERS,
+                    help="max. number of instances deleted concurrently (default: %(default)s)")
+args = parser.parse_args()
 
-INSTANCE_NAME = sys.argv[1]
+if not (args.instance_names or args.prefix or args.match or args.tag):
+    parser.error("select instances by instance-name, --prefix, --match or --tag")
 
 # Initialize and turn on debug logging
 #openstack.enable_logging(debug=True)
 
 # Initialize connection
-conn = openstack.connect(cloud='openstack')
+# a cached Keystone token is reused if possible, see gpuaas_auth.py
+conn = gpuaas_auth.connect(cloud='openstack')
+
+servers = gpuaas_fleet.select_servers(conn, args.instance_names, args.prefix, args.match, args.tag)
+if not servers:
+    print("No matching instances found")
+    sys.exit(1)
+
+for server in servers:
+    print("%-30s %-20s %s" % (server.name, server.status, server.id))
+if args.dry_run:
+    sys.exit(0)
+
+errors = gpuaas_fleet.delete_servers(conn, servers, args.max_workers, delete_ips=args.release_ips)
+failed = any(errors.values())
+
+if args.wait:
+    # no status ends the watching, only the servers vanishing from the server list
+    names = {server.id: server.name for server in servers if not errors[server.id]}
+    try:
+        for server, old, new in gpuaas_fleet.watch_servers(conn, names, until=()):
+            print("[%s] %s -> %s" % (names[server.id], old or "-", new))
+        print("\nAll %d instances deleted" % len(names))
+    except TimeoutError as e:
+        print(e)
+        failed = True
 
-conn.delete_server(INSTANCE_NAME)
+if failed:
+    sys.exit(1)